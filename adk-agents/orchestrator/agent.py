@@ -9,50 +9,30 @@ import sys
 from google.adk.agents import Agent
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../..'))
 from tools.communicate_with_human import make_communicate_with_human_tool
-from tools.find_customer import find_customer
-from tools.check_invoice_status import check_invoice_status
-from tools.process_billing import process_billing
-
-
-# --- Prompts ---
-def _load_prompt(filename):
-    """Helper to load prompts from the shared prompts directory."""
-    prompt_path = os.path.join(os.path.dirname(__file__), f"../../prompts/{filename}")
-    with open(prompt_path, "r", encoding="utf-8") as f:
-        return f.read()
-
-
-orchestrator_prompt = _load_prompt("orchestrator_system_prompt.md")
-field_service_prompt = _load_prompt("field_service_system_prompt.md")
-office_prompt = _load_prompt("office_system_prompt.md")
+from shared.agent_config import get_agent_spec
 
 # --- Specialist Agents Definition ---
 
 # Define agents directly in this file for a simplified, in-process architecture.
 # This is ideal for demos and tightly-coupled systems.
+# Model, description, prompt and tools come from the registry shared with the gemini-agents services.
 
+field_service_spec = get_agent_spec("field_service")
 field_service_agent = Agent(
-    name="field_service_agent",
-    model="gemini-2.5-flash",
-    description=(
-        "Specialist agent for handling field service technician interactions. "
-        "Can look up customer information, check invoice statuses, and assist "
-        "technicians with job-related queries."
-    ),
-    instruction=field_service_prompt,
-    tools=[find_customer, check_invoice_status],
+    name=field_service_spec.name,
+    model=field_service_spec.model,
+    description=field_service_spec.description,
+    instruction=field_service_spec.instruction,
+    tools=field_service_spec.tools,
 )
 
+office_spec = get_agent_spec("office")
 office_agent = Agent(
-    name="office_agent",
-    model="gemini-2.5-flash",
-    description=(
-        "Specialist agent for handling office and billing operations. "
-        "Processes billing rules, validates contracts, and manages goodwill approvals "
-        "according to company policies."
-    ),
-    instruction=office_prompt,
-    tools=[process_billing],
+    name=office_spec.name,
+    model=office_spec.model,
+    description=office_spec.description,
+    instruction=office_spec.instruction,
+    tools=office_spec.tools,
 )
 
 # --- Orchestrator Agent Definition ---
@@ -60,14 +40,13 @@ office_agent = Agent(
 # Create the orchestrator agent with instructions, tools, and sub-agents.
 # This is the root_agent that ADK will run.
 
+orchestrator_spec = get_agent_spec("orchestrator")
 root_agent = Agent(
-    name="orchestrator",
-    model="gemini-2.5-flash",
-    description=(
-        "Main orchestrator agent that coordinates between field service and office operations. "
-        "Routes user requests to the appropriate specialist agent based on the nature of the task."
-    ),
-    instruction=orchestrator_prompt,
+    name=orchestrator_spec.name,
+    model=orchestrator_spec.model,
+    description=orchestrator_spec.description,
+    instruction=orchestrator_spec.instruction,
+    # Sub-agents run in-process here instead of behind the HTTP agent tools
     sub_agents=[field_service_agent, office_agent],
     tools=[make_communicate_with_human_tool(None)],
 )
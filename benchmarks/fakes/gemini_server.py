@@ -0,0 +1,199 @@
+"""
+Local stand-in for the Gemini API used by the load-test harness.
+
+Implements just enough of the REST surface used by google-genai:
+generateContent, streamGenerateContent (SSE), resumable file upload and file delete.
+Latency and output length are drawn from configurable distributions, and when a
+request declares tools the fake can answer with a function call so that the
+orchestrator -> agent -> tool paths are exercised.
+"""
+import asyncio
+import json
+import math
+import random
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from benchmarks.stats import StageStats
+
+_WORDS = ("pipe", "valve", "customer", "invoice", "job", "done", "water", "heater",
+          "replaced", "checked", "billing", "hours", "materials", "the", "and", "a")
+
+
+@dataclass
+class FakeGeminiConfig:
+    """Latency/token distributions for the fake model."""
+    # Time to first token, lognormal around the median
+    ttft_median_ms: float = 400.0
+    ttft_sigma: float = 0.5
+    # Per output token generation time
+    per_token_ms: float = 4.0
+    # Output length, normal distribution clipped at 1
+    output_tokens_mean: float = 60.0
+    output_tokens_stddev: float = 20.0
+    # Probability of answering a fresh user turn with a function call when tools are declared
+    tool_call_rate: float = 0.5
+    # Function calls per tool-calling response, drawn uniformly from 1..max (parallel function calling)
+    max_function_calls: int = 1
+    # Candidate values for specific tool arguments, by parameter name
+    arg_values: Dict[str, List] = field(default_factory=lambda: {
+        "recipient_role": ["technician", "office"],
+    })
+    seed: Optional[int] = None
+
+
+class FakeGemini:
+    """FastAPI app emulating the Gemini REST API."""
+
+    def __init__(self, config: FakeGeminiConfig, stats: StageStats):
+        self.config = config
+        self.stats = stats
+        self.random = random.Random(config.seed)
+        self.uploads: Dict[str, Dict] = {}
+        self.app = FastAPI(title="Fake Gemini")
+        self._setup_routes()
+
+    def _setup_routes(self):
+        self.app.post("/{api_version}/models/{model_action}")(self.models_action)
+        self.app.post("/upload/{api_version}/files")(self.start_upload)
+        self.app.post("/upload/session/{upload_id}")(self.finish_upload)
+        self.app.delete("/{api_version}/files/{file_id}")(self.delete_file)
+
+    async def models_action(self, api_version: str, model_action: str, request: Request):
+        model, _, action = model_action.partition(":")
+        body = await request.json()
+        started = time.perf_counter()
+        response = self._build_response(model, body)
+        tokens = response["usageMetadata"]["candidatesTokenCount"]
+
+        await asyncio.sleep(self._ttft_seconds())
+        if action == "streamGenerateContent":
+            return StreamingResponse(
+                self._stream(response, tokens, started),
+                media_type="text/event-stream"
+            )
+
+        await asyncio.sleep(tokens * self.config.per_token_ms / 1000)
+        self.stats.record("gemini", time.perf_counter() - started)
+        return JSONResponse(response)
+
+    async def _stream(self, response: Dict, tokens: int, started: float):
+        parts = response["candidates"][0]["content"]["parts"]
+        text = parts[0].get("text")
+        if text is None:
+            # Function calls are delivered in a single chunk
+            yield f"data: {json.dumps(response)}\r\n\r\n"
+        else:
+            words = text.split(" ")
+            chunk_size = max(1, len(words) // 4)
+            for i in range(0, len(words), chunk_size):
+                await asyncio.sleep(chunk_size * self.config.per_token_ms / 1000)
+                chunk = json.loads(json.dumps(response))
+                chunk["candidates"][0]["content"]["parts"] = [{"text": " ".join(words[i:i + chunk_size]) + " "}]
+                yield f"data: {json.dumps(chunk)}\r\n\r\n"
+        self.stats.record("gemini", time.perf_counter() - started)
+
+    def _ttft_seconds(self) -> float:
+        cfg = self.config
+        return cfg.ttft_median_ms * math.exp(cfg.ttft_sigma * self.random.gauss(0, 1)) / 1000
+
+    def _build_response(self, model: str, body: Dict) -> Dict:
+        prompt_tokens = max(1, len(json.dumps(body)) // 4)
+        function_calls = self._maybe_function_calls(body)
+        if function_calls:
+            parts = [{"functionCall": function_call} for function_call in function_calls]
+            output_tokens = 10 * len(function_calls)
+        else:
+            output_tokens = max(1, int(self.random.gauss(self.config.output_tokens_mean,
+                                                         self.config.output_tokens_stddev)))
+            parts = [{"text": " ".join(self.random.choice(_WORDS) for _ in range(output_tokens))}]
+
+        return {
+            "candidates": [{
+                "content": {"role": "model", "parts": parts},
+                "finishReason": "STOP",
+                "index": 0
+            }],
+            "usageMetadata": {
+                "promptTokenCount": prompt_tokens,
+                "candidatesTokenCount": output_tokens,
+                "totalTokenCount": prompt_tokens + output_tokens
+            },
+            "modelVersion": model
+        }
+
+    def _maybe_function_calls(self, body: Dict) -> Optional[List[Dict]]:
+        declarations = [
+            declaration
+            for tool in body.get("tools", [])
+            for declaration in tool.get("functionDeclarations", [])
+        ]
+        contents = body.get("contents", [])
+        if not declarations or not contents:
+            return None
+
+        # Only fresh user turns trigger a call; answer function responses with text
+        last_parts = contents[-1].get("parts", [])
+        if any("functionResponse" in part for part in last_parts):
+            return None
+        if self.random.random() >= self.config.tool_call_rate:
+            return None
+
+        count = self.random.randint(1, max(1, self.config.max_function_calls))
+        return [self._fake_call(self.random.choice(declarations)) for _ in range(count)]
+
+    def _fake_call(self, declaration: Dict) -> Dict:
+        schema = (
+            declaration.get("parameters")
+            or declaration.get("parametersJsonSchema")
+            or declaration.get("parameters_json_schema")
+            or {}
+        )
+        args = {
+            name: self._fake_value(name, prop)
+            for name, prop in schema.get("properties", {}).items()
+        }
+        return {"name": declaration["name"], "args": args}
+
+    def _fake_value(self, name: str, prop: Dict):
+        if name in self.config.arg_values:
+            return self.random.choice(self.config.arg_values[name])
+        prop_type = str(prop.get("type", "string")).lower()
+        return {
+            "array": [],
+            "object": {},
+            "integer": 1,
+            "number": 1.0,
+            "boolean": True,
+        }.get(prop_type, f"benchmark {name}")
+
+    async def start_upload(self, api_version: str, request: Request):
+        upload_id = uuid.uuid4().hex
+        body = await request.json()
+        self.uploads[upload_id] = body.get("file", {})
+        upload_url = f"{request.base_url}upload/session/{upload_id}"
+        return JSONResponse({}, headers={"x-goog-upload-url": upload_url})
+
+    async def finish_upload(self, upload_id: str, request: Request):
+        started = time.perf_counter()
+        await request.body()
+        file_info = self.uploads.pop(upload_id, {})
+        name = f"files/{upload_id}"
+        self.stats.record("gemini_upload", time.perf_counter() - started)
+        return JSONResponse(
+            {"file": {
+                "name": name,
+                "uri": f"{request.base_url}v1beta/{name}",
+                "mimeType": file_info.get("mimeType", "application/octet-stream"),
+                "state": "ACTIVE"
+            }},
+            headers={"x-goog-upload-status": "final"}
+        )
+
+    async def delete_file(self, api_version: str, file_id: str):
+        return Response(content="{}", media_type="application/json")
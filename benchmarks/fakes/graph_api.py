@@ -0,0 +1,85 @@
+"""
+Local stand-in for the WhatsApp Cloud (Graph) API used by the load-test harness.
+
+Accepts message sends and read receipts, resolves media ids to download URLs on
+itself and serves synthetic media bytes, recording latency per operation.
+"""
+import asyncio
+import os
+import random
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import JSONResponse
+
+from benchmarks.stats import StageStats
+
+
+@dataclass
+class FakeGraphConfig:
+    """Latency and payload settings for the fake Graph API."""
+    send_latency_ms: float = 120.0
+    media_latency_ms: float = 80.0
+    # Uniform jitter applied to every latency, as a fraction of the base value
+    jitter: float = 0.3
+    media_size_bytes: int = 48_000
+    # Probability that a send is rejected with HTTP 500
+    send_error_rate: float = 0.0
+    seed: Optional[int] = None
+
+
+class FakeGraphApi:
+    """FastAPI app emulating the subset of the Graph API used by WhatsAppClient."""
+
+    def __init__(self, config: FakeGraphConfig, stats: StageStats):
+        self.config = config
+        self.stats = stats
+        self.random = random.Random(config.seed)
+        self.sent: List[Dict] = []
+        self.app = FastAPI(title="Fake Graph API")
+        self._setup_routes()
+
+    def _setup_routes(self):
+        self.app.get("/media/{media_id}")(self.download_media)
+        self.app.post("/{phone_number_id}/messages")(self.send_message)
+        self.app.get("/{media_id}")(self.get_media_url)
+
+    async def _delay(self, base_ms: float):
+        jitter = 1 + self.random.uniform(-self.config.jitter, self.config.jitter)
+        await asyncio.sleep(base_ms * jitter / 1000)
+
+    async def send_message(self, phone_number_id: str, request: Request):
+        started = time.perf_counter()
+        payload = await request.json()
+        await self._delay(self.config.send_latency_ms)
+
+        # Read receipts share the messages endpoint
+        stage = "graph_read" if payload.get("status") == "read" else "graph_send"
+        if stage == "graph_send" and self.random.random() < self.config.send_error_rate:
+            self.stats.record(stage, time.perf_counter() - started, error=True)
+            return JSONResponse({"error": {"message": "fake send failure"}}, status_code=500)
+
+        if stage == "graph_send":
+            self.sent.append(payload)
+        self.stats.record(stage, time.perf_counter() - started)
+        return {
+            "messaging_product": "whatsapp",
+            "contacts": [{"input": payload.get("to"), "wa_id": payload.get("to")}],
+            "messages": [{"id": f"wamid.{uuid.uuid4().hex}"}]
+        }
+
+    async def get_media_url(self, media_id: str, request: Request):
+        started = time.perf_counter()
+        await self._delay(self.config.media_latency_ms)
+        self.stats.record("graph_media_url", time.perf_counter() - started)
+        return {"url": f"{request.base_url}media/{media_id}", "id": media_id}
+
+    async def download_media(self, media_id: str):
+        started = time.perf_counter()
+        await self._delay(self.config.media_latency_ms)
+        content = os.urandom(self.config.media_size_bytes)
+        self.stats.record("graph_media_download", time.perf_counter() - started)
+        return Response(content=content, media_type="audio/ogg")
@@ -0,0 +1,241 @@
+"""
+In-memory stand-in for the Firestore client used by FirestoreHistory.
+
+Implements the collection/document/query/batch/get_all subset the history
+code relies on, with an optional simulated round-trip latency, so that the
+real persistence code runs during load tests without a Firebase project.
+"""
+import copy
+import itertools
+import operator
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from google.api_core.exceptions import AlreadyExists, FailedPrecondition, NotFound
+
+from benchmarks.stats import StageStats
+
+
+class MemorySnapshot:
+    def __init__(self, doc_id: str, data: Optional[Dict], update_time: Optional[int] = None):
+        self.id = doc_id
+        self._data = data
+        self.update_time = update_time
+
+    @property
+    def exists(self) -> bool:
+        return self._data is not None
+
+    def to_dict(self) -> Optional[Dict]:
+        return copy.deepcopy(self._data)
+
+
+class MemoryDocument:
+    def __init__(self, db: "MemoryFirestore", collection: str, doc_id: str):
+        self._db = db
+        self._collection = collection
+        self.id = doc_id
+
+    @property
+    def _key(self):
+        return self._collection, self.id
+
+    def get(self) -> MemorySnapshot:
+        with self._db.operation("firestore_get"):
+            return MemorySnapshot(
+                self.id,
+                self._db.documents(self._collection).get(self.id),
+                self._db.update_times.get(self._key)
+            )
+
+    def set(self, data: Dict) -> None:
+        with self._db.operation("firestore_set"):
+            self._set(data)
+
+    def create(self, data: Dict) -> None:
+        with self._db.operation("firestore_create"):
+            self._check_create()
+            self._set(data)
+
+    def update(self, data: Dict, option: Optional[Dict] = None) -> None:
+        with self._db.operation("firestore_update"):
+            self._check_update(option)
+            self._update(data)
+
+    def delete(self) -> None:
+        with self._db.operation("firestore_delete"):
+            self._db.documents(self._collection).pop(self.id, None)
+            self._db.update_times.pop(self._key, None)
+
+    # Checks and writes without locking, shared by single writes and batches (caller holds the lock)
+
+    def _check_create(self) -> None:
+        if self.id in self._db.documents(self._collection):
+            raise AlreadyExists(f"Document already exists: {self._collection}/{self.id}")
+
+    def _check_update(self, option: Optional[Dict]) -> None:
+        if self.id not in self._db.documents(self._collection):
+            raise NotFound(f"No document to update: {self._collection}/{self.id}")
+        if option and option.get("last_update_time") != self._db.update_times.get(self._key):
+            raise FailedPrecondition(f"Document changed since it was read: {self._collection}/{self.id}")
+
+    def _set(self, data: Dict) -> None:
+        self._db.documents(self._collection)[self.id] = copy.deepcopy(data)
+        self._db.touch(self._key)
+
+    def _update(self, data: Dict) -> None:
+        doc = self._db.documents(self._collection)[self.id]
+        for key, value in data.items():
+            # ArrayUnion sentinels carry the values to append
+            values = getattr(value, "values", None)
+            if isinstance(values, (list, tuple)):
+                existing = doc.setdefault(key, [])
+                existing.extend(v for v in copy.deepcopy(list(values)) if v not in existing)
+            else:
+                doc[key] = copy.deepcopy(value)
+        self._db.touch(self._key)
+
+
+class MemoryCollection:
+    def __init__(self, db: "MemoryFirestore", name: str):
+        self._db = db
+        self._name = name
+
+    def document(self, doc_id: str) -> MemoryDocument:
+        return MemoryDocument(self._db, self._name, doc_id)
+
+    def stream(self) -> Iterator[MemorySnapshot]:
+        return MemoryQuery(self._db, self._name).stream()
+
+    def where(self, field_path: Optional[str] = None, op_string: Optional[str] = None, value: Any = None,
+              filter=None) -> "MemoryQuery":
+        return MemoryQuery(self._db, self._name).where(field_path, op_string, value, filter=filter)
+
+
+_OPERATORS: Dict[str, Callable[[Any, Any], bool]] = {
+    "==": operator.eq, "!=": operator.ne, "<": operator.lt, "<=": operator.le, ">": operator.gt, ">=": operator.ge
+}
+
+
+class MemoryQuery:
+    """Field filters and ordering over one collection."""
+
+    def __init__(self, db: "MemoryFirestore", collection: str,
+                 filters: Tuple = (), order: Optional[Tuple[str, bool]] = None):
+        self._db = db
+        self._collection = collection
+        self._filters = filters
+        self._order = order
+
+    def where(self, field_path: Optional[str] = None, op_string: Optional[str] = None, value: Any = None,
+              filter=None) -> "MemoryQuery":
+        if filter is not None:
+            field_path, op_string, value = filter.field_path, filter.op_string, filter.value
+        return MemoryQuery(self._db, self._collection, self._filters + ((field_path, op_string, value),), self._order)
+
+    def order_by(self, field_path: str, direction: str = "ASCENDING") -> "MemoryQuery":
+        return MemoryQuery(self._db, self._collection, self._filters, (field_path, direction == "DESCENDING"))
+
+    def stream(self) -> Iterator[MemorySnapshot]:
+        with self._db.operation("firestore_stream"):
+            docs = [
+                (doc_id, copy.deepcopy(data)) for doc_id, data in self._db.documents(self._collection).items()
+                if all(field in data and _OPERATORS[op](data[field], value) for field, op, value in self._filters)
+            ]
+        if self._order is not None:
+            field, descending = self._order
+            docs.sort(key=lambda item: item[1].get(field), reverse=descending)
+        for doc_id, data in docs:
+            yield MemorySnapshot(doc_id, data)
+
+
+class MemoryBatch:
+    """Writes applied together on commit, or not at all if a precondition fails."""
+
+    def __init__(self, db: "MemoryFirestore"):
+        self._db = db
+        self._writes: List[Tuple[str, MemoryDocument, Dict, Optional[Dict]]] = []
+
+    def set(self, ref: MemoryDocument, data: Dict) -> None:
+        self._writes.append(("set", ref, data, None))
+
+    def create(self, ref: MemoryDocument, data: Dict) -> None:
+        self._writes.append(("create", ref, data, None))
+
+    def update(self, ref: MemoryDocument, data: Dict, option: Optional[Dict] = None) -> None:
+        self._writes.append(("update", ref, data, option))
+
+    def commit(self) -> None:
+        with self._db.operation("firestore_commit"):
+            for kind, ref, _, option in self._writes:
+                if kind == "create":
+                    ref._check_create()
+                elif kind == "update":
+                    ref._check_update(option)
+            for kind, ref, data, _ in self._writes:
+                if kind == "update":
+                    ref._update(data)
+                else:
+                    ref._set(data)
+
+
+class MemoryFirestore:
+    """Drop-in replacement for firestore.client() backed by dicts."""
+
+    def __init__(self, stats: Optional[StageStats] = None, latency_ms: float = 0.0):
+        self.stats = stats
+        self.latency_ms = latency_ms
+        self._lock = threading.RLock()
+        self._collections: Dict[str, Dict[str, Dict]] = {}
+        # Monotonic per-document write stamps standing in for Firestore update times
+        self.update_times: Dict[tuple, int] = {}
+        self._clock = itertools.count(1)
+
+    def collection(self, name: str) -> MemoryCollection:
+        return MemoryCollection(self, name)
+
+    def batch(self) -> MemoryBatch:
+        return MemoryBatch(self)
+
+    def get_all(self, references: List[MemoryDocument]) -> Iterator[MemorySnapshot]:
+        with self.operation("firestore_get_all"):
+            snapshots = [
+                MemorySnapshot(ref.id, copy.deepcopy(self.documents(ref._collection).get(ref.id)),
+                               self.update_times.get(ref._key))
+                for ref in references
+            ]
+        return iter(snapshots)
+
+    def documents(self, collection: str) -> Dict[str, Dict]:
+        return self._collections.setdefault(collection, {})
+
+    def touch(self, key: tuple) -> None:
+        self.update_times[key] = next(self._clock)
+
+    def write_option(self, last_update_time=None) -> Dict:
+        return {"last_update_time": last_update_time}
+
+    def operation(self, stage: str) -> "_Operation":
+        return _Operation(self, stage)
+
+
+class _Operation:
+    """Serializes access, applies the simulated latency and records the sample."""
+
+    def __init__(self, db: MemoryFirestore, stage: str):
+        self._db = db
+        self._stage = stage
+        self._started = 0.0
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        if self._db.latency_ms:
+            time.sleep(self._db.latency_ms / 1000)
+        self._db._lock.acquire()
+
+    def __exit__(self, exc_type, exc, tb):
+        self._db._lock.release()
+        if self._db.stats is not None:
+            self._db.stats.record(self._stage, time.perf_counter() - self._started, error=exc_type is not None)
+        return False
@@ -0,0 +1,264 @@
+"""
+End-to-end load test for the WhatsApp -> orchestrator -> agent pipeline.
+
+Runs the real WebhookServer, WhatsAppHandler, Orchestrator and agent servers in
+one process against local stand-ins: a fake Gemini API, a fake Graph API and an
+in-memory Firestore. Webhook payloads (text, buttons, audio) are replayed at a
+fixed rate and throughput, p50/p95/p99 latency and error rates are reported per stage.
+
+Usage (from the repository root):
+    python -m benchmarks.load_test --rate 5 --duration 60 --mix text=0.6,button=0.2,audio=0.2
+"""
+import argparse
+import functools
+import importlib.util
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict
+
+import requests
+import uvicorn
+
+from benchmarks.fakes.gemini_server import FakeGemini, FakeGeminiConfig
+from benchmarks.fakes.graph_api import FakeGraphApi, FakeGraphConfig
+from benchmarks.fakes.memory_firestore import MemoryFirestore
+from benchmarks.payloads import PayloadGenerator
+from benchmarks.stats import StageStats
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Default ports of the agent tools; further replicas listen on port + REPLICA_PORT_STEP * i
+FIELD_SERVICE_PORT = 8001
+OFFICE_PORT = 8002
+REPLICA_PORT_STEP = 100
+
+
+def _load_module(name: str, path: Path):
+    """Import a module from a file path (the agent directories are not packages)."""
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def _serve(app, port: int) -> None:
+    """Run an ASGI app with uvicorn in a daemon thread."""
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+
+
+def _wait_for(url: str, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            requests.get(url, timeout=1)
+            return
+        except requests.ConnectionError:
+            time.sleep(0.1)
+    raise RuntimeError(f"Timed out waiting for {url}")
+
+
+def _timed(stats: StageStats, stage: str, fn: Callable) -> Callable:
+    """Wrap a callable to record its latency under the given stage (a None result counts as an error)."""
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception:
+            stats.record(stage, time.perf_counter() - started, error=True)
+            raise
+        stats.record(stage, time.perf_counter() - started, error=result is None)
+        return result
+
+    return wrapper
+
+
+def _timed_stream(stats: StageStats, stage: str, fn: Callable) -> Callable:
+    """Like _timed, for callables returning an iterator; timed until the iterator is exhausted."""
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        failed = False
+        try:
+            yield from fn(*args, **kwargs)
+        except Exception:
+            failed = True
+            raise
+        finally:
+            stats.record(stage, time.perf_counter() - started, error=failed)
+
+    return wrapper
+
+
+def parse_mix(value: str) -> Dict[str, float]:
+    """Parse "text=0.6,button=0.2,audio=0.2" into a weight dict."""
+    mix = {}
+    for item in value.split(","):
+        name, _, weight = item.partition("=")
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+def _replica_ports(port: int, replicas: int):
+    return [port + REPLICA_PORT_STEP * i for i in range(replicas)]
+
+
+def start_stack(args, stats: StageStats):
+    """Start fakes, agent servers and the orchestrator; return the webhook URL."""
+    gemini = FakeGemini(FakeGeminiConfig(
+        ttft_median_ms=args.gemini_ttft_ms,
+        ttft_sigma=args.gemini_ttft_sigma,
+        per_token_ms=args.gemini_per_token_ms,
+        output_tokens_mean=args.gemini_tokens,
+        output_tokens_stddev=args.gemini_tokens / 3,
+        tool_call_rate=args.tool_call_rate,
+        max_function_calls=args.max_function_calls,
+        seed=args.seed,
+    ), stats)
+    graph = FakeGraphApi(FakeGraphConfig(
+        send_latency_ms=args.graph_latency_ms,
+        media_latency_ms=args.graph_latency_ms,
+        send_error_rate=args.graph_error_rate,
+        seed=args.seed,
+    ), stats)
+    _serve(gemini.app, args.gemini_port)
+    _serve(graph.app, args.graph_port)
+
+    os.environ.update({
+        "GEMINI_API_KEY": "load-test",
+        "GEMINI_BASE_URL": f"http://127.0.0.1:{args.gemini_port}",
+        "WHATSAPP_ACCESS_TOKEN": "load-test",
+        "WHATSAPP_PHONE_NUMBER_ID": "bench-phone-number-id",
+        "WHATSAPP_API_BASE_URL": f"http://127.0.0.1:{args.graph_port}",
+        "WEBHOOK_PORT": str(args.webhook_port),
+        "FIELD_SERVICE_AGENT_URLS": ",".join(
+            f"http://127.0.0.1:{port}" for port in _replica_ports(FIELD_SERVICE_PORT, args.replicas)),
+        "OFFICE_AGENT_URLS": ",".join(
+            f"http://127.0.0.1:{port}" for port in _replica_ports(OFFICE_PORT, args.replicas)),
+    })
+
+    from shared.agent_server import create_agent_server
+    from shared.orchestrator.firestore_history import FirestoreHistory
+    from shared.orchestrator.sqlite_history import SQLiteHistory
+    import shared.orchestrator.whatsapp_handler as whatsapp_handler
+
+    field_module = _load_module("bench_field_service_agent", ROOT / "gemini-agents/field_service_agent/agent.py")
+    office_module = _load_module("bench_office_agent", ROOT / "gemini-agents/office_agent/agent.py")
+    agent_ports = []
+    for name, agent_class, port in (
+            ("agent_field_service", field_module.FieldServiceAgent, FIELD_SERVICE_PORT),
+            ("agent_office", office_module.OfficeAgent, OFFICE_PORT),
+    ):
+        # Each replica is a separate agent server, as separate processes would be
+        for replica_port in _replica_ports(port, args.replicas):
+            agent = agent_class()
+            server = create_agent_server(
+                agent_name=name,
+                request_callback=_timed(stats, name, agent.process),
+                port=replica_port,
+                stream_callback=_timed_stream(stats, f"{name}_stream", agent.process_stream),
+            )
+            _serve(server.app, replica_port)
+            agent_ports.append(replica_port)
+
+    whatsapp_handler.transcribe_audio_from_url = _timed(
+        stats, "transcription", whatsapp_handler.transcribe_audio_from_url
+    )
+
+    orchestrator_module = _load_module("bench_orchestrator", ROOT / "gemini-agents/orchestrator/main.py")
+    if args.history == "sqlite":
+        history = SQLiteHistory(str(Path(tempfile.mkdtemp(prefix="bench-history-")) / "history.db"))
+    else:
+        history = FirestoreHistory(db=MemoryFirestore(stats, latency_ms=args.firestore_latency_ms))
+    orchestrator = orchestrator_module.Orchestrator(history=history)
+    handler = orchestrator.whatsapp_handler
+    handler.message_callback = _timed(stats, "orchestrator", handler.message_callback)
+    if handler.stream_callback:
+        handler.stream_callback = _timed_stream(stats, "orchestrator", handler.stream_callback)
+
+    base = f"http://127.0.0.1:{args.webhook_port}"
+    for url in [f"{base}/health"] + [f"http://127.0.0.1:{port}/health" for port in agent_ports]:
+        _wait_for(url)
+    return f"{base}/whatsapp/webhook"
+
+
+def run_load(webhook_url: str, args, stats: StageStats) -> None:
+    """Replay payloads open-loop at args.rate per second for args.duration seconds."""
+    generator = PayloadGenerator(parse_mix(args.mix), seed=args.seed)
+    session = requests.Session()
+
+    def send(message_type: str, payload: Dict):
+        started = time.perf_counter()
+        try:
+            response = session.post(webhook_url, json=payload, timeout=args.request_timeout)
+            failed = response.status_code != 200
+        except requests.RequestException:
+            failed = True
+        elapsed = time.perf_counter() - started
+        stats.record("webhook", elapsed, error=failed)
+        stats.record(f"webhook_{message_type}", elapsed, error=failed)
+
+    total = int(args.rate * args.duration)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        for i in range(total):
+            # Open loop: keep the schedule even when responses are slow
+            delay = start + i / args.rate - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(send, *generator.next())
+    stats.finish()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the webhook pipeline against local stand-ins")
+    parser.add_argument("--rate", type=float, default=2.0, help="Webhook deliveries per second")
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds to generate load")
+    parser.add_argument("--mix", default="text=0.6,button=0.2,audio=0.2", help="Message type weights")
+    parser.add_argument("--concurrency", type=int, default=32, help="Max in-flight webhook requests")
+    parser.add_argument("--request-timeout", type=float, default=120.0)
+    parser.add_argument("--gemini-ttft-ms", type=float, default=400.0, help="Median model time to first token")
+    parser.add_argument("--gemini-ttft-sigma", type=float, default=0.5, help="Lognormal sigma of time to first token")
+    parser.add_argument("--gemini-per-token-ms", type=float, default=4.0)
+    parser.add_argument("--gemini-tokens", type=float, default=60.0, help="Mean output tokens per reply")
+    parser.add_argument("--tool-call-rate", type=float, default=0.5, help="Share of turns answered with a tool call")
+    parser.add_argument("--max-function-calls", type=int, default=1,
+                        help="Max parallel function calls per tool-calling model response")
+    parser.add_argument("--graph-latency-ms", type=float, default=120.0)
+    parser.add_argument("--graph-error-rate", type=float, default=0.0)
+    parser.add_argument("--firestore-latency-ms", type=float, default=15.0)
+    parser.add_argument("--history", choices=("firestore", "sqlite"), default="firestore",
+                        help="History backend: in-memory Firestore stand-in or a temporary SQLite file")
+    parser.add_argument("--replicas", type=int, default=1, help="Agent server replicas per agent")
+    parser.add_argument("--webhook-port", type=int, default=18010)
+    parser.add_argument("--gemini-port", type=int, default=18020)
+    parser.add_argument("--graph-port", type=int, default=18030)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--json", dest="json_path", help="Also write the summary as JSON to this path")
+    args = parser.parse_args()
+
+    stats = StageStats()
+    webhook_url = start_stack(args, stats)
+    # Measure the load phase only, not the stack startup
+    stats.started_at = time.perf_counter()
+    run_load(webhook_url, args, stats)
+
+    print()
+    print(stats.format_table())
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(stats.summary(), f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Realistic WhatsApp webhook payloads for the load-test harness.
+Shapes follow the Cloud API "messages" webhook for text, button replies and voice notes.
+"""
+import random
+import time
+import uuid
+from typing import Dict, List, Optional
+
+from shared.users import USER_DIRECTORY
+
+TEXT_MESSAGES = [
+    "Finished the job at Mrs. Weber, Hauptstrasse 12. Replaced the kitchen faucet, 2 hours.",
+    "Customer Müller in Lindenweg 4 needs a follow-up, the boiler pressure keeps dropping.",
+    "Done at the bakery on Marktplatz. Unclogged the drain, used 1 cleaning cartridge, 45 minutes.",
+    "Can you check whether we already invoiced the Schmidt job from yesterday?",
+    "Please create the invoice for job 789.",
+    "Yes, approved.",
+]
+
+BUTTON_IDS = ["yes", "no", "approve", "reject"]
+
+MESSAGE_TYPES = ("text", "button", "audio")
+
+
+def whatsapp_senders() -> List[str]:
+    """Phone numbers of all registered WhatsApp users."""
+    return list(USER_DIRECTORY.whatsapp_numbers())
+
+
+def build_message(message_type: str, from_number: str, rng: random.Random) -> Dict:
+    """
+    Build a single inbound message object.
+
+    Args:
+        message_type: One of "text", "button" or "audio"
+        from_number: Sender phone number
+        rng: Random source for content selection
+
+    Returns:
+        Message dict as found in value.messages[] of the webhook
+    """
+    message = {
+        "from": from_number,
+        "id": f"wamid.bench.{uuid.uuid4().hex}",
+        "timestamp": str(int(time.time())),
+        "type": message_type,
+    }
+    if message_type == "text":
+        message["text"] = {"body": rng.choice(TEXT_MESSAGES)}
+    elif message_type == "button":
+        message["type"] = "interactive"
+        button_id = rng.choice(BUTTON_IDS)
+        message["interactive"] = {
+            "type": "button_reply",
+            "button_reply": {"id": button_id, "title": button_id.title()}
+        }
+    elif message_type == "audio":
+        message["audio"] = {
+            "id": f"media-{uuid.uuid4().hex[:12]}",
+            "mime_type": "audio/ogg; codecs=opus",
+            "voice": True
+        }
+    else:
+        raise ValueError(f"Unsupported message type: {message_type}")
+    return message
+
+
+def build_webhook_payload(message: Dict, phone_number_id: str = "bench-phone-number-id") -> Dict:
+    """Wrap a message object in the webhook envelope Meta delivers."""
+    return {
+        "object": "whatsapp_business_account",
+        "entry": [{
+            "id": "bench-business-account",
+            "changes": [{
+                "field": "messages",
+                "value": {
+                    "messaging_product": "whatsapp",
+                    "metadata": {
+                        "display_phone_number": "15550000000",
+                        "phone_number_id": phone_number_id
+                    },
+                    "contacts": [{"profile": {"name": "Bench"}, "wa_id": message["from"]}],
+                    "messages": [message]
+                }
+            }]
+        }]
+    }
+
+
+class PayloadGenerator:
+    """Draws webhook payloads according to a message type mix."""
+
+    def __init__(self, mix: Dict[str, float], seed: Optional[int] = None):
+        """
+        Args:
+            mix: Relative weights per message type, e.g. {"text": 0.6, "button": 0.2, "audio": 0.2}
+            seed: Optional seed for reproducible runs
+        """
+        unknown = set(mix) - set(MESSAGE_TYPES)
+        if unknown:
+            raise ValueError(f"Unknown message types in mix: {sorted(unknown)}")
+        self.types = list(mix)
+        self.weights = [mix[t] for t in self.types]
+        self.rng = random.Random(seed)
+        self.senders = whatsapp_senders()
+
+    def next(self) -> tuple[str, Dict]:
+        """Return (message_type, webhook payload)."""
+        message_type = self.rng.choices(self.types, weights=self.weights)[0]
+        sender = self.rng.choice(self.senders)
+        return message_type, build_webhook_payload(build_message(message_type, sender, self.rng))
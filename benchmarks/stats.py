@@ -0,0 +1,83 @@
+"""
+Thread-safe latency and error collection for the load-test harness.
+Every fake server and the webhook driver record samples per stage into one StageStats.
+"""
+import math
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    """Nearest-rank percentile of a list of samples (0 for an empty list)."""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = max(0, min(len(ordered) - 1, math.ceil(pct / 100 * len(ordered)) - 1))
+    return ordered[rank]
+
+
+class StageStats:
+    """Collects latency samples and error counts per pipeline stage."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._latencies: Dict[str, List[float]] = defaultdict(list)
+        self._errors: Dict[str, int] = defaultdict(int)
+        self.started_at = time.perf_counter()
+        self.finished_at: Optional[float] = None
+
+    def record(self, stage: str, seconds: float, error: bool = False) -> None:
+        """
+        Record one sample for a stage.
+
+        Args:
+            stage: Stage name (e.g. "webhook", "gemini", "graph_send")
+            seconds: Observed latency in seconds
+            error: Whether the call failed
+        """
+        with self._lock:
+            self._latencies[stage].append(seconds)
+            if error:
+                self._errors[stage] += 1
+
+    def finish(self) -> None:
+        self.finished_at = time.perf_counter()
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """
+        Summarize all stages.
+
+        Returns:
+            Mapping of stage -> count, errors, error_rate, throughput (per second), p50/p95/p99 (ms)
+        """
+        elapsed = (self.finished_at or time.perf_counter()) - self.started_at
+        with self._lock:
+            stages = {stage: list(samples) for stage, samples in self._latencies.items()}
+            errors = dict(self._errors)
+
+        result = {}
+        for stage, samples in sorted(stages.items()):
+            count = len(samples)
+            result[stage] = {
+                "count": count,
+                "errors": errors.get(stage, 0),
+                "error_rate": errors.get(stage, 0) / count if count else 0.0,
+                "throughput": count / elapsed if elapsed > 0 else 0.0,
+                "p50_ms": percentile(samples, 50) * 1000,
+                "p95_ms": percentile(samples, 95) * 1000,
+                "p99_ms": percentile(samples, 99) * 1000,
+            }
+        return result
+
+    def format_table(self) -> str:
+        """Render the summary as a fixed-width text table."""
+        header = f"{'stage':<22}{'count':>8}{'err%':>8}{'req/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+        lines = [header, "-" * len(header)]
+        for stage, row in self.summary().items():
+            lines.append(
+                f"{stage:<22}{row['count']:>8}{row['error_rate'] * 100:>7.1f}%{row['throughput']:>9.2f}"
+                f"{row['p50_ms']:>10.1f}{row['p95_ms']:>10.1f}{row['p99_ms']:>10.1f}"
+            )
+        return "\n".join(lines)
@@ -1,44 +1,64 @@
-import os
-from google import genai
-from google.genai import Client
-from google.genai.types import GenerateContentConfig, AutomaticFunctionCallingConfig
-from tools.find_customer import find_customer
-from tools.check_invoice_status import check_invoice_status
+from typing import TYPE_CHECKING, Any, Dict, Iterator
+
+from shared.agent_config import get_agent_config
+from shared.deadline import DeadlineExceeded
+from shared.function_calling import generate_with_tools, stream_with_tools
+from shared.genai_client import create_genai_client
+from shared.log import get_logger
+from shared.prompts import request_prompt
+from shared.tracing import start_span
+
+if TYPE_CHECKING:
+    from google.genai import Client
+
+log = get_logger("field_service_agent")
 
 
 class FieldServiceAgent:
     """Field Service Agent - handling technician interactions."""
-    system_prompt: str = ""
-    client: Client
+    client: "Client"
 
     def __init__(self):
-        self.client = genai.Client(api_key=os.environ.get("GEMINI_API_KEY"))
-        # Load system prompt from shared prompts directory
-        prompt_path = os.path.join(os.path.dirname(__file__), "../../prompts/field_service_system_prompt.md")
-        with open(prompt_path, "r", encoding="utf-8") as f:
-            self.system_prompt = f.read()
+        self.client = create_genai_client("field_service")
 
-        print("[FieldServiceAgent] Initialized (stateless)")
+        log.info("Initialized (stateless)")
 
-    def process(self, message: str) -> str:
+    def process(self, request: Dict[str, Any]) -> str:
         """
         Process message with orchestrator's history context.
         Agent is stateless - all history comes from orchestrator.
         """
+        message = request_prompt(request)
         try:
-            print(f"[FieldServiceAgent] Processing: {message}...")
-            response_text = self.client.models.generate_content(
-                contents=message,
-                model="gemini-2.5-flash",
-                config=GenerateContentConfig(
-                    system_instruction=self.system_prompt,
-                    tools=[find_customer, check_invoice_status],
-                    automatic_function_calling=AutomaticFunctionCallingConfig(disable=False)
-                )
-            ).text
-            print(f"[FieldServiceAgent] Response: {response_text[:100]}...")
+            log.debug("Processing", message=message)
+            with start_span("field_service.llm"):
+                response_text = generate_with_tools(self.client, get_agent_config("field_service"), message)
+            log.debug("Response", response=response_text)
             return response_text
 
+        except DeadlineExceeded as e:
+            log.warning("Out of time", stage=e.stage)
+            return "Sorry, I ran out of time before I could finish this request."
+
         except Exception as e:
-            print(f"[FieldServiceAgent] Error: {e}")
+            log.exception("Error processing request", error=str(e))
             return f"Sorry, I encountered an error processing your request: {str(e)}"
+
+    def process_stream(self, request: Dict[str, Any]) -> Iterator[str]:
+        """
+        Streaming variant of process(), yielding text chunks as the model produces them.
+        Tool calls are executed between model calls, text streams as soon as it is generated.
+        """
+        message = request_prompt(request)
+        try:
+            log.debug("Streaming", message=message)
+            with start_span("field_service.llm"):
+                yield from stream_with_tools(self.client, get_agent_config("field_service"), message)
+
+        except DeadlineExceeded as e:
+            log.warning("Out of time", stage=e.stage)
+            yield "Sorry, I ran out of time before I could finish this request."
+
+        except Exception as e:
+            log.exception("Error processing request", error=str(e))
+            yield f"Sorry, I encountered an error processing your request: {str(e)}"
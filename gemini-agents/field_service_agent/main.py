@@ -2,15 +2,28 @@
 Field Service Agent HTTP Server
 Handles technician messages and job data collection via HTTP API.
 """
+from shared.startup import install_startup_profiler, startup_phase, finish_startup, warm_up
+
+# Before the other imports, so --profile-startup can time them
+install_startup_profiler()
+
 from agent import FieldServiceAgent
 from shared.agent_server import create_agent_server
 
 if __name__ == "__main__":
+    with startup_phase("agent init"):
+        agent = FieldServiceAgent()
+
     # Create and run agent server
-    server = create_agent_server(
-        agent_name="FieldService",
-        request_callback=FieldServiceAgent().process,
-        port=8001,
-    )
+    with startup_phase("server init"):
+        server = create_agent_server(
+            agent_name="FieldService",
+            request_callback=agent.process,
+            stream_callback=agent.process_stream,
+            port=8001
+        )
 
+    finish_startup("FieldService")
+    # Load the Gemini SDK while uvicorn starts, instead of on the first request
+    warm_up("google.genai", "google.genai.types")
     server.run()
@@ -0,0 +1,129 @@
+"""
+Office Agent batch mode
+Re-runs stored office requests (e.g. after a price list or prompt change) through the
+Gemini Batch API instead of one interactive call at a time.
+
+    # Requests from a JSONL file: {"id": ..., "message": ..., "context": [...], "user": ...} per line
+    python batch.py run --input jobs.jsonl --output results.jsonl
+
+    # One request per user, built from the stored conversation history (hot tail and archive)
+    python batch.py run --users 491718398683 19712187997 --output results.jsonl \\
+        --message "Re-check the billing of the jobs in this conversation with the current price list."
+
+    # Progress of a run (also while it is running in another shell)
+    python batch.py status --state office_batch.json
+
+Runs resume from their state file. --backend local runs the requests with
+interactive calls in this process (for tests against the fake Gemini server).
+"""
+import argparse
+import json
+import sys
+from typing import Dict, Iterator, List
+
+from shared.agent_config import get_agent_config
+from shared.batch import BatchRun, GeminiBatchBackend, LocalBatchBackend, write_results
+from shared.function_calling import DEFAULT_MAX_ITERATIONS
+from shared.genai_client import create_genai_client
+from shared.log import get_logger
+from shared.prompts import request_prompt
+from shared.rate_limit import BACKGROUND
+
+log = get_logger("office_batch")
+
+DEFAULT_MESSAGE = "Re-check the billing of the jobs in this conversation with the current price list."
+
+# Fields of a /process request that the agent server strips before the model sees it
+_METADATA_FIELDS = ("trace", "user", "deadline_ms")
+
+
+def requests_from_file(path: str) -> Iterator[Dict]:
+    """Requests of a JSONL file; each line needs an "id" and the /process request fields ("user" attributes it)."""
+    with open(path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            if line.strip():
+                request = json.loads(line)
+                request.setdefault("id", str(line_number))
+                yield request
+
+
+def requests_from_history(user_ids: List[str], message: str) -> Iterator[Dict]:
+    """One request per user with the user's full history (archived messages and hot tail) as its context."""
+    from shared.orchestrator.history_store import create_history_store
+
+    store = create_history_store()
+    for user_id in user_ids:
+        records = store.load_archive(user_id) + store.load_versioned(user_id).records.records
+        if not records:
+            log.warning("No history", user=user_id)
+            continue
+        yield {
+            "id": user_id,
+            "message": message,
+            "context": [record.payload for record in records],
+            "user": user_id
+        }
+
+
+def run(args) -> int:
+    # Batch runs yield quota to interactive turns of the same process (--backend local)
+    client = create_genai_client("office", priority=BACKGROUND)
+    backend = LocalBatchBackend(client) if args.backend == "local" else GeminiBatchBackend(client)
+    batch = BatchRun(get_agent_config("office"), backend, args.state, max_iterations=args.max_iterations)
+
+    if not batch.resumed:
+        if args.input:
+            requests = requests_from_file(args.input)
+        elif args.users:
+            requests = requests_from_history(args.users, args.message)
+        else:
+            print("Nothing to run: pass --input or --users, or an existing --state", file=sys.stderr)
+            return 2
+        for request in requests:
+            item_id = str(request.pop("id"))
+            # The model gets what the agent server would pass it: message, job data and context
+            prompt = {key: value for key, value in request.items() if key not in _METADATA_FIELDS}
+            batch.add(item_id, request, request_prompt(prompt), user=request.get("user"))
+
+    items = batch.run(poll_interval=args.poll_interval)
+    write_results(items, args.output)
+    print(json.dumps(batch.counts()))
+    return 0 if all(item.status == "done" for item in items) else 1
+
+
+def status(args) -> int:
+    with open(args.state, encoding="utf-8") as f:
+        state = json.load(f)
+    counts: Dict[str, int] = {}
+    for item in state["items"]:
+        counts[item["status"]] = counts.get(item["status"], 0) + 1
+    print(json.dumps({"backend": state["backend"], "round": state["round"], "job": state["job"], **counts}))
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Run office requests through the Gemini Batch API")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="Submit requests (or resume a run) and write the results")
+    run_parser.add_argument("--input", help="JSONL file with one request per line")
+    run_parser.add_argument("--users", nargs="+", help="Build one request per user from the stored history")
+    run_parser.add_argument("--message", default=DEFAULT_MESSAGE, help="Instruction for requests built with --users")
+    run_parser.add_argument("--output", default="office_batch_results.jsonl")
+    run_parser.add_argument("--state", default="office_batch.json", help="Progress file; an existing one is resumed")
+    run_parser.add_argument("--backend", choices=("gemini", "local"), default="gemini")
+    run_parser.add_argument("--poll-interval", type=float, default=30.0, help="Seconds between job status checks")
+    run_parser.add_argument("--max-iterations", type=int, default=DEFAULT_MAX_ITERATIONS,
+                            help="Model calls per request")
+    run_parser.set_defaults(handler=run)
+
+    status_parser = commands.add_parser("status", help="Show the progress of a run")
+    status_parser.add_argument("--state", default="office_batch.json")
+    status_parser.set_defaults(handler=status)
+
+    args = parser.parse_args()
+    return args.handler(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
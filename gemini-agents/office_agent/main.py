@@ -2,15 +2,28 @@
 Office Agent HTTP Server
 Handles billing validation and office workflows via HTTP API.
 """
-from shared.agent_server import create_agent_server
+from shared.startup import install_startup_profiler, startup_phase, finish_startup, warm_up
+
+# Before the other imports, so --profile-startup can time them
+install_startup_profiler()
+
 from agent import OfficeAgent
+from shared.agent_server import create_agent_server
 
 if __name__ == "__main__":
+    with startup_phase("agent init"):
+        agent = OfficeAgent()
+
     # Create and run agent server
-    server = create_agent_server(
-        agent_name="Office",
-        request_callback=OfficeAgent().process,
-        port=8002
-    )
+    with startup_phase("server init"):
+        server = create_agent_server(
+            agent_name="Office",
+            request_callback=agent.process,
+            stream_callback=agent.process_stream,
+            port=8002
+        )
 
+    finish_startup("Office")
+    # Load the Gemini SDK while uvicorn starts, instead of on the first request
+    warm_up("google.genai", "google.genai.types")
     server.run()
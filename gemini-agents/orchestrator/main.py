@@ -1,107 +1,171 @@
-import os
-import json
-from typing import Dict, List
-
-from google import genai
-from google.genai import Client
-from google.genai.types import Content, Part, GenerateContentResponse, GenerateContentConfig
-from vertexai.generative_models import ChatSession
-
-from tools.communicate_with_human import make_communicate_with_human_tool
-from tools.field_service_agent import make_field_service_agent_tool
-from tools.office_agent import make_office_agent_tool
-from shared.users import USER_REGISTRY
+from typing import TYPE_CHECKING, Dict, List, Iterator, Optional
+
+from shared.startup import install_startup_profiler, startup_phase, finish_startup, warm_up
+
+# Before the other imports, so --profile-startup can time them
+install_startup_profiler()
+
+from shared.agent_config import get_agent_config
+from shared.deadline import DeadlineExceeded
+from shared.function_calling import stream_with_tools
+from shared.genai_client import create_genai_client
+from shared.idempotency import SENT
+from shared.log import get_logger
+from shared.metrics import REGISTRY
+from shared.tracing import start_span
+from shared.turn_context import turn_context
+from shared.usage import user_context
+from shared.users import USER_DIRECTORY
 from shared.orchestrator.whatsapp_handler import WhatsAppHandler
 from shared.orchestrator.firestore_history import FirestoreHistory
+from shared.orchestrator.history_store import HistoryConflictError, HistoryRecord, HistoryStore, create_history_store
+
+if TYPE_CHECKING:
+    from google.genai import Client
+
+log = get_logger("orchestrator")
+
+HISTORY_CONFLICTS = REGISTRY.counter(
+    "orchestrator_history_conflicts_total",
+    "Turns whose history was changed by another replica while they ran"
+)
 
 
 class Orchestrator:
-    chat_history: Dict[str, List[Content]] = {}
-    chats: Dict[str, ChatSession] = {}
-    orchestrator_prompt: str = ""
-    client: Client
-    firestore: FirestoreHistory
-
-    def __init__(self):
-        print("🚀 Orchestrator initializing...")
-        self.client = genai.Client(api_key=os.environ.get("GEMINI_API_KEY"))
-
-        # Load System Prompt from the shared prompts directory
-        prompt_path = os.path.join(os.path.dirname(__file__), "../../prompts/orchestrator_system_prompt.md")
-        with open(prompt_path, "r", encoding="utf-8") as f:
-            self.orchestrator_prompt = f.read()
-
-        # Initialize Firestore and load chat histories
-        print("📥 Loading chat histories from Firestore...")
-        self.firestore = FirestoreHistory()
-        self.chat_history = self.firestore.load_all_histories()
-        print(f"✓ Loaded histories for {len(self.chat_history)} users")
+    """
+    Routes user messages to the agents.
+
+    Holds no conversation state: each turn reads the user's history from the
+    HistoryStore and commits its new messages as versioned appends, so several
+    orchestrator processes can serve the same webhook stream.
+
+    Two turns of the same user may run at the same time (the user sends a
+    second message before the first is answered). They are not serialized:
+    when a turn commits against a history another turn has appended to since
+    it was loaded, the version check detects it and the turn's messages are
+    appended after the other turn's instead (counted in
+    orchestrator_history_conflicts_total). This rebase is deliberate: by the
+    time a turn commits, its reply has already been streamed and sent to the
+    user, so it can be neither discarded nor regenerated, and the history
+    records both exchanges in the order they were committed. Appends are
+    atomic in every store, so no messages are lost; the cost is that the later
+    turn's reply was built without the other turn's messages.
+    """
+    client: "Client"
+    history: HistoryStore
+
+    def __init__(self, history: Optional[HistoryStore] = None):
+        """
+        Args:
+            history: Optional history store; defaults to the HISTORY_BACKEND store (Firestore unless configured)
+        """
+        log.info("🚀 Orchestrator initializing...")
+        self.client = create_genai_client("orchestrator")
+
+        # Conversation state lives in the store, histories are loaded per turn
+        self.history = history or create_history_store()
+        # Keys of sent messages are shared with the other replicas through the same store
+        SENT.attach(self.history)
 
         # Setup WhatsApp handler
         # Pass the *instance method* as the callback
-        self.whatsapp_handler = WhatsAppHandler(self.process_message)
-
-        print("✓ Orchestrator ready.")
+        with startup_phase("whatsapp handler"):
+            self.whatsapp_handler = WhatsAppHandler(
+                self.process_message,
+                stream_callback=self.process_message_stream
+            )
 
-    def _serialize_history(self, user_role: str) -> List[Dict[str, str]]:
-        """Convert Content objects to JSON-serializable dicts for a specific user."""
-        history = self.chat_history.get(user_role, [])
-        return [{"role": msg.role, "parts": [getattr(p, "text", "") for p in msg.parts]} for msg in history]
+        log.info("✓ Orchestrator ready.")
 
     def process_message(self, user_role: str, message: str) -> str:
         """
         Processes an incoming message from a user and returns the response.
         This is the main entry point for both CLI and WhatsApp.
         """
+        return "".join(self.process_message_stream(user_role, message))
+
+    def process_message_stream(self, user_role: str, message: str) -> Iterator[str]:
+        """
+        Processes an incoming message from a user, yielding the response text as it is generated.
+        Tool calls are resolved before the final answer starts streaming; history is saved once the stream ends.
+        """
+        with start_span("orchestrator.turn", user_role=user_role), user_context(user_role):
+            yield from self._process_message_stream(user_role, message)
+
+    def _process_message_stream(self, user_role: str, message: str) -> Iterator[str]:
+        from google.genai.types import Content, Part
+
+        # Messages produced by this turn, per user, committed to the store when the turn ends
+        pending: Dict[str, List[HistoryRecord]] = {}
+        version = None
         try:
             # Get user info
-            user = USER_REGISTRY.get(user_role)
+            user = USER_DIRECTORY.get(user_role)
             if not user:
-                return f"❌ Unknown user: {user_role}. Please register first."
+                yield f"❌ Unknown user: {user_role}. Please register first."
+                return
 
-            print(f"[ORCHESTRATOR] Processing message from {user['name']}: {message}")
+            log.info("Processing message", user=user['name'], message=message)
             # Build message with user context - inject current user info dynamically
             user_message = f"[User: {user['name']}, Role: {user['role']}]\n{message}"
 
+            snapshot = self.history.load_versioned(user_role)
+            version = snapshot.version
+            history = snapshot.records
+
+            def append_chat_message(role: str, content: Content):
+                log.debug("Appended chat message", user_role=role, text=content.parts[0].text)
+                # The same record is sent to agents and stored, so it is encoded once
+                record = history.append(content) if role == user_role else HistoryRecord(content)
+                pending.setdefault(role, []).append(record)
+
             # Add a user message to the chat history
-            self.append_chat_message(user_role, Content(role="user", parts=[Part(text=user_message)]))
-
-            # Create tool factories with this user's history
-            field_service_tool = make_field_service_agent_tool(lambda: self._serialize_history(user_role))
-            office_tool = make_office_agent_tool(lambda: self._serialize_history(user_role))
-            communicate_with_human = make_communicate_with_human_tool(self.append_chat_message)
-
-            # Send the message
-            response = self.client.models.generate_content(
-                contents=self.chat_history[user_role],
-
-                model="gemini-2.5-flash",
-                config=GenerateContentConfig(
-                    system_instruction=self.orchestrator_prompt,
-                    tools=[field_service_tool, office_tool, communicate_with_human]
-                )
-            )
+            append_chat_message(user_role, Content(role="user", parts=[Part(text=user_message)]))
+
+            # Send the message; the orchestrator's tools read this user's history through the turn context
+            response_chunks = []
+            with start_span("orchestrator.llm"), turn_context(
+                    user_role,
+                    get_history=history.payload,
+                    append_message=append_chat_message
+            ):
+                for text in stream_with_tools(self.client, get_agent_config("orchestrator"), history.contents()):
+                    response_chunks.append(text)
+                    yield text
 
             # Add model response to history
             # This is the internal monologue, wdont need this
-            # self.append_chat_message(user_role, Content(role="model", parts=response.parts))
+            # append_chat_message(user_role, Content(role="model", parts=response.parts))
 
-            # Save the full updated history to Firestore to also include agent-to-agent chats
-            for role in self.chat_history:
-                print("save", role)
-                self.firestore.save_history(role, self.chat_history[role])
-
-            print(f"[ORCHESTRATOR] Model Response: {response.text}")
-            return response.text
+            log.debug("Model response", response="".join(response_chunks))
+        except DeadlineExceeded as e:
+            log.warning("⏱️ Turn ran out of time", user_role=user_role, stage=e.stage)
+            yield "Sorry, this is taking longer than expected and I couldn't finish in time. Please try again."
         except Exception as e:
-            print(f"[ORCHESTRATOR] ❌ Error: {e}")
-            return f"Sorry, an error occurred: {str(e)}"
-
-    def append_chat_message(self, user_role: str, content: Content):
-        if user_role not in self.chat_history:
-            self.chat_history[user_role] = []
-        print("append_chat_message", user_role, content.parts[0].text)
-        self.chat_history[user_role].append(content)
+            log.exception("❌ Error processing message", error=str(e))
+            yield f"Sorry, an error occurred: {str(e)}"
+        finally:
+            # Persist this turn's messages, including agent-to-agent chats sent to other users
+            if pending:
+                self._commit_turn(user_role, version, pending)
+
+    def _commit_turn(self, user_role: str, version: Optional[int], pending: Dict[str, List[HistoryRecord]]):
+        """Append a turn's messages to the store, rebasing onto turns committed concurrently by other replicas."""
+        with start_span("orchestrator.save_history", users=len(pending)):
+            for role, contents in pending.items():
+                expected_version = version if role == user_role else None
+                try:
+                    try:
+                        self.history.append_messages(role, contents, expected_version=expected_version)
+                    except HistoryConflictError:
+                        # Another turn for this user finished first; our reply is already sent,
+                        # so record it after theirs (see the class docstring)
+                        HISTORY_CONFLICTS.inc()
+                        log.warning("History changed during turn, appending after concurrent turn",
+                                    user_role=role, expected_version=expected_version)
+                        self.history.append_messages(role, contents)
+                except Exception as e:
+                    log.exception("❌ Error saving history", user_role=role, error=str(e))
 
     def run_cli(self):
         """
@@ -115,8 +179,9 @@ class Orchestrator:
         print("  2. Office Staff")
         choice = input("\nSelect (1 or 2): ").strip()
         user_id = "technician" if choice == "1" else "office"
-        user_name = USER_REGISTRY[user_id]['name']
-        user_role = USER_REGISTRY[user_id]["role"]
+        user = USER_DIRECTORY.get(user_id)
+        user_name = user['name']
+        user_role = user["role"]
 
         print(f"\n✓ You are: {user_name}\n")
         print("🚀 Ready for messages (CLI + WhatsApp)...\n")
@@ -134,18 +199,13 @@ class Orchestrator:
                     print("\n👋 Goodbye!")
                     break
 
-                # Process through Gemini orchestrator
-                response = self.process_message(user_id, user_input)
-
-                if response is None:
-                    continue
-
-                # Print response
+                # Process through Gemini orchestrator, printing the response as it streams in
                 print(f"\n{'─' * 60}")
                 print(f"💬 RESPONSE:")
                 print(f"{'─' * 60}")
-                print(response)
-                print(f"{'─' * 60}\n")
+                for chunk in self.process_message_stream(user_id, user_input):
+                    print(chunk, end="", flush=True)
+                print(f"\n{'─' * 60}\n")
 
         except KeyboardInterrupt:
             print("\n\n⏹️  Orchestrator stopped")
@@ -153,5 +213,12 @@ class Orchestrator:
 
 # --- Main execution ---
 if __name__ == "__main__":
-    orchestrator = Orchestrator()
+    with startup_phase("orchestrator init"):
+        orchestrator = Orchestrator()
+    finish_startup("Orchestrator")
+    # Load the Gemini and Firestore SDKs in the background instead of on the first message
+    if isinstance(orchestrator.history, FirestoreHistory):
+        warm_up("google.genai", "google.genai.types", "firebase_admin.firestore")
+    else:
+        warm_up("google.genai", "google.genai.types")
     orchestrator.run_cli()
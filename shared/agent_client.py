@@ -0,0 +1,435 @@
+"""
+HTTP client for calls from the orchestrator's tools to the agent servers.
+
+An agent can run as several replicas (agent server processes, on one machine
+or several). The EndpointRegistry holds each agent's replicas. Every call goes
+to the healthy replica with the fewest outstanding requests. A background
+thread checks /health on every replica: it takes a replica out of rotation
+after repeated failed checks and puts it back once it answers again.
+
+Each replica also has a circuit breaker. Failed and slow calls are
+counted over a rolling window. When too many of them fail, the breaker opens
+and calls fail fast instead of waiting out their timeout. After a cool-down,
+one caller probes the replica's /health endpoint (half-open). A healthy answer
+closes the breaker again; otherwise it stays open for another cool-down.
+
+With several replicas configured, a call can be hedged: if the first replica
+has not answered after the agent's recent p95 latency, the same request is
+sent to a second replica and the first answer wins. Hedging duplicates work,
+so it is only enabled for agents whose requests are safe to run twice.
+"""
+import contextvars
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Deque, Dict, List, Optional, Sequence
+
+import requests
+
+from shared.agent_protocol import (
+    IDENTITY,
+    JSON,
+    accept_headers,
+    decode,
+    encode,
+    preferred_codec,
+    supported_encodings,
+)
+from shared.deadline import bounded_timeout, remaining_ms
+from shared.log import get_logger
+from shared.metrics import REGISTRY
+from shared.tracing import trace_context
+from shared.usage import current_user
+
+log = get_logger("agent_client")
+
+CIRCUIT_TRANSITIONS = REGISTRY.counter(
+    "agent_circuit_transitions_total",
+    "Circuit breaker state changes per agent replica",
+    labelnames=("agent", "endpoint", "state")
+)
+CIRCUIT_REJECTED = REGISTRY.counter(
+    "agent_circuit_rejected_total",
+    "Agent calls failed fast because no replica was healthy with a closed circuit",
+    labelnames=("agent",)
+)
+ENDPOINT_TRANSITIONS = REGISTRY.counter(
+    "agent_endpoint_transitions_total",
+    "Agent replicas taken out of or put back into rotation by health checks",
+    labelnames=("agent", "endpoint", "state")
+)
+HEDGED_CALLS = REGISTRY.counter(
+    "agent_hedged_calls_total",
+    "Agent calls sent to a second replica, by which request answered first",
+    labelnames=("agent", "winner")
+)
+
+# Breaker and hedging settings, shared by all agents
+BREAKER_WINDOW = int(os.getenv("AGENT_BREAKER_WINDOW", "20"))
+BREAKER_MIN_CALLS = int(os.getenv("AGENT_BREAKER_MIN_CALLS", "5"))
+BREAKER_FAILURE_RATE = float(os.getenv("AGENT_BREAKER_FAILURE_RATE", "0.5"))
+BREAKER_SLOW_SECONDS = float(os.getenv("AGENT_BREAKER_SLOW_SECONDS", "20"))
+BREAKER_OPEN_SECONDS = float(os.getenv("AGENT_BREAKER_OPEN_SECONDS", "10"))
+HEALTH_TIMEOUT = 2.0
+HEALTH_CHECK_INTERVAL = float(os.getenv("AGENT_HEALTH_CHECK_INTERVAL", "5"))
+# Consecutive failed health checks before a replica is taken out of rotation
+HEALTH_CHECK_FAILURES = int(os.getenv("AGENT_HEALTH_CHECK_FAILURES", "2"))
+# Hedge delay until enough latencies are known, and its lower bound
+HEDGE_DEFAULT_DELAY = float(os.getenv("AGENT_HEDGE_DEFAULT_DELAY", "3.0"))
+HEDGE_MIN_DELAY = 0.05
+HEDGE_MIN_SAMPLES = 20
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class AgentCallError(Exception):
+    """An agent call failed with an HTTP error status."""
+
+    def __init__(self, agent: str, status_code: int):
+        super().__init__(f"{agent} failed to respond (HTTP {status_code})")
+        self.status_code = status_code
+
+
+class AgentUnavailableError(Exception):
+    """No replica of the agent is healthy with a closed circuit."""
+
+    def __init__(self, agent: str):
+        super().__init__(f"{agent} is unavailable (no healthy replica)")
+
+
+class CircuitBreaker:
+    """Circuit breaker of one agent replica."""
+
+    def __init__(self, agent: str, base_url: str, probe: Callable[[], bool]):
+        self.agent = agent
+        self.base_url = base_url
+        self.probe = probe
+        self.state = CLOSED
+        # Rolling window of call outcomes, True = failed or slow
+        self._outcomes: Deque[bool] = deque(maxlen=BREAKER_WINDOW)
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """Whether a call may be sent to this replica now; probes /health once the cool-down has passed."""
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == HALF_OPEN or time.monotonic() - self._opened_at < BREAKER_OPEN_SECONDS:
+                # Cooling down, or another caller is probing
+                return False
+            self._transition(HALF_OPEN)
+        healthy = self.probe()
+        log.info("Circuit probe", agent=self.agent, endpoint=self.base_url, healthy=healthy)
+        with self._lock:
+            if healthy:
+                self._outcomes.clear()
+                self._transition(CLOSED)
+            else:
+                self._open()
+        return healthy
+
+    def record(self, elapsed: float, failed: bool) -> None:
+        with self._lock:
+            self._outcomes.append(failed or elapsed >= BREAKER_SLOW_SECONDS)
+            if self.state != CLOSED or len(self._outcomes) < BREAKER_MIN_CALLS:
+                return
+            failure_rate = sum(self._outcomes) / len(self._outcomes)
+            if failure_rate >= BREAKER_FAILURE_RATE:
+                log.warning("Circuit opened", agent=self.agent, endpoint=self.base_url,
+                            failure_rate=round(failure_rate, 2))
+                self._open()
+
+    def _open(self) -> None:
+        self._opened_at = time.monotonic()
+        self._transition(OPEN)
+
+    def _transition(self, state: str) -> None:
+        if state != self.state:
+            self.state = state
+            CIRCUIT_TRANSITIONS.inc(agent=self.agent, endpoint=self.base_url, state=state)
+
+
+class Endpoint:
+    """One replica of an agent."""
+
+    def __init__(self, agent: str, base_url: str):
+        self.agent = agent
+        self.base_url = base_url.rstrip("/")
+        self.breaker = CircuitBreaker(agent, self.base_url, probe=self.check_health)
+        # Out of rotation after HEALTH_CHECK_FAILURES failed health checks in a row
+        self.healthy = True
+        self.failed_checks = 0
+        self.outstanding = 0
+        # Request format; falls back to plain JSON if the replica answers 415
+        self.codec = preferred_codec()
+        self.encoding = supported_encodings()[0]
+        self._lock = threading.Lock()
+
+    def check_health(self) -> bool:
+        try:
+            response = requests.get(f"{self.base_url}/health", timeout=bounded_timeout(HEALTH_TIMEOUT))
+            return response.status_code == 200 and response.json().get("status") == "healthy"
+        except (requests.RequestException, ValueError):
+            return False
+
+    def begin(self) -> None:
+        with self._lock:
+            self.outstanding += 1
+
+    def end(self) -> None:
+        with self._lock:
+            self.outstanding -= 1
+
+
+class EndpointRegistry:
+    """Replicas of each agent, kept in rotation by periodic health checks."""
+
+    def __init__(self, check_interval: float = HEALTH_CHECK_INTERVAL):
+        self.check_interval = check_interval
+        self._endpoints: Dict[str, List[Endpoint]] = {}
+        self._lock = threading.Lock()
+        self._checker: Optional[threading.Thread] = None
+
+    def register(self, agent: str, urls: Sequence[str]) -> None:
+        """Add replicas of an agent (already known URLs are ignored)."""
+        for url in urls:
+            self.add(agent, url)
+
+    def add(self, agent: str, url: str) -> Endpoint:
+        url = url.rstrip("/")
+        with self._lock:
+            endpoints = self._endpoints.setdefault(agent, [])
+            for endpoint in endpoints:
+                if endpoint.base_url == url:
+                    return endpoint
+            endpoint = Endpoint(agent, url)
+            # Copy on write: selection iterates the list without the lock
+            self._endpoints[agent] = endpoints + [endpoint]
+        log.info("Agent replica added", agent=agent, endpoint=url)
+        return endpoint
+
+    def remove(self, agent: str, url: str) -> None:
+        url = url.rstrip("/")
+        with self._lock:
+            self._endpoints[agent] = [e for e in self._endpoints.get(agent, []) if e.base_url != url]
+        log.info("Agent replica removed", agent=agent, endpoint=url)
+
+    def endpoints(self, agent: str) -> List[Endpoint]:
+        return self._endpoints.get(agent, [])
+
+    def select(self, agent: str, exclude: Sequence[Endpoint] = ()) -> Optional[Endpoint]:
+        """
+        The healthy replica with the fewest outstanding requests whose circuit admits a call
+        (ties broken at random, so idle replicas share the load).
+        """
+        self._ensure_checker()
+        candidates = [e for e in self.endpoints(agent) if e.healthy and e not in exclude]
+        for endpoint in sorted(candidates, key=lambda e: (e.outstanding, random.random())):
+            if endpoint.breaker.allow():
+                return endpoint
+        return None
+
+    def check_all(self) -> None:
+        """Health-check every replica once, taking failing replicas out of rotation and recovered ones back in."""
+        with self._lock:
+            endpoints = [e for agent_endpoints in self._endpoints.values() for e in agent_endpoints]
+        for endpoint in endpoints:
+            healthy = endpoint.check_health()
+            if healthy:
+                endpoint.failed_checks = 0
+                if not endpoint.healthy:
+                    self._set_healthy(endpoint, True)
+            else:
+                endpoint.failed_checks += 1
+                if endpoint.healthy and endpoint.failed_checks >= HEALTH_CHECK_FAILURES:
+                    self._set_healthy(endpoint, False)
+
+    @staticmethod
+    def _set_healthy(endpoint: Endpoint, healthy: bool) -> None:
+        endpoint.healthy = healthy
+        state = "healthy" if healthy else "unhealthy"
+        ENDPOINT_TRANSITIONS.inc(agent=endpoint.agent, endpoint=endpoint.base_url, state=state)
+        if healthy:
+            log.info("Agent replica back in rotation", agent=endpoint.agent, endpoint=endpoint.base_url)
+        else:
+            log.warning("Agent replica out of rotation", agent=endpoint.agent, endpoint=endpoint.base_url,
+                        failed_checks=endpoint.failed_checks)
+
+    def _ensure_checker(self) -> None:
+        """Start health checks on first use, so processes that never call an agent do not poll it."""
+        if self._checker is not None:
+            return
+        with self._lock:
+            if self._checker is None:
+                self._checker = threading.Thread(target=self._check_loop, name="agent-health", daemon=True)
+                self._checker.start()
+
+    def _check_loop(self) -> None:
+        while True:
+            time.sleep(self.check_interval)
+            try:
+                self.check_all()
+            except Exception as e:
+                log.exception("Health check failed", error=str(e))
+
+
+ENDPOINTS = EndpointRegistry()
+
+
+class LatencyWindow:
+    """Latencies of recent successful calls, for the hedge delay."""
+
+    def __init__(self, size: int = 200):
+        self._samples: Deque[float] = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, q: float) -> Optional[float]:
+        with self._lock:
+            if len(self._samples) < HEDGE_MIN_SAMPLES:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class AgentClient:
+    """Client of one agent's /process endpoint, balanced across its replicas."""
+
+    # Hedged calls run here; they are plain HTTP requests and never wait on each other
+    _pool = ThreadPoolExecutor(max_workers=32, thread_name_prefix="agent-call")
+
+    def __init__(self, name: str, urls: Sequence[str], timeout: float, hedge: bool = False,
+                 registry: Optional[EndpointRegistry] = None):
+        """
+        Args:
+            name: Agent name, for logs and metrics
+            urls: Base URLs of the agent's replicas, registered in the registry
+            timeout: Timeout of a call, shortened to the turn's remaining budget
+            hedge: Send slow calls to a second replica (only for requests that are safe to run twice)
+            registry: Endpoint registry (default: the process-wide ENDPOINTS)
+        """
+        self.name = name
+        self.timeout = timeout
+        self.hedge = hedge
+        self.registry = registry or ENDPOINTS
+        self.registry.register(name, urls)
+        self.latency = LatencyWindow()
+
+    @classmethod
+    def from_env(cls, name: str, default_url: str, timeout: float, hedge: bool = False) -> "AgentClient":
+        """
+        Client configured by <NAME>_URLS (comma-separated base URLs) and <NAME>_HEDGE (1/0).
+
+        Args:
+            name: Agent name, e.g. "field_service_agent" reads FIELD_SERVICE_AGENT_URLS
+        """
+        prefix = name.upper()
+        urls = [url.strip() for url in os.getenv(f"{prefix}_URLS", default_url).split(",") if url.strip()]
+        hedge = os.getenv(f"{prefix}_HEDGE", "1" if hedge else "0") == "1"
+        return cls(name, urls, timeout=timeout, hedge=hedge)
+
+    def process(self, payload: Dict[str, Any]) -> str:
+        """
+        Send a request to the agent's /process endpoint and return its reply text.
+        The trace, user and remaining deadline of the current turn are added to the payload.
+
+        Raises:
+            AgentUnavailableError: no replica is healthy with a closed circuit
+            AgentCallError: the agent answered with an error status
+            requests.RequestException: connection errors and timeouts
+        """
+        payload = dict(payload, trace=trace_context(), user=current_user(), deadline_ms=remaining_ms())
+        endpoint = self.registry.select(self.name)
+        if endpoint is None:
+            CIRCUIT_REJECTED.inc(agent=self.name)
+            raise AgentUnavailableError(self.name)
+        timeout = bounded_timeout(self.timeout)
+        if not self.hedge or len(self.registry.endpoints(self.name)) < 2:
+            return self._call(endpoint, payload, timeout)
+        return self._hedged(endpoint, payload, timeout)
+
+    def _call(self, endpoint: Endpoint, payload: Dict[str, Any], timeout: float) -> str:
+        started = time.perf_counter()
+        failed = True
+        endpoint.begin()
+        try:
+            response = self._post(endpoint, payload, timeout)
+            if response.status_code == 415 and (endpoint.codec, endpoint.encoding) != (JSON, IDENTITY):
+                log.info("Agent replica does not accept format, falling back to JSON", agent=self.name,
+                         endpoint=endpoint.base_url, codec=endpoint.codec, encoding=endpoint.encoding)
+                response.close()
+                endpoint.codec, endpoint.encoding = JSON, IDENTITY
+                response = self._post(endpoint, payload, timeout)
+            with response:
+                if response.status_code != 200:
+                    raise AgentCallError(self.name, response.status_code)
+                # The body is read as sent and decompressed here: urllib3 only removes the
+                # encodings it has a decoder for (zstd needs urllib3 2), and the others
+                # would reach the codec still compressed
+                body = response.raw.read(decode_content=False)
+                response_data = decode(body, response.headers.get("Content-Type"),
+                                       response.headers.get("Content-Encoding"))
+            failed = False
+        finally:
+            endpoint.end()
+            elapsed = time.perf_counter() - started
+            endpoint.breaker.record(elapsed, failed)
+            if not failed:
+                self.latency.add(elapsed)
+
+        # The agent server wraps text responses in {"message": "...", "status": "success"}
+        if isinstance(response_data, dict) and "message" in response_data:
+            return response_data["message"]
+        if isinstance(response_data, str):
+            return response_data
+        return str(response_data)
+
+    @staticmethod
+    def _post(endpoint: Endpoint, payload: Dict[str, Any], timeout: float) -> requests.Response:
+        body, headers = encode(payload, endpoint.codec, endpoint.encoding)
+        headers.update(accept_headers())
+        # Streamed, so the body can be read without urllib3's content decoding
+        return requests.post(f"{endpoint.base_url}/process", data=body, headers=headers, timeout=timeout,
+                             stream=True)
+
+    def hedge_delay(self) -> float:
+        p95 = self.latency.percentile(0.95)
+        return HEDGE_DEFAULT_DELAY if p95 is None else max(HEDGE_MIN_DELAY, p95)
+
+    def _hedged(self, primary: Endpoint, payload: Dict[str, Any], timeout: float) -> str:
+        """Call the primary replica; if it has not answered within the hedge delay, race it against another one."""
+        first = self._submit(primary, payload, timeout)
+        delay = self.hedge_delay()
+        done, _ = wait([first], timeout=min(delay, timeout))
+        if done:
+            return first.result()
+        secondary = self.registry.select(self.name, exclude=[primary])
+        if secondary is None:
+            return first.result()
+
+        log.debug("Hedging agent call", agent=self.name, delay_ms=round(delay * 1000), endpoint=secondary.base_url)
+        second = self._submit(secondary, payload, bounded_timeout(self.timeout))
+        pending = {first, second}
+        error: Optional[BaseException] = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    HEDGED_CALLS.inc(agent=self.name, winner="primary" if future is first else "hedge")
+                    # The slower request finishes in the background and still feeds its replica's breaker
+                    return future.result()
+                error = error or future.exception()
+        HEDGED_CALLS.inc(agent=self.name, winner="none")
+        raise error
+
+    def _submit(self, endpoint: Endpoint, payload: Dict[str, Any], timeout: float):
+        return self._pool.submit(contextvars.copy_context().run, self._call, endpoint, payload, timeout)
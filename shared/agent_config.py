@@ -0,0 +1,130 @@
+"""
+Agent configuration registry.
+
+Each agent is described once by an AgentSpec (model, description, prompt and
+tools), shared by the gemini-agents services and the ADK variants. For the
+gemini-agents the spec is compiled once per process into an AgentConfig: the
+system instruction, the function declarations derived from the tools'
+signatures and docstrings, and the GenerateContentConfig are built on first
+use and reused by every request.
+
+Tools are built once too. Per-request state (user role, history) is not
+captured in closures but read from shared.turn_context at call time.
+"""
+import threading
+from typing import Callable, Dict, Sequence
+
+from shared.prompts import load_prompt
+from shared.turn_context import append_turn_message, turn_history
+from tools.check_invoice_status import check_invoice_status
+from tools.communicate_with_human import make_communicate_with_human_tool
+from tools.field_service_agent import make_field_service_agent_tool
+from tools.find_customer import find_customer
+from tools.office_agent import make_office_agent_tool
+from tools.process_billing import process_billing
+
+
+class AgentSpec:
+    """Static description of an agent."""
+    __slots__ = ("name", "model", "description", "prompt_file", "tools")
+
+    def __init__(self, name: str, model: str, description: str, prompt_file: str, tools: Sequence[Callable]):
+        self.name = name
+        self.model = model
+        self.description = description
+        self.prompt_file = prompt_file
+        self.tools = list(tools)
+
+    @property
+    def instruction(self) -> str:
+        return load_prompt(self.prompt_file)
+
+
+class AgentConfig:
+    """An AgentSpec compiled for the google.genai SDK."""
+
+    def __init__(self, spec: AgentSpec):
+        from google.genai.types import (
+            AutomaticFunctionCallingConfig,
+            FunctionDeclaration,
+            GenerateContentConfig,
+            Tool,
+        )
+
+        self.spec = spec
+        self.model = spec.model
+        self.declarations = [
+            FunctionDeclaration.from_callable_with_api_option(callable=tool) for tool in spec.tools
+        ]
+        self.functions: Dict[str, Callable] = {
+            declaration.name: tool for declaration, tool in zip(self.declarations, spec.tools)
+        }
+        self.config = GenerateContentConfig(
+            system_instruction=spec.instruction,
+            tools=[Tool(function_declarations=self.declarations)] if self.declarations else None,
+            # Function calls are executed by shared.function_calling, from the declarations above
+            automatic_function_calling=AutomaticFunctionCallingConfig(disable=True)
+        )
+
+
+AGENT_SPECS: Dict[str, AgentSpec] = {
+    "orchestrator": AgentSpec(
+        name="orchestrator",
+        model="gemini-2.5-flash",
+        description=(
+            "Main orchestrator agent that coordinates between field service and office operations. "
+            "Routes user requests to the appropriate specialist agent based on the nature of the task."
+        ),
+        prompt_file="orchestrator_system_prompt.md",
+        tools=[
+            make_field_service_agent_tool(turn_history),
+            make_office_agent_tool(turn_history),
+            make_communicate_with_human_tool(append_turn_message),
+        ]
+    ),
+    "field_service": AgentSpec(
+        name="field_service_agent",
+        model="gemini-2.5-flash",
+        description=(
+            "Specialist agent for handling field service technician interactions. "
+            "Can look up customer information, check invoice statuses, and assist "
+            "technicians with job-related queries."
+        ),
+        prompt_file="field_service_system_prompt.md",
+        tools=[find_customer, check_invoice_status]
+    ),
+    "office": AgentSpec(
+        name="office_agent",
+        model="gemini-2.5-flash",
+        description=(
+            "Specialist agent for handling office and billing operations. "
+            "Processes billing rules, validates contracts, and manages goodwill approvals "
+            "according to company policies."
+        ),
+        prompt_file="office_system_prompt.md",
+        tools=[process_billing]
+    ),
+}
+
+_compiled: Dict[str, AgentConfig] = {}
+_compile_lock = threading.Lock()
+
+
+def get_agent_spec(name: str) -> AgentSpec:
+    return AGENT_SPECS[name]
+
+
+def get_agent_config(name: str) -> AgentConfig:
+    """
+    Compiled configuration of an agent, built on first use and cached for the process.
+
+    Args:
+        name: Registry key: "orchestrator", "field_service" or "office"
+    """
+    config = _compiled.get(name)
+    if config is None:
+        with _compile_lock:
+            config = _compiled.get(name)
+            if config is None:
+                config = _compiled[name] = AgentConfig(AGENT_SPECS[name])
+    return config
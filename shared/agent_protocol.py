@@ -0,0 +1,165 @@
+"""
+Wire format of the orchestrator -> agent /process exchange.
+
+Request and response bodies are encoded with a negotiated codec: msgpack
+when the msgpack package is installed, JSON otherwise (encoded with orjson
+when available). Bodies above COMPRESS_MIN_BYTES are compressed with zstd
+(zstandard package) or gzip. The client sends its preferred codec and
+encoding. A server that cannot decode them answers 415, and the client falls
+back to plain JSON for that server. Responses use the codec and encoding
+listed in the request's Accept and Accept-Encoding headers.
+
+Plain JSON requests without these headers remain valid, so curl and older
+clients keep working.
+"""
+import gzip
+import json
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+JSON = "application/json"
+MSGPACK = "application/msgpack"
+
+GZIP = "gzip"
+ZSTD = "zstd"
+IDENTITY = "identity"
+
+COMPRESS_MIN_BYTES = int(os.getenv("AGENT_COMPRESS_MIN_BYTES", "4096"))
+
+
+class UnsupportedFormatError(Exception):
+    """A body uses a codec or content encoding this process cannot decode."""
+
+
+def supported_codecs() -> List[str]:
+    """Codecs this process can encode and decode, preferred first."""
+    return ([MSGPACK] if msgpack is not None else []) + [JSON]
+
+
+def supported_encodings() -> List[str]:
+    """Compressions this process can apply and remove, preferred first."""
+    return ([ZSTD] if zstandard is not None else []) + [GZIP]
+
+
+def preferred_codec() -> str:
+    """Codec of outgoing requests: AGENT_CODEC (json|msgpack) if set and available, else the best available."""
+    configured = {"json": JSON, "msgpack": MSGPACK}.get(os.getenv("AGENT_CODEC", "").lower())
+    if configured in supported_codecs():
+        return configured
+    return supported_codecs()[0]
+
+
+def negotiate(accept: Optional[str], offered: List[str], default: str) -> str:
+    """First offered value listed in an Accept/Accept-Encoding header (quality values are ignored)."""
+    if not accept:
+        return default
+    accepted = [item.split(";")[0].strip().lower() for item in accept.split(",")]
+    for value in offered:
+        if value in accepted:
+            return value
+    return default
+
+
+def _media_type(content_type: Optional[str]) -> str:
+    return (content_type or JSON).split(";")[0].strip().lower()
+
+
+def dumps(obj: Any, codec: str = JSON) -> bytes:
+    if codec == MSGPACK:
+        if msgpack is None:
+            raise UnsupportedFormatError(codec)
+        return msgpack.packb(obj, use_bin_type=True, default=str)
+    if codec != JSON:
+        raise UnsupportedFormatError(codec)
+    if orjson is not None:
+        return orjson.dumps(obj, default=str)
+    return json.dumps(obj, default=str).encode("utf-8")
+
+
+def loads(body: bytes, codec: str = JSON) -> Any:
+    if codec == MSGPACK:
+        if msgpack is None:
+            raise UnsupportedFormatError(codec)
+        return msgpack.unpackb(body, raw=False)
+    if codec != JSON:
+        raise UnsupportedFormatError(codec)
+    return orjson.loads(body) if orjson is not None else json.loads(body)
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == ZSTD:
+        if zstandard is None:
+            raise UnsupportedFormatError(encoding)
+        return zstandard.ZstdCompressor(level=3).compress(body)
+    if encoding == GZIP:
+        return gzip.compress(body, compresslevel=5)
+    if encoding == IDENTITY:
+        return body
+    raise UnsupportedFormatError(encoding)
+
+
+def decompress(body: bytes, encoding: Optional[str]) -> bytes:
+    encoding = (encoding or IDENTITY).strip().lower()
+    if encoding == ZSTD:
+        if zstandard is None:
+            raise UnsupportedFormatError(encoding)
+        return zstandard.ZstdDecompressor().decompressobj().decompress(body)
+    if encoding == GZIP:
+        return gzip.decompress(body)
+    if encoding == IDENTITY:
+        return body
+    raise UnsupportedFormatError(encoding)
+
+
+def encode(obj: Any, codec: str, encoding: Optional[str] = None) -> Tuple[bytes, Dict[str, str]]:
+    """
+    Encode a body, compressing it when it is larger than COMPRESS_MIN_BYTES.
+
+    Args:
+        obj: Object to send
+        codec: Media type (JSON or MSGPACK)
+        encoding: Compression to use for large bodies (default: the best available)
+
+    Returns:
+        The body and its Content-Type/Content-Encoding headers
+    """
+    body = dumps(obj, codec)
+    headers = {"Content-Type": codec}
+    encoding = encoding or supported_encodings()[0]
+    if encoding != IDENTITY and len(body) >= COMPRESS_MIN_BYTES:
+        body = compress(body, encoding)
+        headers["Content-Encoding"] = encoding
+    return body, headers
+
+
+def decode(body: bytes, content_type: Optional[str], content_encoding: Optional[str] = None) -> Any:
+    """
+    Decode a body from its Content-Type and Content-Encoding headers.
+
+    Raises:
+        UnsupportedFormatError: unknown or unavailable codec or compression
+    """
+    return loads(decompress(body, content_encoding), _media_type(content_type))
+
+
+def accept_headers() -> Dict[str, str]:
+    """Accept and Accept-Encoding headers listing what this process can decode."""
+    return {
+        "Accept": ", ".join(supported_codecs()),
+        "Accept-Encoding": ", ".join(supported_encodings() + [IDENTITY]),
+    }
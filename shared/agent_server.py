@@ -2,13 +2,31 @@
 Reusable HTTP server framework for AI agents.
 Provides standard endpoints and structure for agent services.
 """
-import json
 
-from fastapi import FastAPI, Request
-from fastapi.responses import JSONResponse
-from typing import Dict, Callable, Optional
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from typing import Any, Dict, Callable, Optional, Iterator
 import uvicorn
 
+from shared import metrics
+from shared.agent_protocol import (
+    IDENTITY,
+    JSON,
+    UnsupportedFormatError,
+    decode,
+    encode,
+    negotiate,
+    supported_codecs,
+    supported_encodings,
+)
+from shared.deadline import deadline_from_ms, deadline_scope
+from shared.log import get_logger
+from shared.single_flight import SingleFlight, canonical_key
+from shared.streaming import sse_event
+from shared.tracing import continue_trace, iter_in_trace, set_service_name
+from shared.usage import USAGE, is_admin_request, user_context
+
 
 class AgentServer:
     """
@@ -19,15 +37,28 @@ class AgentServer:
     def __init__(
             self,
             agent_name: str,
-            request_callback: Callable[[str], str],
-            port: int = 8010
+            request_callback: Callable[[Dict[str, Any]], str],
+            port: int = 8010,
+            stream_callback: Optional[Callable[[Dict[str, Any]], Iterator[str]]] = None
     ):
         """
         Initialize agent server.
+
+        Args:
+            agent_name: Display name of the agent
+            request_callback: Handler returning the full response for a request (the decoded payload)
+            port: Port to listen on
+            stream_callback: Optional handler yielding response text chunks,
+                             enables the /process_stream endpoint
         """
         self.agent_name = agent_name
         self.request_callback = request_callback
+        self.stream_callback = stream_callback
         self.port = port
+        self.log = get_logger(f"agent_server.{agent_name}")
+        # Identical requests in flight (e.g. from a redelivered message) are processed once
+        self.flights = SingleFlight(f"{agent_name}.process")
+        set_service_name(agent_name)
 
         # Create FastAPI app
         self.app = FastAPI(
@@ -49,8 +80,11 @@ class AgentServer:
                 "status": "running",
                 "endpoints": {
                     "POST /process": "Process a message",
+                    "POST /process_stream": "Process a message, streaming the response as SSE (if supported)",
                     "POST /process_job": "Process job data (if supported)",
-                    "GET /health": "Health check"
+                    "GET /health": "Health check",
+                    "GET /metrics": "Prometheus metrics",
+                    "GET /admin/usage": "Token and latency usage per day, user and agent"
                 }
             }
 
@@ -62,14 +96,109 @@ class AgentServer:
                 "agent": self.agent_name
             }
 
+        @self.app.get("/metrics")
+        async def metrics_endpoint():
+            """Prometheus metrics, including span latency histograms."""
+            return Response(content=metrics.REGISTRY.render(), media_type=metrics.CONTENT_TYPE)
+
+        @self.app.get("/admin/usage")
+        async def usage_endpoint(
+                request: Request,
+                day: Optional[str] = None,
+                user: Optional[str] = None,
+                agent: Optional[str] = None
+        ):
+            """Token and latency rollups of this agent's Gemini calls."""
+            if not is_admin_request(request.headers.get("Authorization")):
+                return JSONResponse(status_code=401, content={"error": "Unauthorized"})
+            return USAGE.report(day=day, user=user, agent=agent)
+
         @self.app.post("/process")
         async def process_message(request: Request):
             """Process a message from the orchestrator"""
-            data = await request.json()
-            print(f"[{self.agent_name}] Received message {data}")
-            # Call handler
-            response = self.request_callback(json.dumps(data))
-            return JSONResponse(content=response)
+            try:
+                data = await self._decode_request(request)
+            except UnsupportedFormatError as e:
+                return JSONResponse(status_code=415, content={"error": f"Unsupported format: {e}"})
+            trace = data.pop("trace", None)
+            user = data.pop("user", None)
+            # Remaining budget of the caller's turn, converted to this process's clock on arrival
+            deadline = deadline_from_ms(data.pop("deadline_ms", None))
+            self.log.debug("Received message", data=data)
+
+            key = canonical_key(user, data)
+
+            def handle():
+                with continue_trace(trace, f"{self.agent_name}.process"), user_context(user), deadline_scope(at=deadline):
+                    return self.flights.do(key, self.request_callback, data)
+
+            # Call handler in a worker thread: the blocking model calls must not stall the event loop,
+            # which keeps serving /health while requests are in progress
+            response = await run_in_threadpool(handle)
+            return self._encode_response(request, response)
+
+        @self.app.post("/process_stream")
+        async def process_message_stream(request: Request):
+            """Process a message from the orchestrator, streaming text chunks as server-sent events"""
+            if self.stream_callback is None:
+                return JSONResponse(
+                    status_code=404,
+                    content={"error": f"{self.agent_name} does not support streaming"}
+                )
+
+            try:
+                data = await self._decode_request(request)
+            except UnsupportedFormatError as e:
+                return JSONResponse(status_code=415, content={"error": f"Unsupported format: {e}"})
+            trace = data.pop("trace", None)
+            user = data.pop("user", None)
+            deadline = deadline_from_ms(data.pop("deadline_ms", None))
+            self.log.debug("Received streaming message", data=data)
+            chunks = iter_in_trace(
+                trace,
+                f"{self.agent_name}.process_stream",
+                self._iter_as_user(user, deadline, self.stream_callback(data))
+            )
+
+            def event_stream():
+                # Sync generator: Starlette iterates it in a worker thread,
+                # so the blocking model stream does not stall the event loop
+                full_text = []
+                try:
+                    for chunk in chunks:
+                        full_text.append(chunk)
+                        yield sse_event({"delta": chunk})
+                except Exception as e:
+                    self.log.exception("Stream error", error=str(e))
+                    yield sse_event({"error": str(e)}, event="error")
+                    return
+                yield sse_event({"message": "".join(full_text)}, event="done")
+
+            return StreamingResponse(
+                event_stream(),
+                media_type="text/event-stream",
+                headers={"Cache-Control": "no-cache"}
+            )
+
+    @staticmethod
+    async def _decode_request(request: Request) -> Dict[str, Any]:
+        """Request body in the codec and compression given by its Content-Type and Content-Encoding."""
+        return decode(await request.body(), request.headers.get("Content-Type"),
+                      request.headers.get("Content-Encoding"))
+
+    @staticmethod
+    def _encode_response(request: Request, content: Any) -> Response:
+        """Response body in the best codec and compression the client accepts (plain JSON by default)."""
+        codec = negotiate(request.headers.get("Accept"), supported_codecs(), JSON)
+        encoding = negotiate(request.headers.get("Accept-Encoding"), supported_encodings(), IDENTITY)
+        body, headers = encode(content, codec, encoding)
+        return Response(content=body, headers=headers)
+
+    @staticmethod
+    def _iter_as_user(user: Optional[str], deadline: Optional[float], chunks: Iterator[str]) -> Iterator[str]:
+        """Attribute the model calls made while streaming to the requesting user, within the caller's deadline."""
+        with user_context(user), deadline_scope(at=deadline):
+            yield from chunks
 
     def run(self, host: str = "0.0.0.0"):
         """
@@ -78,13 +207,11 @@ class AgentServer:
         Args:
             host: Host to bind to (default: 0.0.0.0 for all interfaces)
         """
-        print(f"\n{'=' * 60}")
-        print(f"🚀 {self.agent_name} Agent Server Starting")
-        print(f"{'=' * 60}")
-        print(f"   Port: {self.port}")
-        print(f"   URL: http://localhost:{self.port}")
-        print(f"   Docs: http://localhost:{self.port}/docs")
-        print(f"{'=' * 60}\n")
+        self.log.info(
+            "🚀 Agent server starting",
+            url=f"http://localhost:{self.port}",
+            docs=f"http://localhost:{self.port}/docs"
+        )
 
         uvicorn.run(
             self.app,
@@ -96,8 +223,9 @@ class AgentServer:
 
 def create_agent_server(
         agent_name: str,
-        request_callback: Callable[[str], str],
-        port: int
+        request_callback: Callable[[Dict[str, Any]], str],
+        port: int,
+        stream_callback: Optional[Callable[[Dict[str, Any]], Iterator[str]]] = None
 ) -> AgentServer:
     """
     Helper to create an agent server from an agent class.
@@ -106,5 +234,6 @@ def create_agent_server(
     return AgentServer(
         agent_name=agent_name,
         request_callback=request_callback,
-        port=port
+        port=port,
+        stream_callback=stream_callback
     )
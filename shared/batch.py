@@ -0,0 +1,344 @@
+"""
+Offline batch execution of agent requests.
+
+Re-running many stored requests through an agent (e.g. all jobs after a price
+list change) does not need interactive latency. A BatchRun submits the model
+calls of all requests as one job to the Gemini Batch API, which is cheaper
+per token and not subject to the interactive rate limits, and waits for it.
+
+Function calling works round by round: when responses contain function
+calls, the tools are executed locally (shared.function_calling.call_tools)
+and the requests that need another model call are submitted as the next
+job, until every request has a final answer or max_iterations is reached.
+
+Progress is saved to a JSON state file after every step (submitted job,
+per-request status, results), so an interrupted run resumes by polling its
+job instead of submitting it again.
+
+LocalBatchBackend is a stand-in for tests and load tests: it runs the same
+requests with interactive generate_content calls in a thread pool (pointed
+at the fake Gemini server via GEMINI_BASE_URL).
+"""
+import itertools
+import json
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import TYPE_CHECKING, Any, Dict, Iterable, List, Optional, Tuple
+
+from shared.agent_config import AgentConfig
+from shared.function_calling import DEFAULT_MAX_ITERATIONS, as_contents, call_tools, split_parts
+from shared.log import get_logger
+from shared.metrics import REGISTRY
+from shared.usage import user_context
+
+if TYPE_CHECKING:
+    from google.genai.types import Content, GenerateContentResponse
+
+log = get_logger("batch")
+
+BATCH_REQUESTS = REGISTRY.counter(
+    "batch_requests_total",
+    "Requests finished by batch runs, by outcome (done, failed)",
+    labelnames=("agent", "outcome")
+)
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+# Result of one request of a job: the response, or an error message
+BatchResult = Tuple[Optional["GenerateContentResponse"], Optional[str]]
+
+
+class BatchJobError(Exception):
+    """A batch job ended without results (failed, cancelled or expired)."""
+
+
+class BatchJobLost(Exception):
+    """The backend does not know the job (e.g. a local job after a restart)."""
+
+
+class GeminiBatchBackend:
+    """Gemini Batch API with inline requests."""
+    name = "gemini"
+
+    _TERMINAL = {"JOB_STATE_SUCCEEDED", "JOB_STATE_PARTIALLY_SUCCEEDED", "JOB_STATE_FAILED",
+                 "JOB_STATE_CANCELLED", "JOB_STATE_EXPIRED"}
+    _SUCCEEDED = {"JOB_STATE_SUCCEEDED", "JOB_STATE_PARTIALLY_SUCCEEDED"}
+
+    def __init__(self, client):
+        self.client = client
+
+    def submit(self, agent: AgentConfig, requests: List[List["Content"]], display_name: str) -> str:
+        from google.genai.types import InlinedRequest
+
+        # Function calls are executed by BatchRun, not the SDK
+        config = agent.config.model_copy(update={"automatic_function_calling": None})
+        job = self.client.batches.create(
+            model=agent.model,
+            src=[InlinedRequest(contents=contents, config=config) for contents in requests],
+            config={"display_name": display_name}
+        )
+        return job.name
+
+    def poll(self, job_name: str) -> Optional[List[BatchResult]]:
+        """Results in request order once the job has finished, None while it is running."""
+        job = self.client.batches.get(name=job_name)
+        state = job.state.name if job.state else "JOB_STATE_UNSPECIFIED"
+        if state not in self._TERMINAL:
+            return None
+        if state not in self._SUCCEEDED:
+            raise BatchJobError(f"{job_name}: {state} {job.error or ''}".strip())
+        return [
+            (item.response, str(item.error) if item.error else None)
+            for item in (job.dest.inlined_responses or [])
+        ]
+
+
+class LocalBatchBackend:
+    """Runs batch jobs in this process with interactive calls; for tests and load tests."""
+    name = "local"
+
+    def __init__(self, client, max_workers: int = 8):
+        self.client = client
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="local-batch")
+        self._jobs: Dict[str, List[Future]] = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def submit(self, agent: AgentConfig, requests: List[List["Content"]], display_name: str) -> str:
+        with self._lock:
+            job_name = f"local-batches/{display_name}-{next(self._ids)}"
+            self._jobs[job_name] = [self._pool.submit(self._generate, agent, contents) for contents in requests]
+        return job_name
+
+    def poll(self, job_name: str) -> Optional[List[BatchResult]]:
+        with self._lock:
+            futures = self._jobs.get(job_name)
+        if futures is None:
+            raise BatchJobLost(job_name)
+        if not all(future.done() for future in futures):
+            return None
+        with self._lock:
+            del self._jobs[job_name]
+        return [future.result() for future in futures]
+
+    def _generate(self, agent: AgentConfig, contents: List["Content"]) -> BatchResult:
+        try:
+            return self.client.models.generate_content(model=agent.model, contents=contents, config=agent.config), None
+        except Exception as e:
+            return None, str(e)
+
+
+class BatchItem:
+    """One request of a batch run."""
+    __slots__ = ("id", "request", "user", "contents", "status", "text", "error", "iterations")
+
+    def __init__(self, item_id: str, request: Dict[str, Any], contents: List["Content"], user: Optional[str] = None):
+        self.id = item_id
+        # The original request, written back with the result
+        self.request = request
+        # Tool calls and their Gemini usage are attributed to this user
+        self.user = user
+        # Conversation so far: the prompt, then model function calls and tool results
+        self.contents = contents
+        self.status = PENDING
+        self.text: Optional[str] = None
+        self.error: Optional[str] = None
+        self.iterations = 0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "request": self.request,
+            "user": self.user,
+            "contents": [content.model_dump(mode="json", exclude_none=True) for content in self.contents],
+            "status": self.status,
+            "text": self.text,
+            "error": self.error,
+            "iterations": self.iterations
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "BatchItem":
+        from google.genai.types import Content
+
+        item = cls(data["id"], data.get("request") or {}, [Content.model_validate(c) for c in data["contents"]],
+                   data.get("user"))
+        item.status = data["status"]
+        item.text = data.get("text")
+        item.error = data.get("error")
+        item.iterations = data.get("iterations", 0)
+        return item
+
+
+class BatchRun:
+    """Requests of one agent, run through a batch backend round by round, with state saved to a file."""
+
+    def __init__(self, agent: AgentConfig, backend, state_path: str,
+                 max_iterations: int = DEFAULT_MAX_ITERATIONS):
+        """
+        Args:
+            agent: Compiled agent configuration (model, instruction, tools)
+            backend: GeminiBatchBackend or LocalBatchBackend
+            state_path: JSON file with the run's progress; an existing file is resumed
+            max_iterations: Model calls per request, as in the interactive function-calling loop
+        """
+        self.agent = agent
+        self.backend = backend
+        self.state_path = state_path
+        self.max_iterations = max_iterations
+        self.items: Dict[str, BatchItem] = {}
+        self.round = 0
+        self.job: Optional[str] = None
+        if os.path.exists(state_path):
+            self._load()
+
+    @property
+    def resumed(self) -> bool:
+        return bool(self.items)
+
+    def add(self, item_id: str, request: Dict[str, Any], prompt: Any, user: Optional[str] = None) -> None:
+        """Add a request; prompt is the model input (string or list of Content), user the one it runs for."""
+        if item_id in self.items:
+            raise ValueError(f"Duplicate batch request id: {item_id}")
+        self.items[item_id] = BatchItem(item_id, request, as_contents(prompt), user)
+
+    def counts(self) -> Dict[str, int]:
+        counts = {PENDING: 0, RUNNING: 0, DONE: 0, FAILED: 0}
+        for item in self.items.values():
+            counts[item.status] += 1
+        return counts
+
+    def run(self, poll_interval: float = 30.0) -> List[BatchItem]:
+        """Submit and poll jobs until every request is done or failed; returns the items."""
+        self._save()
+        while True:
+            if self.job is None:
+                pending = [item for item in self.items.values() if item.status == PENDING]
+                if not pending:
+                    break
+                self._submit(pending)
+            results = self._wait(poll_interval)
+            if results is None:
+                # Job lost: its requests are submitted again
+                continue
+            self._apply(results)
+        log.info("Batch run finished", agent=self.agent.spec.name, rounds=self.round, **self.counts())
+        return list(self.items.values())
+
+    def _submit(self, pending: List[BatchItem]) -> None:
+        self.round += 1
+        self.job = self.backend.submit(
+            self.agent, [item.contents for item in pending], f"{self.agent.spec.name}-round-{self.round}"
+        )
+        for item in pending:
+            item.status = RUNNING
+        self._save()
+        log.info("Submitted batch job", job=self.job, round=self.round, requests=len(pending))
+
+    def _wait(self, poll_interval: float) -> Optional[List[BatchResult]]:
+        while True:
+            try:
+                results = self.backend.poll(self.job)
+            except BatchJobLost:
+                log.warning("Batch job lost, resubmitting", job=self.job)
+                self._reset_running()
+                return None
+            except BatchJobError as e:
+                log.error("Batch job failed", job=self.job, error=str(e))
+                results = [(None, str(e))] * len(self._running())
+            if results is not None:
+                return results
+            time.sleep(poll_interval)
+
+    def _running(self) -> List[BatchItem]:
+        return [item for item in self.items.values() if item.status == RUNNING]
+
+    def _reset_running(self) -> None:
+        for item in self._running():
+            item.status = PENDING
+        self.job = None
+        self._save()
+
+    def _apply(self, results: List[BatchResult]) -> None:
+        from google.genai.types import Content, Part
+
+        running = self._running()
+        if len(results) != len(running):
+            raise BatchJobError(f"{self.job}: {len(results)} results for {len(running)} requests")
+
+        needs_tools: List[Tuple[BatchItem, Content, list]] = []
+        for item, (response, error) in zip(running, results):
+            item.iterations += 1
+            if error is not None or response is None:
+                self._finish(item, FAILED, error=error or "empty result")
+                continue
+            content = response.candidates[0].content if response.candidates else None
+            texts, calls = split_parts(content.parts or []) if content is not None else ([], [])
+            if calls and item.iterations < self.max_iterations:
+                needs_tools.append((item, content, calls))
+            else:
+                if calls:
+                    log.warning("Batch request hit max iterations", id=item.id, max_iterations=self.max_iterations)
+                self._finish(item, DONE, text="".join(texts))
+
+        # Tools of all requests run here, as they would in the interactive loop
+        for item, content, calls in needs_tools:
+            with user_context(item.user):
+                responses = call_tools(self.agent, calls)
+            item.contents.append(content)
+            item.contents.append(Content(role="user", parts=[
+                Part.from_function_response(name=call.name, response=response)
+                for call, response in zip(calls, responses)
+            ]))
+            item.status = PENDING
+
+        self.job = None
+        self._save()
+
+    def _finish(self, item: BatchItem, status: str, text: Optional[str] = None, error: Optional[str] = None) -> None:
+        item.status = status
+        item.text = text
+        item.error = error
+        BATCH_REQUESTS.inc(agent=self.agent.spec.name, outcome=status)
+
+    def _save(self) -> None:
+        state = {
+            "agent": self.agent.spec.name,
+            "backend": self.backend.name,
+            "round": self.round,
+            "job": self.job,
+            "items": [item.to_dict() for item in self.items.values()]
+        }
+        tmp_path = f"{self.state_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.state_path)
+
+    def _load(self) -> None:
+        with open(self.state_path, encoding="utf-8") as f:
+            state = json.load(f)
+        if state.get("agent") != self.agent.spec.name:
+            raise ValueError(f"{self.state_path} belongs to agent {state.get('agent')}, not {self.agent.spec.name}")
+        self.round = state.get("round", 0)
+        self.job = state.get("job")
+        self.items = {data["id"]: BatchItem.from_dict(data) for data in state.get("items", [])}
+        log.info("Resuming batch run", path=self.state_path, job=self.job, **self.counts())
+
+
+def write_results(items: Iterable[BatchItem], path: str) -> None:
+    """Write one JSON line per request: id, status, text, error and the original request."""
+    with open(path, "w", encoding="utf-8") as f:
+        for item in items:
+            f.write(json.dumps({
+                "id": item.id,
+                "status": item.status,
+                "text": item.text,
+                "error": item.error,
+                "iterations": item.iterations,
+                "request": item.request
+            }) + "\n")
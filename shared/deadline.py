@@ -0,0 +1,133 @@
+"""
+End-to-end deadlines for user turns.
+
+The webhook sets a latency budget (TURN_BUDGET_SECONDS) when a message arrives.
+The deadline lives in a context variable and follows the turn through the
+orchestrator, the agent tools and, as the remaining budget in milliseconds in
+the "deadline_ms" field of the /process payload, into the agent servers.
+Every model call, HTTP call and tool call bounds its timeout by what is left,
+and no new work is started once the budget is spent, so the user gets a fast,
+honest reply instead of a long wait.
+"""
+import contextvars
+import os
+import time
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+from shared.metrics import REGISTRY
+
+TURN_BUDGET_SECONDS = float(os.getenv("TURN_BUDGET_SECONDS", "45"))
+
+DEADLINE_EXCEEDED = REGISTRY.counter(
+    "deadline_exceeded_total",
+    "Work skipped or cut short because the turn's latency budget was spent",
+    labelnames=("stage",)
+)
+
+# Absolute deadline on the time.monotonic() clock
+_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("deadline", default=None)
+
+
+class DeadlineExceeded(TimeoutError):
+    """The turn's latency budget is spent."""
+
+    def __init__(self, stage: str):
+        super().__init__(f"Turn deadline exceeded before {stage}")
+        self.stage = stage
+        DEADLINE_EXCEEDED.inc(stage=stage)
+
+
+@contextmanager
+def deadline_scope(seconds: Optional[float] = None, at: Optional[float] = None) -> Iterator[None]:
+    """
+    Run a block under a deadline. A tighter enclosing deadline is kept.
+
+    Args:
+        seconds: Budget from now
+        at: Absolute deadline on the time.monotonic() clock
+    """
+    if at is None and seconds is not None:
+        at = time.monotonic() + seconds
+    current = _deadline.get()
+    if at is None or (current is not None and current <= at):
+        at = current
+    token = _deadline.set(at)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def deadline_from_ms(remaining_ms: Optional[float]) -> Optional[float]:
+    """Absolute deadline for a remaining budget received from another service (None if there is none)."""
+    if remaining_ms is None:
+        return None
+    return time.monotonic() + float(remaining_ms) / 1000
+
+
+def remaining() -> Optional[float]:
+    """Seconds left in the active deadline (None without a deadline)."""
+    at = _deadline.get()
+    return None if at is None else at - time.monotonic()
+
+
+def remaining_ms() -> Optional[int]:
+    """Remaining budget for the "deadline_ms" field of outgoing payloads."""
+    left = remaining()
+    return None if left is None else max(0, int(left * 1000))
+
+
+def expired() -> bool:
+    left = remaining()
+    return left is not None and left <= 0
+
+
+def check(stage: str) -> None:
+    """Raise DeadlineExceeded if the budget is spent, before starting the given stage."""
+    if expired():
+        raise DeadlineExceeded(stage)
+
+
+@contextmanager
+def guard(stage: str) -> Iterator[None]:
+    """
+    Run a stage of the turn: refuse to start it once the budget is spent, and
+    report a failure caused by the budget running out (e.g. a client timeout
+    set by bounded_timeout() or http_options()) as DeadlineExceeded.
+    """
+    check(stage)
+    try:
+        yield
+    except DeadlineExceeded:
+        raise
+    except Exception as e:
+        if expired():
+            raise DeadlineExceeded(stage) from e
+        raise
+
+
+def bounded_timeout(cap: float, floor: float = 0.0) -> float:
+    """
+    Timeout for a blocking call: the cap, shortened to the remaining budget.
+
+    Args:
+        cap: Timeout used without a deadline
+        floor: Minimum timeout, for calls that must still go out late (e.g. the reply to the user)
+    """
+    left = remaining()
+    if left is None:
+        return cap
+    return max(floor, min(cap, left))
+
+
+def http_options(cap: Optional[float] = None):
+    """HttpOptions bounding a Gemini call by the remaining budget (None when unbounded)."""
+    left = remaining()
+    if left is None and cap is None:
+        return None
+    from google.genai.types import HttpOptions
+
+    timeout = left if cap is None else bounded_timeout(cap)
+    # The SDK takes milliseconds
+    return HttpOptions(timeout=max(1, int(timeout * 1000)))
@@ -0,0 +1,251 @@
+"""
+Delivery tracking for outbound WhatsApp messages.
+
+Every message sent through WhatsAppClient.send is recorded under the message
+id the Cloud API returns. The statuses webhook (sent, delivered, read,
+failed) is joined with these records, which gives:
+
+- send -> status latencies, exported as the whatsapp_delivery_seconds
+  histogram and as percentiles per recipient
+- automatic retries of failed sends (up to DELIVERY_MAX_RETRIES, with
+  exponential backoff from DELIVERY_RETRY_DELAY), except for errors that a
+  retry cannot fix
+- delivery health per recipient, served by /admin/deliveries
+
+Records are kept in memory, the newest DELIVERY_MAX_RECORDS. Status updates
+for messages this process did not send (another replica, or a restart) are
+counted but not joined.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, List, Optional
+
+from shared.log import get_logger
+from shared.metrics import REGISTRY
+
+log = get_logger("delivery")
+
+MAX_RECORDS = int(os.getenv("DELIVERY_MAX_RECORDS", "10000"))
+MAX_RETRIES = int(os.getenv("DELIVERY_MAX_RETRIES", "2"))
+RETRY_DELAY = float(os.getenv("DELIVERY_RETRY_DELAY", "5"))
+# Share of failed messages among a recipient's recent outcomes above which it is reported as degraded
+DEGRADED_FAILURE_RATE = float(os.getenv("DELIVERY_DEGRADED_FAILURE_RATE", "0.2"))
+
+# Cloud API error codes a resend cannot fix: undeliverable number, outside the
+# 24h customer service window, unsupported message type
+NON_RETRYABLE_ERRORS = frozenset({131026, 131047, 131051})
+
+STATUSES = ("sent", "delivered", "read", "failed")
+
+DELIVERY_SECONDS = REGISTRY.histogram(
+    "whatsapp_delivery_seconds",
+    "Time from sending a WhatsApp message to its status update",
+    labelnames=("status",),
+    buckets=(0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0, 3600.0)
+)
+STATUS_UPDATES = REGISTRY.counter(
+    "whatsapp_status_updates_total",
+    "WhatsApp status updates by status; joined=false for messages this process has no record of",
+    labelnames=("status", "joined")
+)
+DELIVERY_RETRIES = REGISTRY.counter(
+    "whatsapp_delivery_retries_total",
+    "Resends of failed WhatsApp messages by outcome (sent, error, skipped)",
+    labelnames=("outcome",)
+)
+
+
+def _percentile(samples: List[float], q: float) -> Optional[float]:
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 3)
+
+
+class SendRecord:
+    """One outbound message and the statuses reported for it."""
+    __slots__ = ("message_id", "to", "message", "buttons", "sent_at", "statuses", "errors", "attempt", "retry_of")
+
+    def __init__(self, message_id: str, to: str, message: str, buttons: Optional[List[Dict]],
+                 sent_at: float, attempt: int = 0, retry_of: Optional[str] = None):
+        self.message_id = message_id
+        self.to = to
+        self.message = message
+        self.buttons = buttons
+        self.sent_at = sent_at
+        # Status -> time it was reported (unix seconds)
+        self.statuses: Dict[str, float] = {}
+        self.errors: List[Dict] = []
+        self.attempt = attempt
+        self.retry_of = retry_of
+
+
+class _RecipientStats:
+    __slots__ = ("counts", "latencies", "outcomes", "last_error")
+
+    def __init__(self, window: int = 100):
+        self.counts: Dict[str, int] = {status: 0 for status in ("sent_by_us",) + STATUSES}
+        self.latencies: Dict[str, Deque[float]] = {status: deque(maxlen=window) for status in ("delivered", "read")}
+        # Recent outcomes: True delivered, False failed
+        self.outcomes: Deque[bool] = deque(maxlen=window)
+        self.last_error: Optional[Dict] = None
+
+
+class DeliveryTracker:
+    """Outbound send records joined with status webhooks."""
+
+    def __init__(self, max_records: int = MAX_RECORDS, max_retries: int = MAX_RETRIES,
+                 retry_delay: float = RETRY_DELAY, client=None):
+        """
+        Args:
+            max_records: Send records kept (oldest are dropped first)
+            max_retries: Resends of a failed message
+            retry_delay: Delay before the first resend, doubled for each further one
+            client: WhatsAppClient used for resends (default: created on the first resend)
+        """
+        self.max_records = max_records
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self._client = client
+        self._lock = threading.Lock()
+        self._records: "OrderedDict[str, SendRecord]" = OrderedDict()
+        self._recipients: Dict[str, _RecipientStats] = {}
+
+    def record_send(self, message_id: Optional[str], to: str, message: str,
+                    buttons: Optional[List[Dict]] = None) -> None:
+        """Record a message accepted by the Cloud API."""
+        if not message_id:
+            return
+        with self._lock:
+            self._records[message_id] = SendRecord(message_id, to, message, buttons, time.time())
+            while len(self._records) > self.max_records:
+                self._records.popitem(last=False)
+            self._stats(to).counts["sent_by_us"] += 1
+
+    def record_status(self, status: Dict[str, Any]) -> None:
+        """
+        Join one entry of a statuses webhook with its send record.
+
+        Args:
+            status: {"id": wamid, "status": ..., "timestamp": unix seconds, "recipient_id": ..., "errors": [...]}
+        """
+        message_id = status.get("id")
+        status_type = status.get("status")
+        if status_type not in STATUSES:
+            return
+        try:
+            reported_at = float(status.get("timestamp") or time.time())
+        except (TypeError, ValueError):
+            reported_at = time.time()
+
+        retry = None
+        with self._lock:
+            record = self._records.get(message_id)
+            STATUS_UPDATES.inc(status=status_type, joined=str(record is not None).lower())
+            recipient = record.to if record is not None else status.get("recipient_id")
+            if not recipient:
+                return
+            stats = self._stats(recipient)
+            if record is not None and status_type in record.statuses:
+                # Redelivered webhook
+                return
+            stats.counts[status_type] += 1
+            if record is None:
+                return
+
+            record.statuses[status_type] = reported_at
+            latency = max(0.0, reported_at - record.sent_at)
+            if status_type in stats.latencies:
+                stats.latencies[status_type].append(latency)
+            DELIVERY_SECONDS.observe(latency, status=status_type)
+            if status_type == "delivered":
+                stats.outcomes.append(True)
+            elif status_type == "failed":
+                stats.outcomes.append(False)
+                record.errors = status.get("errors") or []
+                stats.last_error = {"message_id": message_id, "at": reported_at, "errors": record.errors}
+                retry = record
+
+        if retry is not None:
+            self._schedule_retry(retry)
+
+    def _schedule_retry(self, record: SendRecord) -> None:
+        codes = {error.get("code") for error in record.errors}
+        if record.attempt >= self.max_retries or codes & NON_RETRYABLE_ERRORS:
+            DELIVERY_RETRIES.inc(outcome="skipped")
+            log.warning("WhatsApp message failed, not retrying", message_id=record.message_id, to=record.to,
+                        attempt=record.attempt, errors=record.errors)
+            return
+        delay = self.retry_delay * 2 ** record.attempt
+        log.info("WhatsApp message failed, retrying", message_id=record.message_id, to=record.to,
+                 attempt=record.attempt + 1, delay=delay)
+        timer = threading.Timer(delay, self._retry, args=(record,))
+        timer.daemon = True
+        timer.start()
+
+    def _retry(self, record: SendRecord) -> None:
+        try:
+            if self._client is None:
+                from shared.whatsapp_client import WhatsAppClient
+                self._client = WhatsAppClient()
+            response = self._client.send(record.to, record.message, buttons=record.buttons)
+        except Exception as e:
+            DELIVERY_RETRIES.inc(outcome="error")
+            log.error("Retry of WhatsApp message failed", message_id=record.message_id, error=str(e))
+            return
+        DELIVERY_RETRIES.inc(outcome="sent")
+        new_id = message_id_of(response)
+        with self._lock:
+            resent = self._records.get(new_id)
+            if resent is not None:
+                resent.attempt = record.attempt + 1
+                resent.retry_of = record.message_id
+
+    def get(self, message_id: str) -> Optional[SendRecord]:
+        with self._lock:
+            return self._records.get(message_id)
+
+    def report(self, recipient: Optional[str] = None) -> Dict[str, Any]:
+        """Delivery counts, latency percentiles (seconds) and health per recipient."""
+        with self._lock:
+            recipients = {
+                to: self._recipient_report(stats)
+                for to, stats in self._recipients.items()
+                if recipient is None or to == recipient
+            }
+        return {"recipients": recipients}
+
+    def _stats(self, to: str) -> _RecipientStats:
+        stats = self._recipients.get(to)
+        if stats is None:
+            stats = self._recipients[to] = _RecipientStats()
+        return stats
+
+    @staticmethod
+    def _recipient_report(stats: _RecipientStats) -> Dict[str, Any]:
+        failure_rate = stats.outcomes.count(False) / len(stats.outcomes) if stats.outcomes else 0.0
+        return {
+            "counts": dict(stats.counts),
+            "latency": {
+                status: {
+                    "p50": _percentile(list(samples), 0.5),
+                    "p95": _percentile(list(samples), 0.95),
+                    "p99": _percentile(list(samples), 0.99)
+                }
+                for status, samples in stats.latencies.items()
+            },
+            "failure_rate": round(failure_rate, 3),
+            "health": "degraded" if failure_rate > DEGRADED_FAILURE_RATE else "healthy",
+            "last_error": stats.last_error
+        }
+
+
+def message_id_of(response: Optional[Dict]) -> Optional[str]:
+    """Message id of a Cloud API send response."""
+    messages = (response or {}).get("messages") or [{}]
+    return messages[0].get("id")
+
+
+DELIVERIES = DeliveryTracker()
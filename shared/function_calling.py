@@ -0,0 +1,194 @@
+"""
+Function-calling loop for agents compiled by shared.agent_config.
+
+The SDK's automatic function calling needs the tool callables in every
+request config and re-derives their declarations on each call. Agents send the
+precompiled declarations instead and execute the model's function calls here:
+call the model, run the requested tools, send their results back, and repeat
+until the model answers with text or max_iterations is reached.
+
+Every model call is bounded by the turn's deadline (see shared.deadline); no
+new model call is started once the budget is spent.
+
+Function calls the model emits in the same turn are independent of each other
+(the model only sees their results together), so they are executed
+concurrently: a multi-tool turn costs its slowest call, not the sum.
+Identical calls (same agent, tool, arguments and user) running at the same
+time, e.g. from a redelivered message, are executed once and share the result.
+Inside an orchestrator turn the turn is part of the key: its tools read the
+turn's history and record messages in it (shared.turn_context), so a call
+from another turn must run on its own.
+"""
+import contextvars
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Any, Dict, Iterator, List, Tuple
+
+from shared.log import get_logger
+from shared.agent_config import AgentConfig
+from shared.deadline import guard, http_options
+from shared.metrics import REGISTRY
+from shared.single_flight import SingleFlight, canonical_key
+from shared.turn_context import current_turn
+from shared.usage import current_user
+
+if TYPE_CHECKING:
+    from google.genai.types import Content, FunctionCall, Part
+
+log = get_logger("function_calling")
+
+TOOL_SECONDS = REGISTRY.histogram(
+    "tool_call_seconds",
+    "Duration of tool calls made by the function-calling loop",
+    labelnames=("agent", "tool", "status")
+)
+TOOL_BATCH_SIZE = REGISTRY.histogram(
+    "tool_calls_per_turn",
+    "Function calls emitted by the model in one turn",
+    labelnames=("agent",),
+    buckets=(1, 2, 3, 4, 6, 8, 12, 16)
+)
+
+TOOL_FLIGHTS = SingleFlight("tool_call")
+
+# Model calls per user turn; the same default as the SDK's automatic function calling
+DEFAULT_MAX_ITERATIONS = int(os.getenv("AGENT_MAX_TOOL_ITERATIONS", "10"))
+
+
+def as_contents(contents: Any) -> List["Content"]:
+    """Model input as a list of Content; a string becomes one user message."""
+    from google.genai.types import Content, Part
+
+    if isinstance(contents, str):
+        return [Content(role="user", parts=[Part(text=contents)])]
+    return list(contents)
+
+
+def split_parts(parts: List["Part"]) -> Tuple[List[str], List["FunctionCall"]]:
+    """Text (excluding thoughts) and function calls of a model response."""
+    texts = [part.text for part in parts if part.text and not part.thought]
+    calls = [part.function_call for part in parts if part.function_call]
+    return texts, calls
+
+
+def _request_config(agent: AgentConfig):
+    """The agent's request config, with a timeout bounded by the turn's deadline."""
+    options = http_options()
+    if options is None:
+        return agent.config
+    return agent.config.model_copy(update={"http_options": options})
+
+
+def call_tool(agent: AgentConfig, call: "FunctionCall") -> Dict[str, Any]:
+    """Execute one function call, returning the function response payload."""
+    fn = agent.functions.get(call.name)
+    if fn is None:
+        return {"error": f"Unknown function: {call.name}"}
+    args = call.args or {}
+    started = time.perf_counter()
+    status = "ok"
+    try:
+        turn = current_turn()
+        # A turn object is alive while its calls are in flight, so its id is unique among them
+        key = canonical_key(agent.spec.name, call.name, args, current_user(), id(turn) if turn else None)
+        result = TOOL_FLIGHTS.do(key, fn, **args)
+    except Exception as e:
+        status = "error"
+        log.exception("Tool failed", agent=agent.spec.name, tool=call.name, error=str(e))
+        return {"error": str(e)}
+    finally:
+        elapsed = time.perf_counter() - started
+        TOOL_SECONDS.observe(elapsed, agent=agent.spec.name, tool=call.name, status=status)
+        log.debug("Tool call", agent=agent.spec.name, tool=call.name, status=status, ms=round(elapsed * 1000))
+    return result if isinstance(result, dict) else {"result": result}
+
+
+def call_tools(agent: AgentConfig, calls: List["FunctionCall"]) -> List[Dict[str, Any]]:
+    """
+    Execute the function calls of one model turn concurrently, returning their responses in call order.
+
+    Each call runs in a copy of the caller's context, so the active span, user
+    and turn context are visible to the tools.
+    """
+    TOOL_BATCH_SIZE.observe(len(calls), agent=agent.spec.name)
+    if len(calls) == 1:
+        return [call_tool(agent, calls[0])]
+
+    started = time.perf_counter()
+    # A pool per turn rather than a shared one: tools block on other agents,
+    # which may run their own tool calls in this process and must never wait for a free worker
+    with ThreadPoolExecutor(max_workers=len(calls), thread_name_prefix=f"{agent.spec.name}-tool") as pool:
+        futures = [pool.submit(contextvars.copy_context().run, call_tool, agent, call) for call in calls]
+        results = [future.result() for future in futures]
+    log.debug("Parallel tool calls", agent=agent.spec.name, tools=[call.name for call in calls],
+              ms=round((time.perf_counter() - started) * 1000))
+    return results
+
+
+def _tool_results(agent: AgentConfig, calls: List["FunctionCall"]) -> "Content":
+    from google.genai.types import Content, Part
+
+    responses = call_tools(agent, calls)
+    parts = [Part.from_function_response(name=call.name, response=response) for call, response in zip(calls, responses)]
+    return Content(role="user", parts=parts)
+
+
+def generate_with_tools(client, agent: AgentConfig, contents: Any,
+                        max_iterations: int = DEFAULT_MAX_ITERATIONS) -> str:
+    """
+    Run the agent on contents, executing its function calls, and return the final text.
+
+    Args:
+        client: Gemini client
+        agent: Compiled agent configuration
+        contents: Prompt string or list of Content
+        max_iterations: Maximum model calls in the turn
+    """
+    contents = as_contents(contents)
+    texts: List[str] = []
+    for _ in range(max_iterations):
+        with guard(f"{agent.spec.name} model call"):
+            response = client.models.generate_content(model=agent.model, contents=contents,
+                                                       config=_request_config(agent))
+        if not response.candidates or not response.candidates[0].content:
+            break
+        content = response.candidates[0].content
+        texts, calls = split_parts(content.parts or [])
+        if not calls:
+            break
+        contents.append(content)
+        contents.append(_tool_results(agent, calls))
+    else:
+        log.warning("Function-calling loop hit max iterations", agent=agent.spec.name, max_iterations=max_iterations)
+    return "".join(texts)
+
+
+def stream_with_tools(client, agent: AgentConfig, contents: Any,
+                      max_iterations: int = DEFAULT_MAX_ITERATIONS) -> Iterator[str]:
+    """
+    Streaming variant of generate_with_tools(), yielding text chunks as the model produces them.
+    Text the model emits alongside function calls is streamed too.
+    """
+    from google.genai.types import Content
+
+    contents = as_contents(contents)
+    for _ in range(max_iterations):
+        parts: List["Part"] = []
+        calls: List["FunctionCall"] = []
+        with guard(f"{agent.spec.name} model call"):
+            stream = client.models.generate_content_stream(model=agent.model, contents=contents,
+                                                           config=_request_config(agent))
+            for chunk in stream:
+                if not chunk.candidates or not chunk.candidates[0].content:
+                    continue
+                chunk_parts = chunk.candidates[0].content.parts or []
+                parts.extend(chunk_parts)
+                texts, chunk_calls = split_parts(chunk_parts)
+                calls.extend(chunk_calls)
+                yield from texts
+        if not calls:
+            return
+        contents.append(Content(role="model", parts=parts))
+        contents.append(_tool_results(agent, calls))
+    log.warning("Function-calling loop hit max iterations", agent=agent.spec.name, max_iterations=max_iterations)
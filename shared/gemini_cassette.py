@@ -0,0 +1,294 @@
+"""
+Record/replay layer for Gemini calls.
+
+CassetteClient wraps a genai.Client and records every generate_content,
+generate_content_stream and file upload to a compact JSON-lines cassette
+(gzip-compressed when the path ends in .gz). In replay mode the same calls are
+answered from the cassette without network access, optionally sleeping for the
+recorded latency, so prompt and tool-wiring changes can be benchmarked offline.
+
+Requests carry function declarations only (shared.agent_config); function
+calls are part of the recorded responses and are executed by the caller
+(shared.function_calling), in replay mode as well: a replayed orchestrator turn
+still calls the agents and communicate_with_human still sends WhatsApp
+messages. Replay therefore refuses to start unless WHATSAPP_API_BASE_URL points
+at a stand-in such as benchmarks/fakes/graph_api.py.
+"""
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+from urllib.parse import urlparse
+
+from google.genai.types import File, GenerateContentResponse
+
+RECORD = "record"
+REPLAY = "replay"
+
+# Hosts that deliver real WhatsApp messages
+LIVE_WHATSAPP_HOSTS = ("graph.facebook.com", "graph.whatsapp.com")
+
+
+class CassetteMissError(LookupError):
+    """Raised in strict replay mode when no recorded interaction matches a request."""
+
+
+def _to_jsonable(value: Any) -> Any:
+    """Convert SDK objects (pydantic models), lists and dicts into plain JSON values."""
+    if hasattr(value, "model_dump"):
+        return value.model_dump(mode="json", exclude_none=True)
+    if isinstance(value, dict):
+        return {str(k): _to_jsonable(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_to_jsonable(v) for v in value]
+    if isinstance(value, (str, int, float, bool)) or value is None:
+        return value
+    return repr(value)
+
+
+def check_replay_side_effects() -> None:
+    """
+    Refuse to replay while replayed function calls would reach real users.
+
+    Raises:
+        ValueError: WHATSAPP_API_BASE_URL is unset or points at the WhatsApp Cloud API
+    """
+    base_url = os.environ.get("WHATSAPP_API_BASE_URL", "")
+    host = urlparse(base_url).hostname or ""
+    if not base_url or host in LIVE_WHATSAPP_HOSTS or host.endswith(".facebook.com"):
+        raise ValueError(
+            "Cassette replay executes the recorded function calls, including WhatsApp sends: "
+            "set WHATSAPP_API_BASE_URL to a stand-in (e.g. benchmarks/fakes/graph_api.py)"
+        )
+
+
+def _function_names(tools: Any) -> List[str]:
+    """Names of the function declarations of a config's tools."""
+    return [
+        declaration.name
+        for tool in tools or []
+        for declaration in (getattr(tool, "function_declarations", None) or [])
+    ]
+
+
+def request_key(method: str, model: Optional[str], contents: Any, config: Any) -> str:
+    """
+    Stable hash identifying a request.
+
+    Covers model, contents, system instruction and the names of the declared
+    functions; other config fields (temperature, http options) do not
+    influence matching.
+    """
+    system_instruction = getattr(config, "system_instruction", None)
+    canonical = json.dumps({
+        "method": method,
+        "model": model,
+        "contents": _to_jsonable(contents),
+        "system_instruction": _to_jsonable(system_instruction),
+        "tools": _function_names(getattr(config, "tools", None)),
+    }, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:32]
+
+
+class Cassette:
+    """Append-only store of recorded interactions, indexed by request key."""
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._by_key: Dict[str, deque] = defaultdict(deque)
+        self._by_method: Dict[str, deque] = defaultdict(deque)
+        self._consumed = set()
+
+    def _open(self, mode: str):
+        if self.path.suffix == ".gz":
+            return gzip.open(self.path, mode + "t", encoding="utf-8")
+        return open(self.path, mode, encoding="utf-8")
+
+    def load(self) -> "Cassette":
+        """Read all interactions from disk into the replay indexes."""
+        if not self.path.exists():
+            raise FileNotFoundError(f"Cassette not found: {self.path}")
+        with self._open("r") as f:
+            for index, line in enumerate(f):
+                if not line.strip():
+                    continue
+                interaction = json.loads(line)
+                interaction["_index"] = index
+                self._by_key[interaction["key"]].append(interaction)
+                self._by_method[interaction["method"]].append(interaction)
+        return self
+
+    def append(self, interaction: Dict) -> None:
+        """Persist one interaction (one line per interaction, so partial recordings stay usable)."""
+        line = json.dumps(interaction, ensure_ascii=False, separators=(",", ":"))
+        with self._lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with self._open("a") as f:
+                f.write(line + "\n")
+
+    def take(self, method: str, key: str, strict: bool) -> Dict:
+        """
+        Pop the next interaction for a request.
+
+        Exact key matches are served first, in recording order. Without strict
+        matching, the next unused interaction of the same method is used instead,
+        which keeps replays working when prompts contain non-deterministic data.
+        """
+        with self._lock:
+            for queue in (self._by_key.get(key), None if strict else self._by_method.get(method)):
+                while queue:
+                    interaction = queue.popleft()
+                    if interaction["_index"] not in self._consumed:
+                        self._consumed.add(interaction["_index"])
+                        return interaction
+        raise CassetteMissError(f"No recorded {method} interaction for key {key} in {self.path}")
+
+
+class CassetteModels:
+    """Stand-in for client.models."""
+
+    def __init__(self, owner: "CassetteClient"):
+        self._owner = owner
+
+    def generate_content(self, *, model: str, contents: Any, config: Any = None) -> GenerateContentResponse:
+        owner = self._owner
+        key = request_key("generate_content", model, contents, config)
+
+        if owner.mode == REPLAY:
+            interaction = owner.cassette.take("generate_content", key, owner.strict)
+            owner.sleep(interaction["elapsed"])
+            return GenerateContentResponse.model_validate(interaction["response"])
+
+        started = time.perf_counter()
+        response = owner.client.models.generate_content(model=model, contents=contents, config=config)
+        owner.cassette.append({
+            "key": key,
+            "method": "generate_content",
+            "model": model,
+            "elapsed": round(time.perf_counter() - started, 4),
+            "response": _to_jsonable(response),
+        })
+        return response
+
+    def generate_content_stream(self, *, model: str, contents: Any, config: Any = None) -> Iterator[GenerateContentResponse]:
+        owner = self._owner
+        key = request_key("generate_content_stream", model, contents, config)
+
+        if owner.mode == REPLAY:
+            interaction = owner.cassette.take("generate_content_stream", key, owner.strict)
+            previous = 0.0
+            for offset, chunk in zip(interaction["offsets"], interaction["chunks"]):
+                owner.sleep(offset - previous)
+                previous = offset
+                yield GenerateContentResponse.model_validate(chunk)
+            return
+
+        started = time.perf_counter()
+        offsets, chunks = [], []
+        for chunk in owner.client.models.generate_content_stream(model=model, contents=contents, config=config):
+            offsets.append(round(time.perf_counter() - started, 4))
+            chunks.append(_to_jsonable(chunk))
+            yield chunk
+        owner.cassette.append({
+            "key": key,
+            "method": "generate_content_stream",
+            "model": model,
+            "elapsed": round(time.perf_counter() - started, 4),
+            "offsets": offsets,
+            "chunks": chunks,
+        })
+
+
+class CassetteFiles:
+    """Stand-in for client.files (upload/get/delete as used by transcription and media description)."""
+
+    def __init__(self, owner: "CassetteClient"):
+        self._owner = owner
+
+    def upload(self, *, file: Any, config: Any = None) -> File:
+        owner = self._owner
+        if owner.mode == REPLAY:
+            interaction = owner.cassette.take("files.upload", "files.upload", strict=False)
+            owner.sleep(interaction["elapsed"])
+            return File.model_validate(interaction["response"])
+
+        started = time.perf_counter()
+        uploaded = owner.client.files.upload(file=file, config=config)
+        owner.cassette.append({
+            "key": "files.upload",
+            "method": "files.upload",
+            "elapsed": round(time.perf_counter() - started, 4),
+            "response": _to_jsonable(uploaded),
+        })
+        return uploaded
+
+    def get(self, *, name: str, config: Any = None) -> File:
+        owner = self._owner
+        if owner.mode == REPLAY:
+            interaction = owner.cassette.take("files.get", "files.get", strict=False)
+            owner.sleep(interaction["elapsed"])
+            return File.model_validate(interaction["response"])
+
+        started = time.perf_counter()
+        file = owner.client.files.get(name=name, config=config)
+        owner.cassette.append({
+            "key": "files.get",
+            "method": "files.get",
+            "elapsed": round(time.perf_counter() - started, 4),
+            "response": _to_jsonable(file),
+        })
+        return file
+
+    def delete(self, *, name: str, config: Any = None) -> None:
+        if self._owner.mode == RECORD:
+            self._owner.client.files.delete(name=name, config=config)
+
+
+class CassetteClient:
+    """
+    Drop-in wrapper for genai.Client that records to or replays from a cassette.
+    Only the calls this project makes are supported: models.generate_content,
+    models.generate_content_stream, files.upload, files.get and files.delete.
+    """
+
+    def __init__(
+            self,
+            cassette_path: str,
+            mode: str = REPLAY,
+            client: Any = None,
+            latency_scale: float = 0.0,
+            strict: bool = False
+    ):
+        """
+        Args:
+            cassette_path: Cassette file (.jsonl or .jsonl.gz)
+            mode: "record" or "replay"
+            client: Real genai.Client, required for recording
+            latency_scale: Multiplier for recorded latency during replay (0 disables sleeping)
+            strict: Fail on requests that do not match a recorded key exactly
+        """
+        if mode not in (RECORD, REPLAY):
+            raise ValueError(f"Unknown cassette mode: {mode}")
+        if mode == RECORD and client is None:
+            raise ValueError("A genai client is required for recording")
+
+        self.mode = mode
+        self.client = client
+        self.latency_scale = latency_scale
+        self.strict = strict
+        self.cassette = Cassette(cassette_path)
+        if mode == REPLAY:
+            self.cassette.load()
+
+        self.models = CassetteModels(self)
+        self.files = CassetteFiles(self)
+
+    def sleep(self, seconds: float) -> None:
+        if self.latency_scale and seconds > 0:
+            time.sleep(seconds * self.latency_scale)
@@ -0,0 +1,97 @@
+"""
+Factory for the Gemini client shared by the orchestrator, agents and tools.
+Centralizes credentials and endpoint overrides so every caller is configured the same way.
+
+The google.genai SDK is imported on first use of a client, not when this module
+is imported, so services can start serving before the SDK has loaded.
+
+All clients of a process share one rate limiter (shared.rate_limit), so
+background work cannot starve interactive turns of quota.
+"""
+import os
+import threading
+from typing import Any, Callable, Dict, Optional
+
+from shared.rate_limit import RateLimitedClient
+from shared.usage import UsageTrackingClient
+
+# One cassette client per component, so repeated calls share one recording/replay position
+_cassette_clients: Dict[str, Any] = {}
+_cassette_lock = threading.Lock()
+
+
+class _LazyClient:
+    """Builds the wrapped client on first attribute access."""
+
+    def __init__(self, factory: Callable[[], Any]):
+        self._factory = factory
+        self._client = None
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name: str) -> Any:
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = self._factory()
+        return getattr(self._client, name)
+
+
+def create_genai_client(name: str = "default", priority: Optional[int] = None):
+    """
+    Create a Gemini client.
+
+    Reads GEMINI_API_KEY and, optionally, GEMINI_BASE_URL to point the client
+    at a different endpoint (e.g. the local stand-in used by the load-test harness).
+
+    When GEMINI_CASSETTE_MODE is "record" or "replay", the client is wrapped in a
+    CassetteClient using GEMINI_CASSETTE_DIR/<name>.jsonl.gz, so each component
+    records to its own cassette. GEMINI_CASSETTE_LATENCY_SCALE (default 0) replays
+    recorded latency and GEMINI_CASSETTE_STRICT=1 requires exact request matches.
+    Replay requires WHATSAPP_API_BASE_URL to point at a stand-in, since the
+    replayed function calls are executed (see shared.gemini_cassette).
+
+    Model calls are recorded by shared.usage under the component name and
+    rate limited by shared.rate_limit, retrying on 429.
+
+    Args:
+        name: Component name, used as the cassette file name and usage agent label
+        priority: Rate limiter priority of all calls (shared.rate_limit.INTERACTIVE, OFFICE or
+                  BACKGROUND); by default taken from the role of the user the call is made for
+
+    Returns:
+        Client with the genai.Client interface
+    """
+    cassette_mode = os.environ.get("GEMINI_CASSETTE_MODE", "").lower()
+    if cassette_mode in ("record", "replay"):
+        with _cassette_lock:
+            if name not in _cassette_clients:
+                _cassette_clients[name] = _LazyClient(lambda: _create_cassette_client(name, cassette_mode))
+            client = _cassette_clients[name]
+    else:
+        client = _LazyClient(_create_client)
+    # Usage measures the model call itself, without the time spent waiting for the limiter
+    return RateLimitedClient(UsageTrackingClient(client, agent=name), agent=name, priority=priority)
+
+
+def _create_client():
+    from google import genai
+    from google.genai.types import HttpOptions
+
+    base_url = os.environ.get("GEMINI_BASE_URL")
+    http_options = HttpOptions(base_url=base_url) if base_url else None
+    return genai.Client(api_key=os.environ.get("GEMINI_API_KEY"), http_options=http_options)
+
+
+def _create_cassette_client(name: str, mode: str):
+    from shared.gemini_cassette import CassetteClient, RECORD, REPLAY, check_replay_side_effects
+
+    cassette_path = os.path.join(os.environ.get("GEMINI_CASSETTE_DIR", "cassettes"), f"{name}.jsonl.gz")
+    if mode == RECORD:
+        return CassetteClient(cassette_path, mode=RECORD, client=_create_client())
+    check_replay_side_effects()
+    return CassetteClient(
+        cassette_path,
+        mode=REPLAY,
+        latency_scale=float(os.environ.get("GEMINI_CASSETTE_LATENCY_SCALE", "0")),
+        strict=os.environ.get("GEMINI_CASSETTE_STRICT") == "1"
+    )
@@ -0,0 +1,159 @@
+"""
+Idempotency keys for outbound WhatsApp messages.
+
+Every inbound message runs its turn inside inbound_scope(message_id). Each
+message sent to a recipient during the turn gets the key
+"<inbound message id>:<recipient>:<content hash>:<n>", where n counts the
+sends of the same content to that recipient in the turn. If a turn is re-run
+for the same inbound message (after a restart, or on another replica that
+received the redelivered webhook), the messages it sends again map to keys
+that were already sent and are skipped, so the recipient does not get the
+same messages twice. A message the re-run phrases differently has a
+different key and is sent.
+
+Within one process, redelivered inbound messages are already dropped by the
+webhook before their turn runs. The keys therefore only help if they outlive
+the process: SENT records them in the shared history store (see
+HistoryStore.record_sent) for IDEMPOTENCY_RETENTION_SECONDS, with a bounded
+local index of the most recent IDEMPOTENCY_MAX_KEYS keys in front of it. The
+orchestrator attaches its store on startup; until then (and in processes
+without one) keys are only kept locally. Keys are recorded after the send, so
+two replicas running the same turn at the same moment can still both send.
+
+Sends outside a turn have no key and are never skipped.
+"""
+import contextvars
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Any, Dict, Iterator, Optional, Sequence
+
+from shared.log import get_logger
+from shared.metrics import REGISTRY
+
+if TYPE_CHECKING:
+    from shared.orchestrator.history_store import HistoryStore
+
+log = get_logger("idempotency")
+
+MAX_KEYS = int(os.getenv("IDEMPOTENCY_MAX_KEYS", "10000"))
+
+SUPPRESSED_SENDS = REGISTRY.counter(
+    "whatsapp_duplicate_sends_suppressed_total",
+    "Outbound messages skipped because their idempotency key was already sent"
+)
+
+
+class _Turn:
+    __slots__ = ("inbound_id", "sends", "lock")
+
+    def __init__(self, inbound_id: str):
+        self.inbound_id = inbound_id
+        self.sends: Dict[str, int] = {}
+        # Tools of one turn send in parallel
+        self.lock = threading.Lock()
+
+
+_turn: contextvars.ContextVar[Optional[_Turn]] = contextvars.ContextVar("idempotency_turn", default=None)
+
+
+@contextmanager
+def inbound_scope(message_id: Optional[str]) -> Iterator[None]:
+    """Derive the keys of sends made in this block from an inbound message id."""
+    token = _turn.set(_Turn(message_id) if message_id else None)
+    try:
+        yield
+    finally:
+        _turn.reset(token)
+
+
+def next_key(to_number: str, message: str) -> Optional[str]:
+    """Key of the next send of a message to a recipient in the current turn (None outside a turn)."""
+    turn = _turn.get()
+    if turn is None:
+        return None
+    digest = hashlib.sha256(message.encode("utf-8")).hexdigest()[:16]
+    prefix = f"{turn.inbound_id}:{to_number}:{digest}"
+    with turn.lock:
+        n = turn.sends.get(prefix, 0)
+        turn.sends[prefix] = n + 1
+    return f"{prefix}:{n}"
+
+
+class BoundedIndex:
+    """Keys with a value, keeping the most recently added max_keys."""
+
+    def __init__(self, max_keys: int = MAX_KEYS):
+        self.max_keys = max_keys
+        self._items: "OrderedDict[str, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            return key in self._items
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        with self._lock:
+            return self._items.get(key, default)
+
+    def add(self, key: str, value: Any = True) -> None:
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_keys:
+                self._items.popitem(last=False)
+
+
+class SentMessages:
+    """Idempotency keys of sent messages, recorded in the shared history store with a local index in front."""
+
+    def __init__(self, store: Optional["HistoryStore"] = None, max_keys: int = MAX_KEYS):
+        """
+        Args:
+            store: Shared store the keys are recorded in (None = this process only)
+            max_keys: Size of the local index
+        """
+        self.store = store
+        # Idempotency key -> message id of the send that delivered it
+        self._local = BoundedIndex(max_keys)
+
+    def attach(self, store: "HistoryStore") -> None:
+        """Record keys in a shared store from now on."""
+        self.store = store
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.lookup([key])
+
+    def lookup(self, keys: Sequence[str]) -> Dict[str, Optional[str]]:
+        """The keys that were already sent, with the message id of their send."""
+        found = {key: self._local.get(key) for key in keys if key in self._local}
+        missing = [key for key in keys if key not in found]
+        if missing and self.store is not None:
+            try:
+                remote = self.store.sent_keys(missing)
+            except Exception as e:
+                # Sending twice is better than not sending
+                log.error("Failed to look up sent messages", error=str(e))
+                remote = {}
+            for key, message_id in remote.items():
+                self._local.add(key, message_id)
+            found.update(remote)
+        return found
+
+    def add(self, keys: Sequence[str], message_id: Optional[str]) -> None:
+        """Record the keys of a sent message."""
+        for key in keys:
+            self._local.add(key, message_id)
+        if keys and self.store is not None:
+            try:
+                self.store.record_sent(keys, message_id)
+            except Exception as e:
+                log.error("Failed to record sent message", error=str(e), message_id=message_id)
+
+
+SENT = SentMessages()
@@ -0,0 +1,191 @@
+"""
+Structured, level-gated, non-blocking logging.
+
+get_logger(name) returns a logger whose calls take an event message plus
+keyword fields:
+
+    log = get_logger("orchestrator")
+    log.debug("Appended message", user_role=user_role, text=text)
+
+Calls below the configured level return immediately without touching the fields.
+Enabled records are reduced to a bounded snapshot on the calling thread (long
+strings and lists are truncated, secrets redacted) and handed to a queue; a
+background listener does the formatting and the stdout write, so request
+threads never block on terminal or pipe I/O.
+
+Environment:
+    LOG_LEVEL            DEBUG, INFO (default), WARNING, ERROR
+    LOG_FORMAT           "text" (default) or "json"
+    LOG_MAX_FIELD_CHARS  Max characters per string field (default 300)
+    LOG_MAX_ITEMS        Max items shown per list/dict field (default 10)
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+from typing import Any, Dict
+
+from shared.tracing import current_trace_id
+
+ROOT_LOGGER = "plumber"
+
+REDACTED_KEYS = {"access_token", "authorization", "api_key", "token", "secret", "password", "app_secret"}
+
+_MAX_FIELD_CHARS = int(os.getenv("LOG_MAX_FIELD_CHARS", "300"))
+_MAX_ITEMS = int(os.getenv("LOG_MAX_ITEMS", "10"))
+_MAX_DEPTH = 3
+
+_configure_lock = threading.Lock()
+_listener = None
+
+
+def summarize(value: Any, depth: int = 0) -> Any:
+    """
+    Bounded copy of a value for logging.
+
+    Work is proportional to the configured limits, not to the size of the value,
+    so logging a long conversation history costs the same as logging a short one.
+    """
+    if isinstance(value, str):
+        if len(value) > _MAX_FIELD_CHARS:
+            return f"{value[:_MAX_FIELD_CHARS]}…(+{len(value) - _MAX_FIELD_CHARS} chars)"
+        return value
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    if depth >= _MAX_DEPTH:
+        return f"<{type(value).__name__}>"
+    if isinstance(value, dict):
+        items = {}
+        for i, (key, item) in enumerate(value.items()):
+            if i >= _MAX_ITEMS:
+                items["…"] = f"+{len(value) - _MAX_ITEMS} keys"
+                break
+            key = str(key)
+            items[key] = "[REDACTED]" if key.lower() in REDACTED_KEYS else summarize(item, depth + 1)
+        return items
+    if isinstance(value, (list, tuple, set)):
+        items = [summarize(item, depth + 1) for _, item in zip(range(_MAX_ITEMS), value)]
+        if len(value) > _MAX_ITEMS:
+            items.append(f"…(+{len(value) - _MAX_ITEMS} items)")
+        return items
+    return summarize(str(value), depth)
+
+
+class _SnapshotQueueHandler(logging.handlers.QueueHandler):
+    """Queue handler that snapshots fields instead of formatting on the caller thread."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.fields = {
+            key: "[REDACTED]" if key.lower() in REDACTED_KEYS else summarize(value)
+            for key, value in getattr(record, "fields", {}).items()
+        }
+        record.trace_id = current_trace_id()
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            # Tracebacks are formatted here, the exception objects must not cross threads
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class TextFormatter(logging.Formatter):
+    """key=value lines for terminals."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        timestamp = time.strftime("%H:%M:%S", time.localtime(record.created)) + f".{int(record.msecs):03d}"
+        name = record.name.removeprefix(f"{ROOT_LOGGER}.")
+        parts = [f"{timestamp} {record.levelname:<7} [{name}] {record.getMessage()}"]
+        for key, value in getattr(record, "fields", {}).items():
+            rendered = value if isinstance(value, str) else json.dumps(value, ensure_ascii=False, default=str)
+            parts.append(f"{key}={rendered}")
+        if getattr(record, "trace_id", None):
+            parts.append(f"trace={record.trace_id}")
+        line = " ".join(parts)
+        if record.exc_text:
+            line += "\n" + record.exc_text
+        return line
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line for log collectors."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": record.created,
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        if getattr(record, "trace_id", None):
+            entry["trace_id"] = record.trace_id
+        entry.update(getattr(record, "fields", {}))
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def configure_logging() -> None:
+    """Install the queue handler and background listener (idempotent)."""
+    global _listener
+    with _configure_lock:
+        if _listener is not None:
+            return
+        stream_handler = logging.StreamHandler(sys.stdout)
+        stream_handler.setFormatter(JsonFormatter() if os.getenv("LOG_FORMAT") == "json" else TextFormatter())
+
+        log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+        root = logging.getLogger(ROOT_LOGGER)
+        root.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+        root.addHandler(_SnapshotQueueHandler(log_queue))
+        root.propagate = False
+
+        _listener = logging.handlers.QueueListener(log_queue, stream_handler)
+        _listener.start()
+        # Flush pending records on shutdown
+        atexit.register(_listener.stop)
+
+
+class StructuredLogger:
+    """Thin wrapper around logging.Logger taking keyword fields."""
+
+    def __init__(self, logger: logging.Logger):
+        self._logger = logger
+
+    def is_enabled_for(self, level: int) -> bool:
+        return self._logger.isEnabledFor(level)
+
+    def _log(self, level: int, msg: str, fields: Dict[str, Any], exc_info: bool = False) -> None:
+        if self._logger.isEnabledFor(level):
+            self._logger.log(level, msg, extra={"fields": fields}, exc_info=exc_info, stacklevel=3)
+
+    def debug(self, msg: str, **fields: Any) -> None:
+        self._log(logging.DEBUG, msg, fields)
+
+    def info(self, msg: str, **fields: Any) -> None:
+        self._log(logging.INFO, msg, fields)
+
+    def warning(self, msg: str, **fields: Any) -> None:
+        self._log(logging.WARNING, msg, fields)
+
+    def error(self, msg: str, **fields: Any) -> None:
+        self._log(logging.ERROR, msg, fields)
+
+    def exception(self, msg: str, **fields: Any) -> None:
+        self._log(logging.ERROR, msg, fields, exc_info=True)
+
+
+def get_logger(name: str) -> StructuredLogger:
+    """
+    Get a structured logger for a component.
+
+    Args:
+        name: Component name, e.g. "orchestrator" or "tools.office_agent"
+    """
+    configure_logging()
+    return StructuredLogger(logging.getLogger(f"{ROOT_LOGGER}.{name}"))
@@ -0,0 +1,104 @@
+"""
+Bounded-memory media downloads.
+
+WhatsApp media (voice notes, photos, PDFs, videos) is streamed to a file in
+MEDIA_CHUNK_BYTES chunks instead of being read into memory, is rejected once
+it exceeds MEDIA_MAX_BYTES (from Content-Length up front, or while
+streaming), and is hashed with SHA-256 on the fly so repeated uploads of the
+same file can be recognized without reading it again.
+"""
+import hashlib
+import os
+from typing import Dict, Optional
+
+import requests
+
+from shared.metrics import REGISTRY
+
+MAX_BYTES = int(os.getenv("MEDIA_MAX_BYTES", str(20 * 1024 * 1024)))
+CHUNK_BYTES = int(os.getenv("MEDIA_CHUNK_BYTES", str(64 * 1024)))
+
+MEDIA_BYTES = REGISTRY.counter(
+    "media_downloaded_bytes_total",
+    "Bytes of media downloaded from WhatsApp"
+)
+MEDIA_REJECTED = REGISTRY.counter(
+    "media_rejected_total",
+    "Media downloads aborted for exceeding MEDIA_MAX_BYTES"
+)
+
+
+class MediaTooLargeError(ValueError):
+    """The media file is larger than the configured limit."""
+
+    def __init__(self, size: int, max_bytes: int):
+        super().__init__(f"Media of {size} bytes exceeds the limit of {max_bytes} bytes")
+        self.size = size
+        self.max_bytes = max_bytes
+
+
+class DownloadedMedia:
+    """A media file on disk with its size, SHA-256 and MIME type."""
+    __slots__ = ("path", "size", "sha256", "mime_type")
+
+    def __init__(self, path: str, size: int, sha256: str, mime_type: Optional[str]):
+        self.path = path
+        self.size = size
+        self.sha256 = sha256
+        self.mime_type = mime_type
+
+
+def download_to_file(
+        url: str,
+        path: str,
+        headers: Optional[Dict[str, str]] = None,
+        timeout: Optional[float] = 30,
+        max_bytes: int = MAX_BYTES
+) -> DownloadedMedia:
+    """
+    Stream a URL into a file, hashing it on the way.
+
+    Args:
+        url: Media URL
+        path: Destination file (removed again if the download fails)
+        headers: Request headers, e.g. the Authorization header for WhatsApp media
+        timeout: Connect/read timeout in seconds
+        max_bytes: Largest accepted file
+
+    Raises:
+        MediaTooLargeError: The file exceeds max_bytes
+        requests.RequestException: The download failed
+    """
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with requests.get(url, headers=headers, timeout=timeout, stream=True) as response:
+            response.raise_for_status()
+            declared = int(response.headers.get("Content-Length") or 0)
+            if declared > max_bytes:
+                raise MediaTooLargeError(declared, max_bytes)
+            with open(path, "wb") as f:
+                for chunk in response.iter_content(chunk_size=CHUNK_BYTES):
+                    size += len(chunk)
+                    if size > max_bytes:
+                        raise MediaTooLargeError(size, max_bytes)
+                    digest.update(chunk)
+                    f.write(chunk)
+            mime_type = (response.headers.get("Content-Type") or "").split(";")[0].strip() or None
+    except MediaTooLargeError:
+        MEDIA_REJECTED.inc()
+        _remove(path)
+        raise
+    except BaseException:
+        _remove(path)
+        raise
+    finally:
+        MEDIA_BYTES.inc(size)
+    return DownloadedMedia(path, size, digest.hexdigest(), mime_type)
+
+
+def _remove(path: str) -> None:
+    try:
+        os.remove(path)
+    except OSError:
+        pass
@@ -3,29 +3,104 @@ Firestore-based chat history persistence for the orchestrator.
 Stores and retrieves conversation history by user ID.
 """
 
-import os
-from typing import List, Dict
+import hashlib
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import TYPE_CHECKING, List, Dict, Optional
 
-import firebase_admin
-from firebase_admin import firestore
-from google.genai.types import Content, Part
+from shared.orchestrator.history_store import (
+    ARCHIVE_BATCH,
+    HOT_MESSAGES,
+    HistoryConflictError,
+    HistoryItem,
+    HistoryRecord,
+    HistoryStore,
+    SENT_RETENTION_SECONDS,
+    VersionedHistory,
+    as_record,
+    cold_count,
+    pack_messages,
+    slice_chunk,
+    unpack_messages,
+)
 
+if TYPE_CHECKING:
+    from google.genai.types import Content
 
-class FirestoreHistory:
-    """Manages chat history persistence in Firestore."""
 
-    def __init__(self, collection_name: str = "chat_history"):
+class FirestoreHistory(HistoryStore):
+    """
+    Manages chat history persistence in Firestore.
+
+    Each user document holds the messages and a version. Appends are
+    read-modify-write cycles made conditional on the document's update time,
+    so concurrent writers from other replicas cause a re-read instead of a
+    lost update.
+
+    The user document only holds the hot tail and the number of messages
+    archived before it. Older messages are written as compressed chunks to the
+    archive collection, one document per sequence range carrying the user id
+    and the range, in the same batch as the conditional update that drops them
+    from the tail: a chunk exists exactly when the update succeeded, and the
+    user document stays the same size however long the conversation gets.
+    Archived ranges are found by querying the archive collection by user id and
+    last sequence number (composite index in firestore.indexes.json).
+
+    Idempotency keys of sent messages are documents of the <collection>_sent
+    collection, named by the key's hash and deleted by a TTL policy on
+    expires_at once their retention has passed.
+
+    firebase_admin is imported and the default app initialized on first use,
+    keeping the Firestore SDK out of the service's startup path.
+    """
+
+    def __init__(
+            self,
+            collection_name: str = "chat_history",
+            db=None,
+            max_write_attempts: int = 5,
+            hot_messages: int = HOT_MESSAGES,
+            archive_batch: int = ARCHIVE_BATCH,
+            sent_retention: float = SENT_RETENTION_SECONDS
+    ):
         """
         Initialize Firestore client.
 
         Args:
-            collection_name: Firestore collection to use for chat history
+            collection_name: Firestore collection to use for chat history; archived chunks go to <name>_archive,
+                             idempotency keys of sent messages to <name>_sent
+            db: Optional Firestore client; defaults to the client of the default Firebase app
+            max_write_attempts: Conditional write attempts before giving up under contention
+            hot_messages: Messages kept in the user document
+            archive_batch: Messages the user document may grow past hot_messages before the oldest are archived
+            sent_retention: Seconds the idempotency keys of sent messages are kept
         """
-        self.app = firebase_admin.initialize_app()
-        self.db = firestore.client()
+        self._db = db
+        self._db_lock = threading.Lock()
         self.collection = collection_name
+        self.archive_collection = f"{collection_name}_archive"
+        self.sent_collection = f"{collection_name}_sent"
+        self.max_write_attempts = max_write_attempts
+        self.hot_messages = hot_messages
+        self.archive_batch = archive_batch
+        self.sent_retention = sent_retention
+
+    @property
+    def db(self):
+        if self._db is None:
+            with self._db_lock:
+                if self._db is None:
+                    import firebase_admin
+                    from firebase_admin import firestore
+
+                    self.app = firebase_admin.initialize_app()
+                    self._db = firestore.client()
+        return self._db
+
+    def _doc(self, user_id: str):
+        return self.db.collection(self.collection).document(user_id)
 
-    def load_history(self, user_id: str) -> List[Content]:
+    def load_versioned(self, user_id: str) -> VersionedHistory:
         """
         Load chat history for a user from Firestore.
 
@@ -33,69 +108,163 @@ class FirestoreHistory:
             user_id: User identifier
 
         Returns:
-            List of Content objects representing chat history
+            Message records and the document version
         """
-        doc_ref = self.db.collection(self.collection).document(user_id)
-        doc = doc_ref.get()
-
+        doc = self._doc(user_id).get()
         if not doc.exists:
-            return []
+            return VersionedHistory([], 0)
 
         data = doc.to_dict()
-        messages = data.get("messages", [])
-
-        # Convert stored dicts back to Content objects
-        history = []
-        for msg in messages:
-            parts = [Part(text=part["text"]) for part in msg.get("parts", [])]
-            history.append(Content(role=msg["role"], parts=parts))
-
-        return history
-
-    def save_history(self, user_id: str, history: List[Content]) -> None:
-        # Convert Content objects to serializable dicts
-        messages = []
-        for content in history:
-            messages.append({
-                "role": content.role,
-                "parts": [{"text": part.text} for part in content.parts if hasattr(part, "text")]
-            })
-        doc_ref = self.db.collection(self.collection).document(user_id)
-        doc_ref.set({
-            "messages": messages,
-            "updated_at": firestore.firestore.SERVER_TIMESTAMP
-        })
+        # Records keep the stored dicts; Content objects are built when the model needs them
+        records = [HistoryRecord(stored=msg) for msg in data.get("messages", [])]
+        return VersionedHistory(records, data.get("version", 0))
 
-    def append_message(self, user_id: str, content: Content) -> None:
+    def append_messages(self, user_id: str, contents: List[HistoryItem], expected_version: Optional[int] = None) -> int:
         """
-        Append a single message to user's chat history.
+        Append messages to a user's chat history.
 
         Args:
             user_id: User identifier
-            content: Content object to append
+            contents: Content objects or records to append
+            expected_version: If set, only append when the stored history is still at this version
+
+        Returns:
+            The new version
         """
-        message = {
-            "role": content.role,
-            "parts": [{"text": part.text} for part in content.parts if hasattr(part, "text")]
-        }
-
-        doc_ref = self.db.collection(self.collection).document(user_id)
-        doc_ref.update({
-            "messages": firestore.ArrayUnion([message]),
-            "updated_at": firestore.SERVER_TIMESTAMP
-        })
+        messages = [as_record(content).stored for content in contents]
+        return self._write(user_id, lambda existing: existing + messages, expected_version)
+
+    def save_history(self, user_id: str, history: List[HistoryItem]) -> None:
+        """Replace a user's chat history."""
+        messages = [as_record(content).stored for content in history]
+        self._write(user_id, lambda existing: messages)
 
     def clear_history(self, user_id: str) -> None:
         """
         Clear chat history for a user.
+        The messages are archived and the document is kept so its version keeps increasing.
+
+        Args:
+            user_id: User identifier
+        """
+        self._write(user_id, lambda existing: [], archive_dropped=True)
+
+    def load_archive(self, user_id: str, start_seq: int = 0, end_seq: Optional[int] = None) -> List[HistoryRecord]:
+        """
+        Archived messages of a user in a sequence range, for audits.
 
         Args:
             user_id: User identifier
+            start_seq: First sequence number
+            end_seq: End of the range (exclusive), None for all archived messages
         """
-        doc_ref = self.db.collection(self.collection).document(user_id)
-        doc_ref.delete()
+        from google.cloud.firestore_v1.base_query import FieldFilter
+
+        # Chunks never overlap, so ordering by last_seq orders them by first_seq too
+        query = (
+            self.db.collection(self.archive_collection)
+            .where(filter=FieldFilter("user_id", "==", user_id))
+            .where(filter=FieldFilter("last_seq", ">=", start_seq))
+            .order_by("last_seq")
+        )
+        records = []
+        for snapshot in query.stream():
+            chunk = snapshot.to_dict()
+            if end_seq is not None and chunk["first_seq"] >= end_seq:
+                break
+            records.extend(slice_chunk(chunk["first_seq"], unpack_messages(chunk["data"]), start_seq, end_seq))
+        return records
+
+    def _sent_doc(self, key: str):
+        # Keys hold WhatsApp message ids, which may contain "/"
+        return self.db.collection(self.sent_collection).document(hashlib.sha256(key.encode("utf-8")).hexdigest())
+
+    def sent_keys(self, keys: List[str]) -> Dict[str, Optional[str]]:
+        if not keys:
+            return {}
+        now = datetime.now(timezone.utc)
+        sent = {}
+        for snapshot in self.db.get_all([self._sent_doc(key) for key in keys]):
+            if not snapshot.exists:
+                continue
+            data = snapshot.to_dict()
+            # TTL deletion runs with a delay; expired documents may still be there
+            if data["expires_at"] > now:
+                sent[data["key"]] = data.get("message_id")
+        return sent
+
+    def record_sent(self, keys: List[str], message_id: Optional[str]) -> None:
+        if not keys:
+            return
+        expires_at = datetime.now(timezone.utc) + timedelta(seconds=self.sent_retention)
+        batch = self.db.batch()
+        for key in keys:
+            batch.set(self._sent_doc(key), {"key": key, "message_id": message_id, "expires_at": expires_at})
+        batch.commit()
+
+    def _archive_chunk(self, batch, user_id: str, first_seq: int, messages: List[Dict]) -> None:
+        """Add archived messages as one compressed chunk to a write batch."""
+        from google.cloud.firestore import SERVER_TIMESTAMP
+
+        last_seq = first_seq + len(messages) - 1
+        chunk_id = f"{user_id}-{first_seq:010d}-{last_seq:010d}"
+        batch.set(self.db.collection(self.archive_collection).document(chunk_id), {
+            "user_id": user_id,
+            "first_seq": first_seq,
+            "last_seq": last_seq,
+            "data": pack_messages(messages),
+            "archived_at": SERVER_TIMESTAMP
+        })
+
+    def _write(self, user_id: str, update_messages, expected_version: Optional[int] = None,
+               archive_dropped: bool = False) -> int:
+        from google.api_core.exceptions import Conflict, FailedPrecondition
+        from google.cloud.firestore import SERVER_TIMESTAMP
+
+        doc_ref = self._doc(user_id)
+        for _ in range(self.max_write_attempts):
+            doc = doc_ref.get()
+            data = doc.to_dict() if doc.exists else {}
+            version = data.get("version", 0)
+            if expected_version is not None and version != expected_version:
+                raise HistoryConflictError(f"{user_id}: expected version {expected_version}, found {version}")
+
+            existing = data.get("messages", [])
+            messages = update_messages(existing)
+            archived_count = data.get("archived_count", 0)
+            if archive_dropped:
+                cold, messages = existing, messages
+            else:
+                cold_messages = cold_count(len(messages), self.hot_messages, self.archive_batch)
+                cold, messages = messages[:cold_messages], messages[cold_messages:]
+
+            # The archive chunk and the user document are committed together or not at all
+            batch = self.db.batch()
+            if cold:
+                self._archive_chunk(batch, user_id, archived_count, cold)
+                archived_count += len(cold)
+
+            new_data = {
+                "messages": messages,
+                "version": version + 1,
+                # Sequence number of the first message in "messages"
+                "archived_count": archived_count,
+                "updated_at": SERVER_TIMESTAMP
+            }
+            if doc.exists:
+                # Fails if another writer touched the document since our read
+                batch.update(doc_ref, new_data, option=self.db.write_option(last_update_time=doc.update_time))
+            else:
+                # Fails if another writer created it first
+                batch.create(doc_ref, new_data)
+            try:
+                batch.commit()
+                return version + 1
+            except (FailedPrecondition, Conflict):
+                continue
+        raise HistoryConflictError(f"{user_id}: gave up after {self.max_write_attempts} concurrent write attempts")
 
-    def load_all_histories(self) -> Dict[str, List[Content]]:
+    def load_all_histories(self) -> Dict[str, List["Content"]]:
         """
         Load chat histories for all users.
 
@@ -0,0 +1,343 @@
+"""
+Conversation history store interface for the orchestrator.
+
+The orchestrator keeps no conversation state in process memory: every turn
+loads the user's history from the store and commits its new messages as an
+atomic append. Each history carries a version that is incremented on every
+append, so replicas serving the same webhook stream never overwrite each
+other's messages, and a turn that ran on a stale history is detected.
+
+Messages are held as HistoryRecords that encode themselves once: the stored
+dict (Firestore document entry) is computed on first use or taken from the
+store, and the agent payload entry is derived from it. A turn's HistoryLog
+keeps the encoded payload of its records append-only, so the history sent
+with every agent call is rebuilt only for messages added since the last call.
+
+Histories are tiered: only the newest HISTORY_HOT_MESSAGES messages (the hot
+tail) are loaded for a turn. Once the tail has grown HISTORY_ARCHIVE_BATCH
+messages past that, the oldest messages are moved to the store's archive as
+one gzip-compressed chunk. Every message keeps a sequence number (its position
+in the full history), and load_archive() fetches archived ranges for audits.
+
+Stores also keep the idempotency keys of sent WhatsApp messages
+(shared.idempotency) for IDEMPOTENCY_RETENTION_SECONDS, so a turn re-run on
+another replica or after a restart does not send its messages again.
+"""
+import gzip
+import json
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Union
+
+if TYPE_CHECKING:
+    from google.genai.types import Content
+
+# Messages kept in the live history, and how far it may grow past that before the oldest are archived
+HOT_MESSAGES = int(os.getenv("HISTORY_HOT_MESSAGES", "40"))
+ARCHIVE_BATCH = int(os.getenv("HISTORY_ARCHIVE_BATCH", "20"))
+# How long idempotency keys of sent messages are kept (WhatsApp retries webhooks for up to 7 days)
+SENT_RETENTION_SECONDS = int(os.getenv("IDEMPOTENCY_RETENTION_SECONDS", str(7 * 24 * 3600)))
+
+
+class HistoryConflictError(Exception):
+    """The history changed since it was loaded (expected_version did not match)."""
+
+
+class HistoryRecord:
+    """One message of a history, encoded at most once."""
+    __slots__ = ("_content", "_stored", "_payload")
+
+    def __init__(self, content: Optional["Content"] = None, stored: Optional[Dict] = None):
+        """
+        Args:
+            content: The message
+            stored: Its stored dict, when loaded from a store (the Content is then built on first use)
+        """
+        self._content = content
+        self._stored = stored
+        self._payload: Optional[Dict] = None
+
+    @property
+    def content(self) -> "Content":
+        if self._content is None:
+            self._content = deserialize_content(self._stored)
+        return self._content
+
+    @property
+    def stored(self) -> Dict:
+        """Stored dict: {"role": ..., "parts": [{"text": ...}]}."""
+        if self._stored is None:
+            self._stored = serialize_content(self._content)
+        return self._stored
+
+    @property
+    def payload(self) -> Dict:
+        """Entry of the history sent to agents: {"role": ..., "parts": [text, ...]}."""
+        if self._payload is None:
+            stored = self.stored
+            self._payload = {"role": stored["role"], "parts": [part.get("text", "") for part in stored["parts"]]}
+        return self._payload
+
+
+HistoryItem = Union[HistoryRecord, "Content"]
+
+
+def as_record(item: HistoryItem) -> HistoryRecord:
+    return item if isinstance(item, HistoryRecord) else HistoryRecord(item)
+
+
+class HistoryLog:
+    """
+    A user's messages as loaded for a turn, appended to while the turn runs.
+
+    The agent payload is cached: payload() returns the same list until a
+    message is appended, and then only encodes the new messages.
+    """
+    __slots__ = ("records", "_encoded", "_payload", "_lock")
+
+    def __init__(self, records: Iterable[HistoryRecord] = ()):
+        self.records: List[HistoryRecord] = list(records)
+        self._encoded: List[Dict] = []
+        self._payload: Optional[List[Dict]] = None
+        # Tools running in parallel read the payload while others append
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def append(self, content: HistoryItem) -> HistoryRecord:
+        record = as_record(content)
+        with self._lock:
+            self.records.append(record)
+        return record
+
+    def contents(self) -> List["Content"]:
+        return [record.content for record in self.records]
+
+    def payload(self) -> List[Dict]:
+        """The history as sent to agents; the returned list must not be modified."""
+        with self._lock:
+            if self._payload is None or len(self._encoded) != len(self.records):
+                self._encoded.extend(record.payload for record in self.records[len(self._encoded):])
+                self._payload = list(self._encoded)
+            return self._payload
+
+
+class VersionedHistory:
+    """A user's messages together with the version they were read at."""
+    __slots__ = ("records", "version")
+
+    def __init__(self, records: Union[HistoryLog, Iterable[HistoryRecord]], version: int):
+        self.records = records if isinstance(records, HistoryLog) else HistoryLog(records)
+        self.version = version
+
+    @property
+    def messages(self) -> List["Content"]:
+        return self.records.contents()
+
+
+class HistoryStore(ABC):
+    """Base class for conversation history stores shared by orchestrator replicas."""
+
+    @abstractmethod
+    def load_versioned(self, user_id: str) -> VersionedHistory:
+        """
+        Load a user's history and its current version (0 if the user has no history).
+
+        Args:
+            user_id: User identifier
+        """
+        ...
+
+    @abstractmethod
+    def append_messages(self, user_id: str, contents: List[HistoryItem], expected_version: Optional[int] = None) -> int:
+        """
+        Atomically append messages to a user's history.
+
+        Args:
+            user_id: User identifier
+            contents: Messages to append, in order (Content or HistoryRecord)
+            expected_version: If set, only append when the history is still at this version
+
+        Returns:
+            The new version
+
+        Raises:
+            HistoryConflictError: The history is no longer at expected_version
+        """
+        ...
+
+    @abstractmethod
+    def clear_history(self, user_id: str) -> None:
+        """Start a user's history afresh; the cleared messages are archived, not deleted."""
+        ...
+
+    @abstractmethod
+    def load_archive(self, user_id: str, start_seq: int = 0, end_seq: Optional[int] = None) -> List[HistoryRecord]:
+        """
+        Archived messages of a user with start_seq <= sequence number < end_seq, oldest first.
+
+        Args:
+            user_id: User identifier
+            start_seq: First sequence number (0 = the user's first message)
+            end_seq: End of the range (exclusive); None for all archived messages
+        """
+        ...
+
+    @abstractmethod
+    def sent_keys(self, keys: List[str]) -> Dict[str, Optional[str]]:
+        """
+        The idempotency keys among keys that were recorded as sent and have not expired.
+
+        Returns:
+            Key -> message id of the send that delivered it
+        """
+        ...
+
+    @abstractmethod
+    def record_sent(self, keys: List[str], message_id: Optional[str]) -> None:
+        """Record the idempotency keys of a sent message for SENT_RETENTION_SECONDS."""
+        ...
+
+    def load_history(self, user_id: str) -> List["Content"]:
+        return self.load_versioned(user_id).messages
+
+    def append_message(self, user_id: str, content: HistoryItem) -> None:
+        self.append_messages(user_id, [content])
+
+
+def serialize_content(content: "Content") -> Dict:
+    """Content -> stored dict (text parts only)."""
+    return {
+        "role": content.role,
+        "parts": [{"text": part.text} for part in content.parts if hasattr(part, "text")]
+    }
+
+
+def deserialize_content(message: Dict) -> "Content":
+    """Stored dict -> Content."""
+    from google.genai.types import Content, Part
+    return Content(role=message["role"], parts=[Part(text=part["text"]) for part in message.get("parts", [])])
+
+
+def cold_count(live_count: int, hot_messages: int = HOT_MESSAGES, archive_batch: int = ARCHIVE_BATCH) -> int:
+    """Number of oldest live messages to archive (0 until the live history is a batch past the hot tail)."""
+    return live_count - hot_messages if live_count >= hot_messages + archive_batch else 0
+
+
+def pack_messages(messages: List[Dict]) -> bytes:
+    """Stored dicts -> compressed archive chunk."""
+    return gzip.compress(json.dumps(messages, separators=(",", ":")).encode("utf-8"))
+
+
+def unpack_messages(data: bytes) -> List[Dict]:
+    """Compressed archive chunk -> stored dicts."""
+    return json.loads(gzip.decompress(data))
+
+
+def slice_chunk(first_seq: int, messages: List[Dict], start_seq: int, end_seq: Optional[int]) -> List[HistoryRecord]:
+    """Records of an archive chunk starting at first_seq that fall into [start_seq, end_seq)."""
+    last = len(messages) if end_seq is None else max(0, min(len(messages), end_seq - first_seq))
+    return [HistoryRecord(stored=message) for message in messages[max(0, start_seq - first_seq):last]]
+
+
+class InMemoryHistory(HistoryStore):
+    """Process-local store for the CLI and single-process runs. Not shared between replicas."""
+
+    def __init__(self, hot_messages: int = HOT_MESSAGES, archive_batch: int = ARCHIVE_BATCH,
+                 sent_retention: float = SENT_RETENTION_SECONDS):
+        self.hot_messages = hot_messages
+        self.archive_batch = archive_batch
+        self.sent_retention = sent_retention
+        self._lock = threading.Lock()
+        self._histories: Dict[str, VersionedHistory] = {}
+        # Per user: archived messages count and compressed chunks as (first_seq, data)
+        self._archived: Dict[str, int] = {}
+        self._archives: Dict[str, List[tuple]] = {}
+        # Idempotency key -> (message id, expiry), in recording order
+        self._sent: Dict[str, tuple] = {}
+
+    def load_versioned(self, user_id: str) -> VersionedHistory:
+        with self._lock:
+            history = self._histories.get(user_id)
+            if history is None:
+                return VersionedHistory([], 0)
+            # Records are immutable once encoded and shared with the copy
+            return VersionedHistory(history.records.records, history.version)
+
+    def append_messages(self, user_id: str, contents: List[HistoryItem], expected_version: Optional[int] = None) -> int:
+        with self._lock:
+            history = self._histories.setdefault(user_id, VersionedHistory([], 0))
+            if expected_version is not None and history.version != expected_version:
+                raise HistoryConflictError(f"{user_id}: expected version {expected_version}, found {history.version}")
+            records = history.records.records + [as_record(content) for content in contents]
+            cold = cold_count(len(records), self.hot_messages, self.archive_batch)
+            if cold:
+                self._archive(user_id, records[:cold])
+            history.records = HistoryLog(records[cold:])
+            history.version += 1
+            return history.version
+
+    def clear_history(self, user_id: str) -> None:
+        with self._lock:
+            history = self._histories.get(user_id)
+            if history is not None:
+                self._archive(user_id, history.records.records)
+                # Keep counting so a turn started before the clear still conflicts
+                history.records = HistoryLog()
+                history.version += 1
+
+    def load_archive(self, user_id: str, start_seq: int = 0, end_seq: Optional[int] = None) -> List[HistoryRecord]:
+        with self._lock:
+            chunks = list(self._archives.get(user_id, []))
+        records = []
+        for first_seq, data in chunks:
+            records.extend(slice_chunk(first_seq, unpack_messages(data), start_seq, end_seq))
+        return records
+
+    def sent_keys(self, keys: List[str]) -> Dict[str, Optional[str]]:
+        now = time.time()
+        with self._lock:
+            entries = {key: self._sent.get(key) for key in keys}
+        return {key: entry[0] for key, entry in entries.items() if entry is not None and entry[1] > now}
+
+    def record_sent(self, keys: List[str], message_id: Optional[str]) -> None:
+        now = time.time()
+        with self._lock:
+            # Oldest first: drop expired keys from the front
+            for key in list(self._sent):
+                if self._sent[key][1] > now:
+                    break
+                del self._sent[key]
+            for key in keys:
+                self._sent.pop(key, None)
+                self._sent[key] = (message_id, now + self.sent_retention)
+
+    def _archive(self, user_id: str, records: List[HistoryRecord]) -> None:
+        if not records:
+            return
+        first_seq = self._archived.get(user_id, 0)
+        self._archives.setdefault(user_id, []).append((first_seq, pack_messages([r.stored for r in records])))
+        self._archived[user_id] = first_seq + len(records)
+
+
+def create_history_store(backend: Optional[str] = None) -> HistoryStore:
+    """
+    History store selected by HISTORY_BACKEND.
+
+    Args:
+        backend: "firestore" (default, shared by replicas on any machine), "sqlite" (local file
+                 HISTORY_SQLITE_PATH, shared by processes on one machine) or "memory" (this process only)
+    """
+    backend = (backend or os.getenv("HISTORY_BACKEND", "firestore")).lower()
+    if backend == "firestore":
+        from shared.orchestrator.firestore_history import FirestoreHistory
+        return FirestoreHistory()
+    if backend == "sqlite":
+        from shared.orchestrator.sqlite_history import SQLiteHistory
+        return SQLiteHistory(os.getenv("HISTORY_SQLITE_PATH", "history.db"))
+    if backend == "memory":
+        return InMemoryHistory()
+    raise ValueError(f"Unknown HISTORY_BACKEND: {backend}")
@@ -0,0 +1,226 @@
+"""
+SQLite-based chat history persistence for single-node deployments and benchmarks.
+
+Messages live in an append-only table keyed by (user_id, seq); a second table
+holds each user's version and the first sequence number still visible, so
+clearing a history is a single update. When an append grows the visible
+messages a batch past the hot tail, the oldest rows move to the archive table
+as one compressed chunk in the same transaction. Idempotency keys of sent
+messages go to their own table and are deleted once expired.
+
+The database runs in WAL mode: readers never block the writer, and several
+orchestrator processes on the same machine can share one file.
+"""
+import json
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional
+
+from shared.orchestrator.history_store import (
+    ARCHIVE_BATCH,
+    HOT_MESSAGES,
+    HistoryConflictError,
+    HistoryItem,
+    HistoryRecord,
+    HistoryStore,
+    SENT_RETENTION_SECONDS,
+    VersionedHistory,
+    as_record,
+    cold_count,
+    pack_messages,
+    slice_chunk,
+    unpack_messages,
+)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS histories (
+    user_id TEXT PRIMARY KEY,
+    version INTEGER NOT NULL,
+    next_seq INTEGER NOT NULL,
+    start_seq INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS messages (
+    user_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    message TEXT NOT NULL,
+    PRIMARY KEY (user_id, seq)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS archive (
+    user_id TEXT NOT NULL,
+    first_seq INTEGER NOT NULL,
+    last_seq INTEGER NOT NULL,
+    data BLOB NOT NULL,
+    PRIMARY KEY (user_id, first_seq)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS sent_messages (
+    key TEXT PRIMARY KEY,
+    message_id TEXT,
+    expires_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS sent_messages_expiry ON sent_messages (expires_at);
+"""
+
+
+class SQLiteHistory(HistoryStore):
+    """
+    Manages chat history persistence in a local SQLite database.
+
+    Each thread uses its own connection. Appends run in an IMMEDIATE
+    transaction, which serializes writers (also across processes), and
+    insert all messages of a turn with one executemany.
+    """
+
+    def __init__(self, path: str = "history.db", busy_timeout_ms: int = 5000,
+                 hot_messages: int = HOT_MESSAGES, archive_batch: int = ARCHIVE_BATCH,
+                 sent_retention: float = SENT_RETENTION_SECONDS):
+        """
+        Args:
+            path: Database file (":memory:" is not shared between threads, use a file)
+            busy_timeout_ms: How long a writer waits for another process's transaction
+            hot_messages: Messages kept visible
+            archive_batch: Messages the visible history may grow past hot_messages before the oldest are archived
+            sent_retention: Seconds the idempotency keys of sent messages are kept
+        """
+        self.path = path
+        self.busy_timeout_ms = busy_timeout_ms
+        self.hot_messages = hot_messages
+        self.archive_batch = archive_batch
+        self.sent_retention = sent_retention
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.executescript(_SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # Autocommit mode: transactions are opened explicitly where needed
+            conn = sqlite3.connect(self.path, isolation_level=None, timeout=self.busy_timeout_ms / 1000)
+            conn.execute("PRAGMA journal_mode=WAL")
+            # Durable at checkpoints; a power loss can drop the last commits, never corrupt the file
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def load_versioned(self, user_id: str) -> VersionedHistory:
+        conn = self._connect()
+        conn.execute("BEGIN")
+        try:
+            row = conn.execute(
+                "SELECT version, start_seq FROM histories WHERE user_id = ?", (user_id,)
+            ).fetchone()
+            if row is None:
+                return VersionedHistory([], 0)
+            version, start_seq = row
+            rows = conn.execute(
+                "SELECT message FROM messages WHERE user_id = ? AND seq >= ? ORDER BY seq",
+                (user_id, start_seq)
+            ).fetchall()
+        finally:
+            conn.execute("COMMIT")
+        return VersionedHistory([HistoryRecord(stored=json.loads(message)) for message, in rows], version)
+
+    def append_messages(self, user_id: str, contents: List[HistoryItem], expected_version: Optional[int] = None) -> int:
+        messages = [json.dumps(as_record(content).stored) for content in contents]
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT version, next_seq, start_seq FROM histories WHERE user_id = ?", (user_id,)
+            ).fetchone()
+            version, next_seq, start_seq = row if row is not None else (0, 0, 0)
+            if expected_version is not None and version != expected_version:
+                raise HistoryConflictError(f"{user_id}: expected version {expected_version}, found {version}")
+
+            conn.executemany(
+                "INSERT INTO messages (user_id, seq, message) VALUES (?, ?, ?)",
+                [(user_id, next_seq + i, message) for i, message in enumerate(messages)]
+            )
+            next_seq += len(messages)
+            start_seq = self._archive(
+                conn, user_id, start_seq,
+                start_seq + cold_count(next_seq - start_seq, self.hot_messages, self.archive_batch)
+            )
+            conn.execute(
+                "INSERT INTO histories (user_id, version, next_seq, start_seq) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (user_id) DO UPDATE SET version = excluded.version, next_seq = excluded.next_seq, "
+                "start_seq = excluded.start_seq",
+                (user_id, version + 1, next_seq, start_seq)
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return version + 1
+
+    def clear_history(self, user_id: str) -> None:
+        """Archive a user's messages; the version keeps increasing so running turns conflict."""
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT next_seq, start_seq FROM histories WHERE user_id = ?", (user_id,)
+            ).fetchone()
+            if row is not None:
+                next_seq, start_seq = row
+                self._archive(conn, user_id, start_seq, next_seq)
+            conn.execute(
+                "UPDATE histories SET version = version + 1, start_seq = next_seq WHERE user_id = ?",
+                (user_id,)
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def load_archive(self, user_id: str, start_seq: int = 0, end_seq: Optional[int] = None) -> List[HistoryRecord]:
+        conn = self._connect()
+        rows = conn.execute(
+            "SELECT first_seq, data FROM archive WHERE user_id = ? AND last_seq >= ? AND first_seq < ? "
+            "ORDER BY first_seq",
+            (user_id, start_seq, end_seq if end_seq is not None else 2 ** 62)
+        ).fetchall()
+        records = []
+        for first_seq, data in rows:
+            records.extend(slice_chunk(first_seq, unpack_messages(data), start_seq, end_seq))
+        return records
+
+    def sent_keys(self, keys: List[str]) -> Dict[str, Optional[str]]:
+        if not keys:
+            return {}
+        rows = self._connect().execute(
+            f"SELECT key, message_id FROM sent_messages WHERE key IN ({', '.join('?' * len(keys))}) AND expires_at > ?",
+            (*keys, time.time())
+        ).fetchall()
+        return dict(rows)
+
+    def record_sent(self, keys: List[str], message_id: Optional[str]) -> None:
+        now = time.time()
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM sent_messages WHERE expires_at <= ?", (now,))
+            conn.executemany(
+                "INSERT OR REPLACE INTO sent_messages (key, message_id, expires_at) VALUES (?, ?, ?)",
+                [(key, message_id, now + self.sent_retention) for key in keys]
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    @staticmethod
+    def _archive(conn: sqlite3.Connection, user_id: str, start_seq: int, end_seq: int) -> int:
+        """Move messages start_seq..end_seq-1 into one archive chunk (inside the caller's transaction); returns end_seq."""
+        if end_seq <= start_seq:
+            return start_seq
+        rows = conn.execute(
+            "SELECT message FROM messages WHERE user_id = ? AND seq >= ? AND seq < ? ORDER BY seq",
+            (user_id, start_seq, end_seq)
+        ).fetchall()
+        conn.execute(
+            "INSERT INTO archive (user_id, first_seq, last_seq, data) VALUES (?, ?, ?, ?)",
+            (user_id, start_seq, end_seq - 1, pack_messages([json.loads(message) for message, in rows]))
+        )
+        conn.execute("DELETE FROM messages WHERE user_id = ? AND seq >= ? AND seq < ?", (user_id, start_seq, end_seq))
+        return end_seq
@@ -10,9 +10,20 @@ import hashlib
 import uvicorn
 import asyncio
 from fastapi import FastAPI, Request, Response
+from fastapi.responses import JSONResponse
 from typing import Dict, Callable, Optional
 from queue import Queue
 
+from shared import metrics
+from shared.deadline import TURN_BUDGET_SECONDS, deadline_scope
+from shared.delivery import DELIVERIES
+from shared.idempotency import BoundedIndex, inbound_scope
+from shared.log import get_logger
+from shared.tracing import start_span, set_service_name
+from shared.usage import USAGE, is_admin_request
+
+log = get_logger("webhook")
+
 
 class WebhookServer:
     """
@@ -31,7 +42,9 @@ class WebhookServer:
         self.message_callback = message_callback
         # Track processed message IDs to prevent duplicate processing
         # WhatsApp webhooks can deliver the same message multiple times for reliability
-        self.processed_message_ids = set()
+        # (the most recent IDEMPOTENCY_MAX_KEYS ids, so the set does not grow without bound)
+        self.processed_message_ids = BoundedIndex()
+        set_service_name("webhook")
         self._setup_routes()
 
     def _setup_routes(self):
@@ -40,6 +53,9 @@ class WebhookServer:
         self.app.get("/whatsapp/webhook")(self.webhook_verify)
         self.app.post("/whatsapp/webhook")(self.webhook_receive)
         self.app.get("/health")(self.health_check)
+        self.app.get("/metrics")(self.metrics)
+        self.app.get("/admin/usage")(self.usage)
+        self.app.get("/admin/deliveries")(self.deliveries)
 
     async def root(self):
         """Root endpoint to confirm the server is running."""
@@ -55,7 +71,7 @@ class WebhookServer:
         """
         app_secret = os.getenv("WHATSAPP_VERIFY_TOKEN")
         if not app_secret:
-            print("⚠️  WHATSAPP_VERIFY_TOKEN not set - skipping signature verification (dev mode)")
+            log.warning("⚠️  WHATSAPP_VERIFY_TOKEN not set - skipping signature verification (dev mode)")
             return True
 
         expected_signature = hmac.new(
@@ -76,10 +92,10 @@ class WebhookServer:
         verify_token = os.getenv("WHATSAPP_VERIFY_TOKEN")
 
         if mode == "subscribe" and token == verify_token:
-            print(f"✓ Webhook verified successfully")
+            log.info("✓ Webhook verified successfully")
             return Response(content=challenge, media_type='text/plain')
         else:
-            print(f"✗ Webhook verification failed (mode={mode}, token_match={token == verify_token})")
+            log.warning("✗ Webhook verification failed", mode=mode, token_match=token == verify_token)
             return Response(content='Forbidden', status_code=403)
 
     async def webhook_receive(self, request: Request):
@@ -90,13 +106,13 @@ class WebhookServer:
         signature = request.headers.get('X-Hub-Signature-256', '')
 
         #if not self._verify_webhook_signature(body, signature):
-        #    print(f"✗ Invalid webhook signature - rejecting request {signature}")
+        #    log.warning("✗ Invalid webhook signature - rejecting request", signature=signature)
         #    return Response(content='Invalid signature', status_code=403)
 
         try:
             data = json.loads(body)
         except json.JSONDecodeError as e:
-            print(f"✗ Invalid JSON in webhook: {e}")
+            log.warning("✗ Invalid JSON in webhook", error=str(e))
             return Response(content='Invalid JSON', status_code=400)
 
         # Process incoming messages
@@ -118,20 +134,23 @@ class WebhookServer:
             # Skip duplicate messages - WhatsApp may send the same message_id multiple times
             # Without this check, we'd process the same message repeatedly, causing infinite loops
             if message_id in self.processed_message_ids:
-                print(f"⏭️  Skipping duplicate message {message_id}")
+                log.info("⏭️  Skipping duplicate message", message_id=message_id)
                 continue
 
             message_content = self._extract_message_content(message)
 
             if from_number and message_content:
-                print(f"📨 Received from {from_number}: {message_content[:100]}")
+                log.info("📨 Received message", from_number=from_number, content=message_content)
 
                 # Mark as processed BEFORE calling callback to prevent race conditions
                 self.processed_message_ids.add(message_id)
 
-                # Call the message callback if provided
+                # Call the message callback if provided.
+                # Each inbound message starts a new trace and a latency budget that follow the whole turn.
                 if self.message_callback:
-                    self.message_callback(from_number, message_content)
+                    with start_span("webhook.message", message_id=message_id, message_type=message_type), \
+                            deadline_scope(TURN_BUDGET_SECONDS), inbound_scope(message_id):
+                        self.message_callback(from_number, message_content)
 
     def _extract_message_content(self, message: Dict) -> str | None:
         """Extracts content from a message object based on its type."""
@@ -148,11 +167,13 @@ class WebhookServer:
             elif 'list_reply' in interactive:
                 return interactive['list_reply']['id']
         elif message_type in ['image', 'audio', 'document', 'video', 'sticker']:
-            media_id = message.get(message_type, {}).get('id')
+            media = message.get(message_type, {})
             # Return a JSON string for media messages
             return json.dumps({
                 "type": message_type,
-                "media_id": media_id
+                "media_id": media.get('id'),
+                "mime_type": media.get('mime_type'),
+                "caption": media.get('caption')
             })
         elif message_type == 'location':
             location = message.get('location', {})
@@ -160,7 +181,7 @@ class WebhookServer:
             lon = location.get('longitude')
             return f"[LOCATION:{lat},{lon}]"
         else:
-            print(f"⚠️  Unsupported message type: {message_type}")
+            log.warning("⚠️  Unsupported message type", message_type=message_type)
             return None
 
     def _process_statuses(self, value: Dict):
@@ -169,24 +190,42 @@ class WebhookServer:
             recipient_id = status.get('recipient_id')
             status_type = status.get('status')
             message_id = status.get('id')
-            print(f"📬 Status update: message {message_id} to {recipient_id} is {status_type}")
+            log.debug("📬 Status update", message_id=message_id, recipient_id=recipient_id, status=status_type)
+            DELIVERIES.record_status(status)
 
     async def health_check(self):
         """Health check endpoint."""
         return {"status": "healthy"}
 
+    async def metrics(self):
+        """Prometheus metrics, including span latency histograms."""
+        return Response(content=metrics.REGISTRY.render(), media_type=metrics.CONTENT_TYPE)
+
+    async def usage(
+            self,
+            request: Request,
+            day: Optional[str] = None,
+            user: Optional[str] = None,
+            agent: Optional[str] = None
+    ):
+        """Token and latency rollups of the orchestrator process, per day, user and agent."""
+        if not is_admin_request(request.headers.get("Authorization")):
+            return JSONResponse(status_code=401, content={"error": "Unauthorized"})
+        return USAGE.report(day=day, user=user, agent=agent)
+
+    async def deliveries(self, request: Request, recipient: Optional[str] = None):
+        """Delivery counts, send -> delivered/read latency percentiles and health per recipient."""
+        if not is_admin_request(request.headers.get("Authorization")):
+            return JSONResponse(status_code=401, content={"error": "Unauthorized"})
+        return DELIVERIES.report(recipient=recipient)
+
     def run(self, port: int, host: str = "0.0.0.0"):
         """Starts the Uvicorn server."""
-        print(f"""
-{'=' * 70}
-🚀 Starting WhatsApp Webhook Server
-{'=' * 70}
-
-Webhook URL: http://{host}:{port}/whatsapp/webhook
-Health Check: http://{host}:{port}/health
-
-{'=' * 70}
-        """)
+        log.info(
+            "🚀 Starting WhatsApp Webhook Server",
+            webhook_url=f"http://{host}:{port}/whatsapp/webhook",
+            health_check=f"http://{host}:{port}/health"
+        )
         uvicorn.run(self.app, host=host, port=port)
 
 
@@ -6,23 +6,47 @@ Manages incoming/outgoing WhatsApp messages and webhook server.
 import os
 import json
 import threading
-from typing import Callable
+from typing import Callable, Iterator, Optional
 
+from shared.log import get_logger
+from shared.outbound import OutboundBuffer, get_outbox
+from shared.streaming import iter_complete_segments
+from shared.tracing import start_span, traced
+from shared.usage import user_context
 from shared.whatsapp_client import WhatsAppClient
-from shared.users import USER_REGISTRY
+from shared.users import USER_DIRECTORY
 from shared.orchestrator.webhook_server import WebhookServer
+from tools.describe_media import MediaRejectedError, describe_media_from_url
 from tools.transcribe_audio import transcribe_audio_from_url
 
+log = get_logger("whatsapp_handler")
+
 
 class WhatsAppHandler:
     """Handles incoming WhatsApp communication for the orchestrator."""
     message_callback: Callable[[str, str], str]
+    stream_callback: Optional[Callable[[str, str], Iterator[str]]]
     whatsapp_client: WhatsAppClient
+    outbox: OutboundBuffer
+
+    def __init__(
+            self,
+            message_callback: Callable[[str, str], str],
+            stream_callback: Optional[Callable[[str, str], Iterator[str]]] = None
+    ):
+        """
+        Initialize WhatsApp handler.
 
-    def __init__(self, message_callback: Callable[[str, str], str]):
-        """Initialize WhatsApp handler."""
+        Args:
+            message_callback: Returns the full response for (user_id, message)
+            stream_callback: Optional streaming variant yielding response chunks.
+                             When set, each complete paragraph is sent as soon as it is ready.
+        """
         self.message_callback = message_callback
-        self.whatsapp_client = WhatsAppClient()
+        self.stream_callback = stream_callback
+        # Replies share the outbox with communicate_with_human, so messages to the same number are merged
+        self.outbox = get_outbox()
+        self.whatsapp_client = self.outbox.client
 
         # Start webhook server in background
         self.webhook_server = WebhookServer(
@@ -39,11 +63,12 @@ class WhatsAppHandler:
 
         webhook_thread = threading.Thread(target=run_server, daemon=True)
         webhook_thread.start()
-        print(f"[WHATSAPP] Webhook server started in background")
+        log.info("Webhook server started in background")
 
     def _process_message(self, message_content: str) -> str:
         """
-        Process WhatsApp message - transcribe if audio, otherwise return as-is.
+        Process WhatsApp message - transcribe if audio, describe if image, document or video,
+        otherwise return as-is.
         """
         try:
             # Check if it's a media message
@@ -58,19 +83,45 @@ class WhatsAppHandler:
                     return "Sorry, couldn't get the audio file."
 
                 # Transcribe audio
-                transcribed = transcribe_audio_from_url(
-                    audio_url,
-                    self.whatsapp_client.access_token
-                )
+                with start_span("whatsapp.transcribe", media_id=media_id):
+                    transcribed = transcribe_audio_from_url(
+                        audio_url,
+                        self.whatsapp_client.access_token
+                    )
                 return transcribed if transcribed else "Sorry, I couldn't transcribe the audio."
 
+            if isinstance(media_data, dict) and media_data.get("type") in ("image", "document", "video", "sticker"):
+                media_type = media_data["type"]
+                media_id = media_data["media_id"]
+                media_url = self.whatsapp_client.get_media_url(media_id)
+
+                if not media_url:
+                    return f"Sorry, couldn't get the {media_type} file."
+
+                # Describe the media for the orchestrator, which only handles text
+                try:
+                    with start_span("whatsapp.describe_media", media_id=media_id, media_type=media_type):
+                        description = describe_media_from_url(
+                            media_url,
+                            self.whatsapp_client.access_token,
+                            media_type,
+                            media_data.get("mime_type")
+                        )
+                except MediaRejectedError:
+                    return f"Sorry, the {media_type} is too large to process."
+                if not description:
+                    return f"Sorry, I couldn't process the {media_type}."
+                caption = media_data.get("caption")
+                return f"{caption}\n[{media_type.upper()}: {description}]" if caption else f"[{media_type.upper()}: {description}]"
+
             # Other media types
-            return f"Received a {media_data.get('type')}, but I can only process audio."
+            return f"Received a {media_data.get('type')}, but I can only process audio, images, documents and videos."
 
         except (json.JSONDecodeError, TypeError):
             # Plain text message
             return message_content
 
+    @traced("whatsapp.handle_message")
     def _handle_incoming_message(self, from_number: str, message_content: str):
         """
         Callback for when a WhatsApp message is received.
@@ -80,35 +131,41 @@ class WhatsAppHandler:
             from_number: Sender's phone number
             message_content: Message text or media info (as JSON)
         """
-        # Determine user ID from phone number
-        user_id = from_number if from_number in USER_REGISTRY else from_number
-        user = USER_REGISTRY.get(user_id, {"name": from_number, "role": "unknown"})
-
-        print(f"\n{'=' * 60}")
-        print(f"📱 WhatsApp message from {user.get('name', from_number)}")
-        print(f"{'=' * 60}")
+        # Determine the user from the phone number (any notation)
+        user = USER_DIRECTORY.by_phone(from_number) or {"name": from_number, "role": "unknown"}
 
-        # Check if message is audio and transcribe if needed
-        processed_message = self._process_message(message_content)
+        # Check if message is audio and transcribe if needed (transcription usage is billed to the sender)
+        with user_context(user.get("role")):
+            processed_message = self._process_message(message_content)
 
-        print(f"Message: {processed_message[:100]}")
-        print(f"{'=' * 60}\n")
+        log.info("📱 WhatsApp message", sender=user.get('name', from_number), message=processed_message)
 
         # Delegate to orchestrator via callback
         # Callback signature: callback(user_id: str, message: str)
         try:
+            phone_for_reply = from_number.lstrip("+")
+            if self.stream_callback:
+                # Send each paragraph as soon as it is complete instead of waiting for the whole reply
+                chunks = self.stream_callback(user.get("role"), processed_message)
+                for paragraph in iter_complete_segments(chunks, boundary="paragraph"):
+                    self.outbox.send(phone_for_reply, paragraph)
+                    log.info("Sent response part", recipient=user.get('name', from_number))
+                self.outbox.flush(phone_for_reply)
+                return
+
             response = self.message_callback(user.get("role"), processed_message)
 
             # Send response back via WhatsApp
             if response:
-                phone_for_reply = from_number.lstrip("+")
-                self.whatsapp_client.send(phone_for_reply, response)
-                print(f"[WHATSAPP] Sent response to {user.get('name', from_number)}\n")
+                self.outbox.send(phone_for_reply, response)
+                log.info("Sent response", recipient=user.get('name', from_number))
+            self.outbox.flush(phone_for_reply)
         except Exception as e:
-            print(f"[WHATSAPP] Error in message callback: {e}\n")
+            log.exception("Error in message callback", error=str(e))
             # Try to send error message back
             try:
                 phone_for_reply = from_number.lstrip("+")
-                self.whatsapp_client.send(phone_for_reply, "Sorry, I encountered an error processing your message.")
+                self.outbox.send(phone_for_reply, "Sorry, I encountered an error processing your message.")
+                self.outbox.flush(phone_for_reply)
             except:
                 pass
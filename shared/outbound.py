@@ -0,0 +1,205 @@
+"""
+Outbound WhatsApp message coalescing.
+
+A turn can send several messages to the same number in quick succession:
+communicate_with_human calls, streamed reply paragraphs and the final reply.
+The outbox holds text messages per recipient for OUTBOUND_COALESCE_WINDOW
+seconds and sends them as one message, joined by blank lines, as long as the
+merged body stays within WhatsApp's text limit; a text longer than the limit
+is split at paragraph, line, sentence or word boundaries and its pieces are
+queued as separate messages. Interactive messages
+(buttons) are never merged: pending text is sent first, then the interactive
+message, so the recipient sees everything in order.
+
+Buffered messages are sent when the window closes, when flush() is called
+(the WhatsApp handler flushes the sender at the end of a turn, and
+communicate_with_human flushes other recipients right away so it can report
+whether the send succeeded), or when the next message would not fit. Send
+errors of messages sent by the window's timer are only logged.
+
+Each message takes the idempotency key of its turn and content
+(shared.idempotency) when it is queued; a merged message carries the keys of
+all its parts. Messages whose key was already sent or is already buffered are
+dropped.
+"""
+import contextvars
+import os
+import threading
+from typing import Dict, List, Optional
+
+from shared.idempotency import SENT, SUPPRESSED_SENDS, next_key
+from shared.log import get_logger
+from shared.metrics import REGISTRY
+
+log = get_logger("outbound")
+
+COALESCE_WINDOW = float(os.getenv("OUTBOUND_COALESCE_WINDOW", "1.5"))
+# WhatsApp rejects text bodies longer than this
+MAX_TEXT_LENGTH = 4096
+SEPARATOR = "\n\n"
+
+COALESCED_MESSAGES = REGISTRY.counter(
+    "whatsapp_messages_coalesced_total",
+    "Outbound text messages merged into another message instead of sent on their own"
+)
+
+
+def split_text(text: str, max_length: int = MAX_TEXT_LENGTH) -> List[str]:
+    """Pieces of at most max_length characters, cut at paragraph, line, sentence or word boundaries if possible."""
+    pieces = []
+    while len(text) > max_length:
+        for separator in ("\n\n", "\n", ". ", " "):
+            cut = text.rfind(separator, 1, max_length + 1)
+            if cut > 0:
+                # Sentences keep their period
+                end = cut + 1 if separator == ". " else cut
+                break
+        else:
+            end = max_length
+        pieces.append(text[:end].rstrip())
+        text = text[end:].lstrip()
+    if text:
+        pieces.append(text)
+    return [piece for piece in pieces if piece]
+
+
+class _Pending:
+    __slots__ = ("texts", "keys", "length", "timer")
+
+    def __init__(self):
+        self.texts: List[str] = []
+        self.keys: List[str] = []
+        self.length = 0
+        self.timer: Optional[threading.Timer] = None
+
+
+class OutboundBuffer:
+    """Per-recipient buffer in front of a WhatsAppClient."""
+
+    def __init__(self, client, window: float = COALESCE_WINDOW, max_length: int = MAX_TEXT_LENGTH):
+        """
+        Args:
+            client: WhatsAppClient (anything with send(to_number, message, buttons=None, idempotency_keys=()))
+            window: Seconds a text message may wait for others to the same recipient; 0 sends immediately
+            max_length: Longest merged body
+        """
+        self.client = client
+        self.window = window
+        self.max_length = max_length
+        self._pending: Dict[str, _Pending] = {}
+        self._lock = threading.Lock()
+        # Serializes sends per recipient so a flush and a timer never reorder messages
+        self._send_locks: Dict[str, threading.Lock] = {}
+
+    def send(self, to_number: str, message: str, buttons: Optional[List[Dict]] = None) -> None:
+        """
+        Queue a message; interactive messages and messages when window is 0 go out immediately.
+
+        Raises:
+            requests.HTTPError: Only for messages sent immediately
+        """
+        if not buttons and len(message) > self.max_length:
+            # WhatsApp would reject the whole text
+            for piece in split_text(message, self.max_length):
+                self.send(to_number, piece)
+            return
+
+        key = next_key(to_number, message)
+        if key is not None and key in SENT:
+            SUPPRESSED_SENDS.inc()
+            log.info("Skipping already sent WhatsApp message", to=to_number, key=key)
+            return
+        keys = [key] if key is not None else []
+
+        if buttons or self.window <= 0:
+            with self._send_lock(to_number):
+                self._send_pending(to_number)
+                self.client.send(to_number, message, buttons=buttons, idempotency_keys=keys)
+            return
+
+        with self._send_lock(to_number):
+            with self._lock:
+                pending = self._pending.get(to_number)
+                if pending is not None and key is not None and key in pending.keys:
+                    SUPPRESSED_SENDS.inc()
+                    return
+                if pending is not None and pending.length + len(SEPARATOR) + len(message) > self.max_length:
+                    # Does not fit: send what is buffered, this message starts a new buffer
+                    overflow = self._take(to_number)
+                    pending = None
+                else:
+                    overflow = None
+                if pending is None:
+                    pending = self._pending[to_number] = self._start(to_number)
+                    pending.length = len(message)
+                else:
+                    COALESCED_MESSAGES.inc()
+                    pending.length += len(SEPARATOR) + len(message)
+                pending.texts.append(message)
+                pending.keys.extend(keys)
+            if overflow:
+                self.client.send(to_number, SEPARATOR.join(overflow.texts), idempotency_keys=overflow.keys)
+
+    def flush(self, to_number: str) -> None:
+        """
+        Send the buffered messages of a recipient now.
+
+        Raises:
+            requests.HTTPError: The send failed
+        """
+        with self._send_lock(to_number):
+            self._send_pending(to_number)
+
+    def flush_all(self) -> None:
+        """Send all buffered messages (e.g. on shutdown); errors are logged."""
+        with self._lock:
+            recipients = list(self._pending)
+        for to_number in recipients:
+            self._flush_quietly(to_number)
+
+    def _send_lock(self, to_number: str) -> threading.Lock:
+        with self._lock:
+            return self._send_locks.setdefault(to_number, threading.Lock())
+
+    def _start(self, to_number: str) -> _Pending:
+        """New buffer whose timer sends it when the window closes (caller holds self._lock)."""
+        pending = _Pending()
+        # The timer thread keeps the trace of the turn that started the buffer
+        pending.timer = threading.Timer(self.window, contextvars.copy_context().run,
+                                        args=(self._flush_quietly, to_number))
+        pending.timer.daemon = True
+        pending.timer.start()
+        return pending
+
+    def _take(self, to_number: str) -> Optional[_Pending]:
+        """Remove a recipient's buffer (caller holds self._lock)."""
+        pending = self._pending.pop(to_number, None)
+        if pending is not None and pending.timer is not None:
+            pending.timer.cancel()
+        return pending
+
+    def _send_pending(self, to_number: str) -> None:
+        with self._lock:
+            pending = self._take(to_number)
+        if pending is not None:
+            self.client.send(to_number, SEPARATOR.join(pending.texts), idempotency_keys=pending.keys)
+
+    def _flush_quietly(self, to_number: str) -> None:
+        try:
+            self.flush(to_number)
+        except Exception as e:
+            log.error("Failed to send buffered WhatsApp messages", to=to_number, error=str(e))
+
+
+_outbox: Optional[OutboundBuffer] = None
+_outbox_lock = threading.Lock()
+
+
+def get_outbox() -> OutboundBuffer:
+    """Process-wide outbox, so tool messages and replies to the same number are merged."""
+    global _outbox
+    with _outbox_lock:
+        if _outbox is None:
+            from shared.whatsapp_client import WhatsAppClient
+            _outbox = OutboundBuffer(WhatsAppClient())
+        return _outbox
@@ -0,0 +1,29 @@
+"""
+System prompt loading.
+Prompts are read once per process from the shared prompts directory and cached.
+"""
+import functools
+import json
+from pathlib import Path
+from typing import Any, Dict, Union
+
+PROMPTS_DIR = Path(__file__).resolve().parent.parent / "prompts"
+
+
+@functools.lru_cache(maxsize=None)
+def load_prompt(filename: str) -> str:
+    """
+    Load a prompt from the prompts directory.
+
+    Args:
+        filename: Prompt file name, e.g. "orchestrator_system_prompt.md"
+    """
+    return (PROMPTS_DIR / filename).read_text(encoding="utf-8")
+
+
+def request_prompt(request: Union[str, Dict[str, Any]]) -> str:
+    """
+    Model input for an agent request: the decoded /process payload as JSON text
+    (message, job data and the orchestrator's history). Strings are used as is.
+    """
+    return request if isinstance(request, str) else json.dumps(request)
@@ -0,0 +1,334 @@
+"""
+Priority-aware rate limiting of Gemini calls.
+
+All clients created by create_genai_client() in a process share one limiter
+with two token buckets: requests per minute (GEMINI_RPM) and tokens per
+minute (GEMINI_TPM), sized to this process's share of the project quota
+(0 = unlimited). A call takes one request and its estimated tokens (prompt
+text / 4 plus GEMINI_OUTPUT_TOKENS_ESTIMATE) before it is sent; the estimate
+is corrected with the usage the response reports.
+
+Calls have a priority: interactive technician turns first, then office work,
+then background jobs (batch runs). Waiting calls are served strictly in
+priority order, and lower priorities leave a reserve in both buckets, so a
+burst of background work cannot use up the quota a technician's next message
+needs.
+
+A 429 (quota exhausted) pauses every caller in the process for the backoff
+delay and the call is retried, up to GEMINI_MAX_RETRIES times with
+exponential backoff. Waiting never runs past the turn's deadline (see
+shared.deadline). Queue times are exported as gemini_rate_limit_queue_seconds.
+
+The limiter is per process; nothing is coordinated between processes. The
+orchestrator, every agent server replica and every batch run have their own
+buckets, so priorities only order calls within one process: a batch run in
+its own process does not yield to a technician turn handled by another. The
+project quota has to be split statically, by setting GEMINI_RPM and
+GEMINI_TPM per process so that their sum over all processes stays within it.
+A 429 likewise only pauses the process that received it.
+"""
+import contextvars
+import heapq
+import itertools
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Iterator, List, Optional, Tuple
+
+from shared import deadline
+from shared.log import get_logger
+from shared.metrics import REGISTRY
+from shared.usage import current_user
+
+log = get_logger("rate_limit")
+
+INTERACTIVE = 0
+OFFICE = 1
+BACKGROUND = 2
+PRIORITY_NAMES = {INTERACTIVE: "interactive", OFFICE: "office", BACKGROUND: "background"}
+
+# Share of each bucket a priority must leave for higher ones
+RESERVES = {INTERACTIVE: 0.0, OFFICE: 0.1, BACKGROUND: 0.3}
+
+REQUESTS_PER_MINUTE = float(os.getenv("GEMINI_RPM", "0"))
+TOKENS_PER_MINUTE = float(os.getenv("GEMINI_TPM", "0"))
+OUTPUT_TOKENS_ESTIMATE = int(os.getenv("GEMINI_OUTPUT_TOKENS_ESTIMATE", "256"))
+MAX_RETRIES = int(os.getenv("GEMINI_MAX_RETRIES", "4"))
+RETRY_BASE_DELAY = float(os.getenv("GEMINI_RETRY_BASE_DELAY", "1.0"))
+RETRY_MAX_DELAY = float(os.getenv("GEMINI_RETRY_MAX_DELAY", "30.0"))
+
+QUEUE_SECONDS = REGISTRY.histogram(
+    "gemini_rate_limit_queue_seconds",
+    "Time Gemini calls waited for the rate limiter, by priority",
+    labelnames=("priority",),
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+)
+RETRIES = REGISTRY.counter(
+    "gemini_rate_limit_retries_total",
+    "Gemini calls retried after a 429, by agent",
+    labelnames=("agent",)
+)
+
+_priority: contextvars.ContextVar[Optional[int]] = contextvars.ContextVar("gemini_priority", default=None)
+
+
+@contextmanager
+def priority_scope(priority: int) -> Iterator[None]:
+    """Run the Gemini calls made in this block with the given priority."""
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def current_priority(default: Optional[int] = None) -> int:
+    """Priority of a call: priority_scope, else the client's default, else by the active user's role."""
+    priority = _priority.get()
+    if priority is not None:
+        return priority
+    if default is not None:
+        return default
+    user = current_user()
+    if user is None:
+        return OFFICE
+    from shared.users import USER_DIRECTORY
+    # Turns are attributed to the user's role or id
+    record = USER_DIRECTORY.get(user)
+    role = record.get("role") if record else user
+    return INTERACTIVE if role == "technician" else OFFICE
+
+
+def estimate_tokens(contents: Any, config: Any = None) -> int:
+    """Rough token count of a request: characters of its text / 4, plus the expected output."""
+    chars = _text_length(contents)
+    instruction = getattr(config, "system_instruction", None)
+    if instruction is not None:
+        chars += _text_length(instruction)
+    return chars // 4 + OUTPUT_TOKENS_ESTIMATE
+
+
+def _text_length(value: Any) -> int:
+    if isinstance(value, str):
+        return len(value)
+    if isinstance(value, (list, tuple)):
+        return sum(_text_length(item) for item in value)
+    parts = getattr(value, "parts", None)
+    if parts is not None:
+        return sum(_text_length(part) for part in parts)
+    text = getattr(value, "text", None)
+    if isinstance(text, str):
+        return len(text)
+    function_response = getattr(value, "function_response", None)
+    if function_response is not None:
+        return len(str(function_response.response))
+    return 0
+
+
+def is_rate_limited(error: BaseException) -> bool:
+    return getattr(error, "code", None) == 429
+
+
+class _Bucket:
+    """Token bucket refilled continuously at per_minute / 60 per second, holding at most one minute's worth."""
+
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.rate = per_minute / 60.0
+        self.level = per_minute
+        self.updated = time.monotonic()
+
+    def refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, reserve: float) -> float:
+        """Seconds until amount can be taken while leaving reserve * capacity (0 if possible now)."""
+        # A request larger than the bucket would never fit; it waits for a full bucket instead
+        amount = min(amount, self.capacity * (1 - reserve))
+        missing = amount + reserve * self.capacity - self.level
+        return max(0.0, missing / self.rate)
+
+
+class GeminiRateLimiter:
+    """Requests- and tokens-per-minute limits shared by all Gemini calls of the process (not across processes)."""
+
+    def __init__(self, requests_per_minute: float = REQUESTS_PER_MINUTE, tokens_per_minute: float = TOKENS_PER_MINUTE):
+        """
+        Args:
+            requests_per_minute: Request quota of this process (0 = unlimited)
+            tokens_per_minute: Token quota of this process (0 = unlimited)
+        """
+        self._requests = _Bucket(requests_per_minute) if requests_per_minute > 0 else None
+        self._tokens = _Bucket(tokens_per_minute) if tokens_per_minute > 0 else None
+        self._cond = threading.Condition()
+        self._waiters: List[Tuple[int, int]] = []
+        self._seq = itertools.count()
+        self._paused_until = 0.0
+
+    def acquire(self, tokens: int, priority: int = OFFICE) -> float:
+        """
+        Wait until the call may be sent and take its request and tokens; returns the seconds waited.
+
+        Raises:
+            DeadlineExceeded: The turn's deadline passes while waiting
+        """
+        started = time.monotonic()
+        ticket = (priority, next(self._seq))
+        with self._cond:
+            heapq.heappush(self._waiters, ticket)
+            try:
+                while True:
+                    now = time.monotonic()
+                    wait: Optional[float] = None
+                    if self._waiters[0] == ticket:
+                        wait = self._wait_time(now, tokens, RESERVES.get(priority, 0.0))
+                        if wait <= 0:
+                            self._take(tokens)
+                            break
+                    remaining = deadline.remaining()
+                    if remaining is not None:
+                        if remaining <= 0 or (wait is not None and wait > remaining):
+                            raise deadline.DeadlineExceeded("gemini rate limit")
+                        wait = remaining if wait is None else wait
+                    self._cond.wait(timeout=wait)
+            finally:
+                self._waiters.remove(ticket)
+                heapq.heapify(self._waiters)
+                self._cond.notify_all()
+        waited = time.monotonic() - started
+        QUEUE_SECONDS.observe(waited, priority=PRIORITY_NAMES.get(priority, str(priority)))
+        return waited
+
+    def settle(self, estimated: int, actual: Optional[int]) -> None:
+        """Correct the tokens taken for a call with the count the response reported."""
+        if self._tokens is None or not actual:
+            return
+        with self._cond:
+            self._tokens.refill(time.monotonic())
+            # May go below zero: later calls then wait until the overdraft is refilled
+            self._tokens.level -= actual - estimated
+            self._cond.notify_all()
+
+    def release(self, tokens: int) -> None:
+        """Give back the request and tokens taken for a call that was rejected (429 or another error)."""
+        with self._cond:
+            now = time.monotonic()
+            for bucket, amount in ((self._requests, 1), (self._tokens, tokens)):
+                if bucket is not None:
+                    bucket.refill(now)
+                    bucket.level = min(bucket.capacity, bucket.level + amount)
+            self._cond.notify_all()
+
+    def pause(self, seconds: float) -> None:
+        """Hold back all calls for a while (after a 429)."""
+        with self._cond:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def _wait_time(self, now: float, tokens: int, reserve: float) -> float:
+        wait = self._paused_until - now
+        for bucket, amount in ((self._requests, 1), (self._tokens, tokens)):
+            if bucket is not None:
+                bucket.refill(now)
+                wait = max(wait, bucket.wait_time(amount, reserve))
+        return wait
+
+    def _take(self, tokens: int) -> None:
+        if self._requests is not None:
+            self._requests.level -= 1
+        if self._tokens is not None:
+            self._tokens.level -= tokens
+
+
+LIMITER = GeminiRateLimiter()
+
+
+def _backoff(attempt: int) -> float:
+    return min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt) * random.uniform(0.5, 1.0)
+
+
+def _total_tokens(usage_metadata: Any) -> Optional[int]:
+    return getattr(usage_metadata, "total_token_count", None)
+
+
+class _RateLimitedModels:
+    def __init__(self, client: Any, agent: str, priority: Optional[int], limiter: GeminiRateLimiter):
+        self._client = client
+        self._agent = agent
+        self._priority = priority
+        self._limiter = limiter
+
+    def _before_retry(self, attempt: int, error: BaseException) -> None:
+        delay = _backoff(attempt)
+        remaining = deadline.remaining()
+        if attempt >= MAX_RETRIES or (remaining is not None and delay >= remaining):
+            raise error
+        RETRIES.inc(agent=self._agent)
+        log.warning("Gemini rate limited, backing off", agent=self._agent, attempt=attempt + 1,
+                    delay=round(delay, 2))
+        # The quota is shared: every caller in the process backs off, not only this one
+        self._limiter.pause(delay)
+
+    def generate_content(self, *, model: str, contents: Any, config: Any = None):
+        estimated = estimate_tokens(contents, config)
+        priority = current_priority(self._priority)
+        for attempt in itertools.count():
+            self._limiter.acquire(estimated, priority)
+            try:
+                response = self._client.models.generate_content(model=model, contents=contents, config=config)
+            except Exception as e:
+                # The rejected attempt used none of the quota; the retry takes it again
+                self._limiter.release(estimated)
+                if not is_rate_limited(e):
+                    raise
+                self._before_retry(attempt, e)
+                continue
+            self._limiter.settle(estimated, _total_tokens(response.usage_metadata))
+            return response
+
+    def generate_content_stream(self, *, model: str, contents: Any, config: Any = None):
+        estimated = estimate_tokens(contents, config)
+        priority = current_priority(self._priority)
+        for attempt in itertools.count():
+            self._limiter.acquire(estimated, priority)
+            try:
+                stream = self._client.models.generate_content_stream(model=model, contents=contents, config=config)
+                # A 429 arrives before the first chunk; later errors are not retried
+                first = next(stream, None)
+            except Exception as e:
+                self._limiter.release(estimated)
+                if not is_rate_limited(e):
+                    raise
+                self._before_retry(attempt, e)
+                continue
+            break
+        if first is None:
+            return
+        usage_metadata = first.usage_metadata
+        yield first
+        for chunk in stream:
+            usage_metadata = chunk.usage_metadata or usage_metadata
+            yield chunk
+        self._limiter.settle(estimated, _total_tokens(usage_metadata))
+
+
+class RateLimitedClient:
+    """Wraps a Gemini client so model calls go through the process's rate limiter."""
+
+    def __init__(self, client: Any, agent: str, priority: Optional[int] = None,
+                 limiter: GeminiRateLimiter = LIMITER):
+        """
+        Args:
+            client: Client with the genai.Client interface
+            agent: Component name, for logs and metrics
+            priority: Priority of all calls of this client (default: by the active user's role)
+            limiter: Shared limiter
+        """
+        self._client = client
+        self.models = _RateLimitedModels(client, agent, priority, limiter)
+
+    def __getattr__(self, name: str) -> Any:
+        # Everything else (files, batches, ...) goes to the wrapped client
+        return getattr(self._client, name)
@@ -0,0 +1,89 @@
+"""
+Single-flight execution of identical concurrent calls.
+
+Webhook redeliveries and double-taps on buttons can make the same agent
+request or tool call run twice at the same time. A SingleFlight runs one call
+per key: callers arriving while a call with the same key is in flight wait for
+it and share its result (or exception) instead of executing it again.
+Completed calls are not cached; the next call with the key runs again.
+Waiting callers give up when their own turn's deadline passes.
+"""
+import hashlib
+import json
+import threading
+from typing import Any, Callable, Dict, Optional
+
+from shared import deadline
+from shared.log import get_logger
+from shared.metrics import REGISTRY
+
+log = get_logger("single_flight")
+
+COLLAPSED_CALLS = REGISTRY.counter(
+    "single_flight_collapsed_total",
+    "Duplicate calls that shared the result of an identical call already in flight",
+    labelnames=("name",)
+)
+
+
+def canonical_key(*parts: Any) -> str:
+    """Hash of JSON-serializable parts, independent of dict key order."""
+    encoded = json.dumps(parts, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+class _Flight:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """Runs at most one call per key at a time."""
+
+    def __init__(self, name: str):
+        """
+        Args:
+            name: Label of the collapsed-calls metric
+        """
+        self.name = name
+        self._flights: Dict[str, _Flight] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: str, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """
+        Call fn(*args, **kwargs), or wait for the in-flight call with the same key and return its result.
+
+        Raises:
+            DeadlineExceeded: The caller's deadline passed while waiting for the in-flight call
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+
+        if not leader:
+            COLLAPSED_CALLS.inc(name=self.name)
+            log.debug("Collapsed duplicate call", name=self.name, key=key[:12])
+            remaining = deadline.remaining()
+            if remaining is not None and (remaining <= 0 or not flight.done.wait(timeout=remaining)):
+                raise deadline.DeadlineExceeded(f"{self.name} in flight")
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = fn(*args, **kwargs)
+            return flight.result
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
@@ -0,0 +1,163 @@
+"""
+Startup profiling and background warm-up.
+
+Services import the heavy SDKs (google.genai, firebase_admin) lazily, on first
+use, so they become ready as soon as their HTTP server can bind. warm_up()
+then loads those modules in a background thread so the first request does not
+pay for them either.
+
+Run any service with --profile-startup (or STARTUP_PROFILE=1) to get a report
+of import times per module and of the init phases, printed once the service
+is ready; the process then exits. The profiler must be installed before the
+service's other imports, so entry points start with:
+
+    from shared.startup import install_startup_profiler
+    install_startup_profiler()
+
+This module only depends on the standard library so it is cheap to import first.
+"""
+import importlib
+import importlib.abc
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+PROFILE_FLAG = "--profile-startup"
+
+_process_start = time.perf_counter()
+_profiler: Optional["ImportProfiler"] = None
+
+
+class _TimingLoader(importlib.abc.Loader):
+    """Delegating loader that times exec_module of one module."""
+
+    def __init__(self, loader, profiler: "ImportProfiler", name: str):
+        self._loader = loader
+        self._profiler = profiler
+        self._name = name
+
+    def create_module(self, spec):
+        return self._loader.create_module(spec)
+
+    def exec_module(self, module):
+        # Restore the real loader so importlib.resources & co. keep working
+        module.__loader__ = self._loader
+        if module.__spec__ is not None:
+            module.__spec__.loader = self._loader
+        self._profiler.enter()
+        started = time.perf_counter()
+        try:
+            self._loader.exec_module(module)
+        finally:
+            self._profiler.exit(self._name, time.perf_counter() - started)
+
+    def __getattr__(self, name):
+        return getattr(self._loader, name)
+
+
+class ImportProfiler(importlib.abc.MetaPathFinder):
+    """Meta path finder recording cumulative and self import time per module."""
+
+    def __init__(self):
+        self.imports: Dict[str, Tuple[float, float]] = {}
+        self.phases: List[Tuple[str, float]] = []
+        # Time spent in nested imports, per active import
+        self._child_time: List[float] = []
+
+    def find_spec(self, fullname, path, target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, "find_spec"):
+                continue
+            spec = finder.find_spec(fullname, path, target)
+            if spec is None:
+                continue
+            if spec.loader is not None and hasattr(spec.loader, "exec_module"):
+                spec.loader = _TimingLoader(spec.loader, self, fullname)
+            return spec
+        return None
+
+    def enter(self) -> None:
+        self._child_time.append(0.0)
+
+    def exit(self, name: str, elapsed: float) -> None:
+        children = self._child_time.pop()
+        if self._child_time:
+            self._child_time[-1] += elapsed
+        self.imports[name] = (elapsed, elapsed - children)
+
+    def report(self, component: str, top: int = 25) -> str:
+        ready_ms = (time.perf_counter() - _process_start) * 1000
+        lines = [
+            f"Startup profile: {component} ready after {ready_ms:.0f} ms",
+            "",
+            f"{'module':<50} {'cumulative ms':>14} {'self ms':>10}",
+            "-" * 76,
+        ]
+        by_cumulative = sorted(self.imports.items(), key=lambda item: item[1][0], reverse=True)
+        for name, (cumulative, own) in by_cumulative[:top]:
+            lines.append(f"{name:<50} {cumulative * 1000:>14.1f} {own * 1000:>10.1f}")
+        lines.append(f"({len(self.imports)} modules imported)")
+        if self.phases:
+            lines += ["", f"{'init phase':<50} {'ms':>14}", "-" * 65]
+            lines += [f"{name:<50} {elapsed * 1000:>14.1f}" for name, elapsed in self.phases]
+        return "\n".join(lines)
+
+
+def profile_startup_requested() -> bool:
+    return PROFILE_FLAG in sys.argv or os.getenv("STARTUP_PROFILE") == "1"
+
+
+def install_startup_profiler() -> Optional[ImportProfiler]:
+    """Install the import profiler if --profile-startup / STARTUP_PROFILE=1 was given (idempotent)."""
+    global _profiler
+    if _profiler is None and profile_startup_requested():
+        _profiler = ImportProfiler()
+        sys.meta_path.insert(0, _profiler)
+    return _profiler
+
+
+@contextmanager
+def startup_phase(name: str) -> Iterator[None]:
+    """Time an init phase (prompt loading, client setup, ...) for the startup report."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        if _profiler is not None:
+            _profiler.phases.append((name, time.perf_counter() - started))
+
+
+def finish_startup(component: str) -> None:
+    """
+    Mark the service as initialized.
+    In profiling mode, print the report and exit instead of starting to serve.
+    """
+    if _profiler is not None:
+        print(_profiler.report(component), flush=True)
+        sys.exit(0)
+
+    from shared.log import get_logger
+    get_logger("startup").info("Initialized", component=component,
+                               ms=round((time.perf_counter() - _process_start) * 1000))
+
+
+def warm_up(*modules: str) -> None:
+    """Import modules in a background thread, so the first request finds them loaded."""
+    if _profiler is not None:
+        return
+
+    def run():
+        from shared.log import get_logger
+        log = get_logger("startup")
+        started = time.perf_counter()
+        for module in modules:
+            try:
+                importlib.import_module(module)
+            except ImportError as e:
+                log.warning("Warm-up import failed", module=module, error=str(e))
+        log.debug("Warm-up complete", modules=list(modules), ms=round((time.perf_counter() - started) * 1000))
+
+    threading.Thread(target=run, name="warm-up", daemon=True).start()
@@ -0,0 +1,57 @@
+"""
+Helpers for streaming model output.
+Server-sent event encoding for agent servers and segmenting of partial text
+so that complete sentences or paragraphs can be delivered as soon as they are ready.
+"""
+import json
+import re
+from typing import Dict, Iterable, Iterator, Optional
+
+# A sentence ends with terminal punctuation followed by whitespace
+_SENTENCE_END = re.compile(r'(?<=[.!?…])\s+')
+_PARAGRAPH_END = re.compile(r'\n\s*\n')
+
+
+def sse_event(data: Dict, event: Optional[str] = None) -> str:
+    """
+    Encode a payload as a single server-sent event.
+
+    Args:
+        data: JSON-serializable payload
+        event: Optional event name (defaults to the SSE "message" event)
+
+    Returns:
+        Encoded event, terminated by a blank line
+    """
+    lines = []
+    if event:
+        lines.append(f"event: {event}")
+    lines.append(f"data: {json.dumps(data, ensure_ascii=False)}")
+    return "\n".join(lines) + "\n\n"
+
+
+def iter_complete_segments(chunks: Iterable[str], boundary: str = "paragraph") -> Iterator[str]:
+    """
+    Re-chunk streamed text into complete paragraphs or sentences.
+
+    Text is buffered until a boundary is seen; the remainder is flushed when the stream ends.
+
+    Args:
+        chunks: Partial text chunks as produced by the model
+        boundary: "paragraph" (split on blank lines) or "sentence"
+
+    Returns:
+        Iterator of stripped, non-empty segments
+    """
+    pattern = _SENTENCE_END if boundary == "sentence" else _PARAGRAPH_END
+    buffer = ""
+    for chunk in chunks:
+        buffer += chunk
+        parts = pattern.split(buffer)
+        # The last part may still be growing
+        buffer = parts.pop()
+        for part in parts:
+            if part.strip():
+                yield part.strip()
+    if buffer.strip():
+        yield buffer.strip()
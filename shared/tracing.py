@@ -0,0 +1,230 @@
+"""
+Lightweight span-based tracing.
+
+A trace is started at webhook ingress and follows the turn through the
+WhatsApp handler, the orchestrator, the agent tools, the HTTP hop to the agent
+servers and their own tool calls. The active span lives in a context variable;
+across HTTP the context travels in the "trace" field of the /process payload.
+
+Finished spans are
+  - observed in the span_duration_seconds histogram (served on /metrics), and
+  - exported as JSON lines to TRACE_EXPORT_PATH and/or POSTed in batches to
+    TRACE_COLLECTOR_URL, from a background thread so request threads never block on I/O.
+"""
+import contextvars
+import functools
+import json
+import os
+import queue
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional
+
+from shared.metrics import REGISTRY
+
+SPAN_DURATION = REGISTRY.histogram(
+    "span_duration_seconds",
+    "Duration of traced operations",
+    labelnames=("service", "span", "status")
+)
+
+_service_name = os.getenv("SERVICE_NAME", "plumber-agents")
+
+
+def set_service_name(name: str) -> None:
+    """Name of this process in exported spans and metrics (unless SERVICE_NAME is set)."""
+    global _service_name
+    _service_name = os.getenv("SERVICE_NAME", name)
+
+
+def service_name() -> str:
+    return _service_name
+
+
+class Span:
+    """A timed operation within a trace."""
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "attributes", "start", "end", "status")
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], attributes: Dict[str, Any]):
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.name = name
+        self.attributes = attributes
+        self.start = time.time()
+        self.end: Optional[float] = None
+        self.status = "ok"
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    @property
+    def duration(self) -> float:
+        return (self.end or time.time()) - self.start
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "service": _service_name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": self.start,
+            "duration_ms": round(self.duration * 1000, 3),
+            "status": self.status,
+            "attributes": self.attributes,
+        }
+
+
+_current_span: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("current_span", default=None)
+
+
+class _Exporter:
+    """Background exporter writing finished spans to a file and/or a collector."""
+
+    def __init__(self):
+        self.path = os.getenv("TRACE_EXPORT_PATH")
+        self.collector_url = os.getenv("TRACE_COLLECTOR_URL")
+        self.enabled = bool(self.path or self.collector_url)
+        self._queue: "queue.SimpleQueue[Dict]" = queue.SimpleQueue()
+        if self.enabled:
+            threading.Thread(target=self._run, name="trace-exporter", daemon=True).start()
+
+    def export(self, span: Span) -> None:
+        if self.enabled:
+            self._queue.put(span.to_dict())
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            # Drain whatever else is pending so spans of one turn go out together
+            while len(batch) < 512:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                if self.path:
+                    with open(self.path, "a", encoding="utf-8") as f:
+                        f.writelines(json.dumps(span, default=str) + "\n" for span in batch)
+                if self.collector_url:
+                    import requests
+                    requests.post(self.collector_url, json={"spans": batch}, timeout=5)
+            except Exception as e:
+                # Imported lazily: shared.log depends on this module
+                from shared.log import get_logger
+                get_logger("tracing").warning("Span export failed", error=str(e))
+
+
+_exporter = _Exporter()
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def current_trace_id() -> Optional[str]:
+    span = _current_span.get()
+    return span.trace_id if span else None
+
+
+@contextmanager
+def start_span(name: str, trace_id: Optional[str] = None, parent_id: Optional[str] = None,
+               **attributes: Any) -> Iterator[Span]:
+    """
+    Start a span as a child of the active span (or of the given ids).
+
+    Without an active span and without a trace_id, a new trace is started.
+
+    Args:
+        name: Operation name, e.g. "orchestrator.turn"
+        trace_id: Explicit trace id (used when continuing a remote trace)
+        parent_id: Explicit parent span id
+        **attributes: Attributes recorded on the span
+    """
+    parent = _current_span.get()
+    if trace_id is None:
+        trace_id = parent.trace_id if parent else secrets.token_hex(16)
+        parent_id = parent.span_id if parent else parent_id
+    span = Span(name, trace_id, parent_id, attributes)
+    token = _current_span.set(span)
+    try:
+        yield span
+    except GeneratorExit:
+        # A streaming consumer stopped early
+        span.status = "cancelled"
+        raise
+    except BaseException as e:
+        span.status = "error"
+        span.set_attribute("error", str(e))
+        raise
+    finally:
+        span.end = time.time()
+        try:
+            _current_span.reset(token)
+        except ValueError:
+            # Generator spans closed from another context (e.g. an abandoned stream)
+            _current_span.set(parent)
+        SPAN_DURATION.observe(span.duration, service=_service_name, span=name, status=span.status)
+        _exporter.export(span)
+
+
+def trace_context() -> Optional[Dict[str, str]]:
+    """Serializable context of the active span, for the "trace" field of outgoing payloads."""
+    span = _current_span.get()
+    if span is None:
+        return None
+    return {"trace_id": span.trace_id, "span_id": span.span_id}
+
+
+@contextmanager
+def continue_trace(context: Optional[Dict[str, str]], name: str, **attributes: Any) -> Iterator[Span]:
+    """Start a span continuing a trace received from another service (or a new trace if none)."""
+    context = context or {}
+    with start_span(name, trace_id=context.get("trace_id"), parent_id=context.get("span_id"), **attributes) as span:
+        yield span
+
+
+def iter_in_trace(context: Optional[Dict[str, str]], name: str, iterator: Iterator[Any],
+                  **attributes: Any) -> Iterator[Any]:
+    """
+    Consume an iterator inside a span continuing a remote trace.
+
+    Every step runs in the same captured context, so the span stays active even when
+    the consumer advances the iterator from different worker threads (as Starlette does
+    for streaming responses).
+    """
+    ctx = contextvars.copy_context()
+
+    def run():
+        with continue_trace(context, name, **attributes):
+            yield from iterator
+
+    steps = run()
+    while True:
+        try:
+            item = ctx.run(next, steps)
+        except StopIteration:
+            return
+        yield item
+
+
+def traced(name: Optional[str] = None):
+    """
+    Decorator recording each call of a function as a span.
+    The wrapper keeps the signature and docstring, so it is safe for tool functions.
+    """
+
+    def decorator(fn):
+        span_name = name or fn.__name__
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with start_span(span_name):
+                return fn(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,71 @@
+"""
+Per-turn context for tools.
+
+Agent tools are built once (see shared.agent_config) and must not capture
+per-request state. The orchestrator binds the state of the turn it is running
+(user role, history accessor, message sink) in a context variable instead, and
+the tools read it through turn_history() and append_turn_message().
+"""
+import contextvars
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Callable, Dict, Iterator, List, Optional
+
+if TYPE_CHECKING:
+    from google.genai.types import Content
+
+
+class TurnContext:
+    """State of the turn being processed."""
+    __slots__ = ("user_role", "get_history", "append_message")
+
+    def __init__(
+            self,
+            user_role: str,
+            get_history: Callable[[], List[Dict]],
+            append_message: Optional[Callable[[str, "Content"], None]] = None
+    ):
+        self.user_role = user_role
+        self.get_history = get_history
+        self.append_message = append_message
+
+
+_current_turn: contextvars.ContextVar[Optional[TurnContext]] = contextvars.ContextVar("current_turn", default=None)
+
+
+@contextmanager
+def turn_context(
+        user_role: str,
+        get_history: Callable[[], List[Dict]],
+        append_message: Optional[Callable[[str, "Content"], None]] = None
+) -> Iterator[TurnContext]:
+    """
+    Bind the turn's state for the tools called in this block.
+
+    Args:
+        user_role: Role of the user whose message is processed
+        get_history: Returns the user's serialized conversation history
+        append_message: Records a message in a user's history, signature (user_role, content)
+    """
+    context = TurnContext(user_role, get_history, append_message)
+    token = _current_turn.set(context)
+    try:
+        yield context
+    finally:
+        _current_turn.reset(token)
+
+
+def current_turn() -> Optional[TurnContext]:
+    return _current_turn.get()
+
+
+def turn_history() -> List[Dict]:
+    """Serialized history of the active turn (empty outside a turn)."""
+    turn = _current_turn.get()
+    return turn.get_history() if turn else []
+
+
+def append_turn_message(user_role: str, content: "Content") -> None:
+    """Record a message in a user's history through the active turn (no-op outside a turn)."""
+    turn = _current_turn.get()
+    if turn and turn.append_message:
+        turn.append_message(user_role, content)
@@ -0,0 +1,226 @@
+"""
+Per-user and per-agent token and latency accounting for Gemini calls.
+
+Every generate_content / generate_content_stream call made through
+create_genai_client() is recorded with its prompt, cached and output token
+counts and wall time. Calls are aggregated per (day, user, agent), exported as
+Prometheus counters, persisted as JSON rollups in USAGE_ROLLUP_DIR and served
+by the /admin/usage endpoints.
+
+The user is taken from the active turn: the orchestrator sets it per message
+and passes it to the agents in the "user" field of the /process payload.
+"""
+import atexit
+import contextvars
+import hmac
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, List, Optional
+
+from shared.log import get_logger
+from shared.metrics import REGISTRY
+from shared.tracing import service_name
+
+log = get_logger("usage")
+
+TOKENS = REGISTRY.counter(
+    "gemini_tokens_total",
+    "Gemini tokens by agent and kind (prompt, cached, output)",
+    labelnames=("agent", "kind")
+)
+CALL_SECONDS = REGISTRY.histogram(
+    "gemini_call_seconds",
+    "Wall time of Gemini calls",
+    labelnames=("agent", "model")
+)
+
+_current_user: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("usage_user", default=None)
+
+_FIELDS = ("calls", "prompt_tokens", "cached_tokens", "output_tokens", "total_tokens", "wall_seconds")
+
+
+@contextmanager
+def user_context(user: Optional[str]) -> Iterator[None]:
+    """Attribute Gemini calls made in this block to the given user."""
+    token = _current_user.set(user)
+    try:
+        yield
+    finally:
+        _current_user.reset(token)
+
+
+def current_user() -> Optional[str]:
+    return _current_user.get()
+
+
+class UsageTracker:
+    """Aggregates usage per (day, user, agent) and persists the rollups."""
+
+    def __init__(self, rollup_dir: Optional[str] = None, flush_interval: float = 30.0):
+        self.rollup_dir = rollup_dir or os.getenv("USAGE_ROLLUP_DIR", "usage")
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._rollups: Dict[str, Dict[str, float]] = {}
+        self._dirty = False
+        self._loaded = False
+        self._flusher: Optional[threading.Thread] = None
+
+    @property
+    def path(self) -> str:
+        return os.path.join(self.rollup_dir, f"{service_name()}.json")
+
+    def _ensure_started(self) -> None:
+        """Load persisted rollups and start the flush thread on first use."""
+        if self._loaded:
+            return
+        self._loaded = True
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                self._rollups = json.load(f)
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            log.warning("Could not load usage rollups", path=self.path, error=str(e))
+        self._flusher = threading.Thread(target=self._flush_loop, name="usage-flush", daemon=True)
+        self._flusher.start()
+        atexit.register(self.flush)
+
+    def record(self, agent: str, model: Optional[str], usage_metadata: Any, elapsed: float,
+               user: Optional[str] = None) -> None:
+        """
+        Record one Gemini call.
+
+        Args:
+            agent: Calling component, e.g. "orchestrator" or "field_service"
+            model: Model name
+            usage_metadata: response.usage_metadata (may be None)
+            elapsed: Wall time in seconds
+            user: User the call is attributed to (defaults to the active user context)
+        """
+        user = user or current_user() or "unknown"
+        prompt = getattr(usage_metadata, "prompt_token_count", None) or 0
+        cached = getattr(usage_metadata, "cached_content_token_count", None) or 0
+        output = getattr(usage_metadata, "candidates_token_count", None) or 0
+        total = getattr(usage_metadata, "total_token_count", None) or prompt + output
+
+        TOKENS.inc(prompt, agent=agent, kind="prompt")
+        TOKENS.inc(cached, agent=agent, kind="cached")
+        TOKENS.inc(output, agent=agent, kind="output")
+        CALL_SECONDS.observe(elapsed, agent=agent, model=model or "")
+
+        day = datetime.now(timezone.utc).strftime("%Y-%m-%d")
+        key = f"{day}|{user}|{agent}"
+        with self._lock:
+            self._ensure_started()
+            rollup = self._rollups.setdefault(key, {**{f: 0 for f in _FIELDS}, "max_wall_seconds": 0.0})
+            rollup["calls"] += 1
+            rollup["prompt_tokens"] += prompt
+            rollup["cached_tokens"] += cached
+            rollup["output_tokens"] += output
+            rollup["total_tokens"] += total
+            rollup["wall_seconds"] += elapsed
+            rollup["max_wall_seconds"] = max(rollup["max_wall_seconds"], elapsed)
+            self._dirty = True
+
+        log.debug("Gemini usage", agent=agent, user=user, model=model, prompt_tokens=prompt,
+                  cached_tokens=cached, output_tokens=output, wall_ms=round(elapsed * 1000))
+
+    def report(self, day: Optional[str] = None, user: Optional[str] = None,
+               agent: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Filtered rollups, most expensive first, with totals.
+
+        Args:
+            day: YYYY-MM-DD filter
+            user: User filter
+            agent: Agent filter
+        """
+        with self._lock:
+            self._ensure_started()
+            items = list(self._rollups.items())
+
+        rows: List[Dict[str, Any]] = []
+        for key, rollup in items:
+            row_day, row_user, row_agent = key.split("|", 2)
+            if (day and row_day != day) or (user and row_user != user) or (agent and row_agent != agent):
+                continue
+            calls = rollup["calls"] or 1
+            rows.append({
+                "day": row_day,
+                "user": row_user,
+                "agent": row_agent,
+                **rollup,
+                "avg_wall_seconds": rollup["wall_seconds"] / calls,
+            })
+        rows.sort(key=lambda r: r["total_tokens"], reverse=True)
+        totals = {f: sum(r[f] for r in rows) for f in _FIELDS}
+        return {"rows": rows, "totals": totals}
+
+    def flush(self) -> None:
+        """Write the rollups to disk if they changed."""
+        with self._lock:
+            if not self._dirty:
+                return
+            snapshot = json.dumps(self._rollups, indent=1)
+            self._dirty = False
+        try:
+            os.makedirs(self.rollup_dir, exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(snapshot)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            log.warning("Could not persist usage rollups", path=self.path, error=str(e))
+
+    def _flush_loop(self) -> None:
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+
+USAGE = UsageTracker()
+
+
+class _UsageTrackingModels:
+    def __init__(self, client: Any, agent: str):
+        self._client = client
+        self._agent = agent
+
+    def generate_content(self, *, model: str, contents: Any, config: Any = None):
+        started = time.perf_counter()
+        response = self._client.models.generate_content(model=model, contents=contents, config=config)
+        USAGE.record(self._agent, model, response.usage_metadata, time.perf_counter() - started)
+        return response
+
+    def generate_content_stream(self, *, model: str, contents: Any, config: Any = None):
+        started = time.perf_counter()
+        usage_metadata = None
+        for chunk in self._client.models.generate_content_stream(model=model, contents=contents, config=config):
+            # Usage is reported on the final chunk(s)
+            usage_metadata = chunk.usage_metadata or usage_metadata
+            yield chunk
+        USAGE.record(self._agent, model, usage_metadata, time.perf_counter() - started)
+
+
+class UsageTrackingClient:
+    """Wraps a Gemini client so every model call is recorded by USAGE under the given agent name."""
+
+    def __init__(self, client: Any, agent: str):
+        self._client = client
+        self.models = _UsageTrackingModels(client, agent)
+
+    def __getattr__(self, name: str) -> Any:
+        # Everything else (files, batches, ...) goes to the wrapped client
+        return getattr(self._client, name)
+
+
+def is_admin_request(authorization: Optional[str]) -> bool:
+    """Check the Authorization header against ADMIN_TOKEN; admin endpoints are closed while it is unset."""
+    admin_token = os.getenv("ADMIN_TOKEN")
+    if not admin_token or not authorization:
+        return False
+    return hmac.compare_digest(authorization.encode("utf-8"), f"Bearer {admin_token}".encode("utf-8"))
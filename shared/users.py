@@ -1,6 +1,31 @@
-# User registry - maps phone numbers to user roles
-# In production, this would be a database
-USER_REGISTRY = {
+"""
+User directory - maps user ids and phone numbers to users.
+
+Users are read from the JSON file USERS_FILE when set, in the same shape as
+DEFAULT_USERS: {"<user id>": {"role": ..., "name": ..., "default_agent": ...,
+"whatsapp": "<phone>"}}. Lookups go through indexes built once per load
+(normalized E.164 phone -> user, role -> WhatsApp numbers). The file is
+checked for changes at most every USERS_RELOAD_INTERVAL seconds and reloaded
+without a restart; a file that fails to load keeps the previous users.
+"""
+import json
+import os
+import re
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from shared.log import get_logger
+
+log = get_logger("users")
+
+USERS_FILE = os.getenv("USERS_FILE")
+USERS_RELOAD_INTERVAL = float(os.getenv("USERS_RELOAD_INTERVAL", "5"))
+# Country code for numbers written in national format ("0171 ..."), without "+"
+DEFAULT_COUNTRY_CODE = os.getenv("USERS_DEFAULT_COUNTRY_CODE", "49")
+
+# Used when USERS_FILE is not set (development and CLI mode)
+DEFAULT_USERS = {
     "491718398683": {
         "role": "technician",
         "name": "Michael",
@@ -26,12 +51,137 @@ USER_REGISTRY = {
     }
 }
 
+_SEPARATORS = re.compile(r"[\s().\-/]")
+
+
+def normalize_phone(number: Optional[str], default_country_code: str = DEFAULT_COUNTRY_CODE) -> Optional[str]:
+    """
+    Phone number in E.164 form ("+491718398683"), or None if it is not a phone number.
+
+    Accepts "+49 171 8398683", "0049-171-8398683", "01718398683" (national format,
+    default_country_code is prepended) and the bare digits WhatsApp sends.
+    """
+    if not number:
+        return None
+    digits = _SEPARATORS.sub("", str(number))
+    if digits.startswith("+"):
+        digits = digits[1:]
+    elif digits.startswith("00"):
+        digits = digits[2:]
+    elif digits.startswith("0"):
+        digits = default_country_code + digits[1:]
+    if not digits.isdigit() or not 7 <= len(digits) <= 15:
+        return None
+    return "+" + digits
+
+
+class _Snapshot:
+    """Users of one load with their indexes; never modified after construction."""
+    __slots__ = ("users", "by_phone", "by_role", "whatsapp_numbers")
+
+    def __init__(self, users: Dict[str, Dict]):
+        self.users = users
+        self.by_phone: Dict[str, Dict] = {}
+        by_role: Dict[str, list] = {}
+        for user_id, user in users.items():
+            for number in (user_id, user.get("whatsapp")):
+                phone = normalize_phone(number)
+                if phone is not None:
+                    self.by_phone.setdefault(phone, user)
+            if user.get("whatsapp"):
+                by_role.setdefault(user.get("role"), []).append(user["whatsapp"])
+        self.by_role: Dict[str, Tuple[str, ...]] = {role: tuple(numbers) for role, numbers in by_role.items()}
+        self.whatsapp_numbers = tuple(number for numbers in self.by_role.values() for number in numbers)
+
+
+class UserDirectory:
+    """Users by id, phone number and role, reloaded when the backing file changes."""
+
+    def __init__(self, path: Optional[str] = None, reload_interval: float = USERS_RELOAD_INTERVAL,
+                 users: Optional[Dict[str, Dict]] = None):
+        """
+        Args:
+            path: JSON file with the users; None to use `users`
+            reload_interval: Minimum seconds between checks of the file's modification time
+            users: Users when no file is given (default: DEFAULT_USERS)
+        """
+        self.path = path
+        self.reload_interval = reload_interval
+        self._lock = threading.Lock()
+        self._mtime: Optional[float] = None
+        self._checked_at = 0.0
+        if path is None:
+            self._snapshot = _Snapshot(dict(users if users is not None else DEFAULT_USERS))
+        else:
+            self._snapshot = _Snapshot({})
+            self.reload()
+
+    @classmethod
+    def from_env(cls) -> "UserDirectory":
+        return cls(USERS_FILE)
+
+    def reload(self) -> bool:
+        """Load the file now; returns False (keeping the current users) if it cannot be read."""
+        if self.path is None:
+            return False
+        with self._lock:
+            try:
+                mtime = os.stat(self.path).st_mtime
+                with open(self.path, encoding="utf-8") as f:
+                    users = json.load(f)
+                if not isinstance(users, dict):
+                    raise ValueError("expected an object mapping user ids to users")
+                snapshot = _Snapshot(users)
+            except (OSError, ValueError) as e:
+                log.warning("Could not load users, keeping the previous ones", path=self.path, error=str(e))
+                return False
+            self._snapshot = snapshot
+            self._mtime = mtime
+            log.info("Loaded users", path=self.path, users=len(users))
+            return True
+
+    def _current(self) -> _Snapshot:
+        if self.path is not None:
+            now = time.monotonic()
+            if now - self._checked_at >= self.reload_interval:
+                self._checked_at = now
+                try:
+                    changed = os.stat(self.path).st_mtime != self._mtime
+                except OSError:
+                    changed = False
+                if changed:
+                    self.reload()
+        return self._snapshot
+
+    def get(self, user_id: str) -> Optional[Dict]:
+        """User by id, falling back to a phone number lookup."""
+        snapshot = self._current()
+        user = snapshot.users.get(user_id)
+        if user is None:
+            phone = normalize_phone(user_id)
+            user = snapshot.by_phone.get(phone) if phone is not None else None
+        return user
+
+    def by_phone(self, number: str) -> Optional[Dict]:
+        """User with this phone number, in any notation."""
+        phone = normalize_phone(number)
+        return self._current().by_phone.get(phone) if phone is not None else None
+
+    def numbers_for_role(self, role: str) -> Tuple[str, ...]:
+        """WhatsApp numbers of all users with a role."""
+        return self._current().by_role.get(role, ())
+
+    def whatsapp_numbers(self) -> Tuple[str, ...]:
+        """WhatsApp numbers of all users."""
+        return self._current().whatsapp_numbers
+
+    def __len__(self) -> int:
+        return len(self._current().users)
+
+
+USER_DIRECTORY = UserDirectory.from_env()
+
 
 def get_whatsapp_numbers_for_role(user_role: str) -> list[str]:
-    """ Send WhatsApp message to a recipient"""
-    whatsapp_numbers = [
-        phone
-        for phone, details in USER_REGISTRY.items()
-        if details.get("role") == user_role and details.get("whatsapp") is not None
-    ]
-    return whatsapp_numbers
+    """WhatsApp numbers of all users with a role."""
+    return list(USER_DIRECTORY.numbers_for_role(user_role))
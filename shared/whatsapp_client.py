@@ -5,7 +5,16 @@ Docs: https://developers.facebook.com/docs/whatsapp/cloud-api
 
 import requests
 import os
-from typing import Dict, Optional, List
+from typing import Dict, Optional, List, Sequence
+
+from shared.deadline import bounded_timeout
+from shared.delivery import DELIVERIES, message_id_of
+from shared.idempotency import SENT, SUPPRESSED_SENDS
+from shared.log import get_logger
+from shared.media import MAX_BYTES, MediaTooLargeError, download_to_file
+from shared.tracing import traced
+
+log = get_logger("whatsapp_client")
 
 
 class WhatsAppClient:
@@ -20,7 +29,7 @@ class WhatsAppClient:
 
         Args:
             config: Optional configuration dict. If not provided, reads from env vars.
-                   Keys: access_token, phone_number_id, business_account_id, api_version
+                   Keys: access_token, phone_number_id, business_account_id, api_base_url
         """
         config = config or {}
 
@@ -35,11 +44,17 @@ class WhatsAppClient:
         if not self.phone_number_id:
             raise ValueError("WHATSAPP_PHONE_NUMBER_ID is required")
 
-        # API endpoints
-        self.base_url = f'https://graph.facebook.com/v22.0'
+        # API endpoints (overridable to point at a local stand-in for load tests)
+        self.base_url = (
+            config.get('api_base_url')
+            or os.getenv('WHATSAPP_API_BASE_URL')
+            or 'https://graph.facebook.com/v22.0'
+        )
         self.send_url = f'{self.base_url}/{self.phone_number_id}/messages'
 
-    def send(self, to_number: str, message: str, buttons: Optional[List[Dict]] = None) -> Dict:
+    @traced("whatsapp.send")
+    def send(self, to_number: str, message: str, buttons: Optional[List[Dict]] = None,
+             idempotency_keys: Sequence[str] = ()) -> Dict:
 
         """
         Send WhatsApp message (text or interactive with buttons).
@@ -49,6 +64,8 @@ class WhatsAppClient:
             message: Message content
             buttons: Optional list of buttons for interactive message
                     Example: [{"id": "yes", "title": "Yes"}, {"id": "no", "title": "No"}]
+            idempotency_keys: Keys of the message (several for merged messages, see shared.idempotency).
+                    If all were sent before, nothing is sent and the earlier message id is returned.
 
         Returns:
             Response from WhatsApp API containing message_id and status
@@ -56,6 +73,13 @@ class WhatsAppClient:
         Raises:
             requests.HTTPError: If API request fails
         """
+        if idempotency_keys:
+            sent = SENT.lookup(idempotency_keys)
+            if all(key in sent for key in idempotency_keys):
+                SUPPRESSED_SENDS.inc()
+                log.info("Skipping already sent WhatsApp message", to=to_number, key=idempotency_keys[0])
+                return {"messages": [{"id": sent[idempotency_keys[0]]}]}
+
         headers = {
             'Authorization': f'Bearer {self.access_token}',
             'Content-Type': 'application/json'
@@ -102,12 +126,18 @@ class WhatsAppClient:
                 self.send_url,
                 headers=headers,
                 json=payload,
-                timeout=30
+                # The reply goes out even when the turn ran over its budget
+                timeout=bounded_timeout(30, floor=5)
             )
             response.raise_for_status()
-            return response.json()
+            result = response.json()
+            # Joined with the statuses webhook for delivery latency and retries
+            message_id = message_id_of(result)
+            DELIVERIES.record_send(message_id, to_number, message, buttons)
+            SENT.add(idempotency_keys, message_id)
+            return result
         except requests.exceptions.RequestException as e:
-            print(f"Error sending WhatsApp message: {e} - {payload}")
+            log.error("Error sending WhatsApp message", error=str(e), payload=payload)
             raise
 
     def mark_as_read(self, message_id: str) -> Dict:
@@ -142,9 +172,10 @@ class WhatsAppClient:
             return response.json()
         except requests.exceptions.RequestException as e:
             # Non-critical, just log and continue
-            print(f"Warning: Failed to mark message as read: {e}")
+            log.warning("Failed to mark message as read", error=str(e))
             return {}
 
+    @traced("whatsapp.get_media_url")
     def get_media_url(self, media_id: str) -> Optional[str]:
         """
         Get media download URL from media ID.
@@ -164,38 +195,35 @@ class WhatsAppClient:
             response = requests.get(
                 f'{self.base_url}/{media_id}',
                 headers=headers,
-                timeout=10
+                timeout=bounded_timeout(10)
             )
             response.raise_for_status()
             data = response.json()
             return data.get('url')
         except requests.exceptions.RequestException as e:
-            print(f"Error getting media URL: {e}")
+            log.error("Error getting media URL", error=str(e))
             return None
 
-    def download_media(self, media_url: str, output_path: str) -> bool:
+    @traced("whatsapp.download_media")
+    def download_media(self, media_url: str, output_path: str, max_bytes: int = MAX_BYTES) -> bool:
         """
-        Download media file from WhatsApp.
+        Download media file from WhatsApp, streamed to disk in chunks.
 
         Args:
             media_url: URL from get_media_url()
             output_path: Local file path to save media
+            max_bytes: Largest accepted file
 
         Returns:
-            True if successful, False otherwise
+            True if successful, False otherwise (also when the file exceeds max_bytes)
         """
         headers = {
             'Authorization': f'Bearer {self.access_token}',
         }
 
         try:
-            response = requests.get(media_url, headers=headers, timeout=30)
-            response.raise_for_status()
-
-            with open(output_path, 'wb') as f:
-                f.write(response.content)
-
+            download_to_file(media_url, output_path, headers=headers, timeout=bounded_timeout(30), max_bytes=max_bytes)
             return True
-        except (requests.exceptions.RequestException, IOError) as e:
-            print(f"Error downloading media: {e}")
+        except (requests.exceptions.RequestException, IOError, MediaTooLargeError) as e:
+            log.error("Error downloading media", error=str(e))
             return False
@@ -0,0 +1,47 @@
+"""
+Orchestrator -> agent wire format: compressed responses are decoded by the client itself.
+"""
+import gzip
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+
+from shared import agent_protocol
+from shared.agent_client import AgentClient, Endpoint
+
+
+@pytest.fixture
+def agent_url():
+    reply = gzip.compress(json.dumps({"message": "done", "status": "success"}).encode("utf-8"))
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            self.rfile.read(int(self.headers["Content-Length"]))
+            self.send_response(200)
+            self.send_header("Content-Type", agent_protocol.JSON)
+            self.send_header("Content-Encoding", agent_protocol.GZIP)
+            self.send_header("Content-Length", str(len(reply)))
+            self.end_headers()
+            self.wfile.write(reply)
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+
+
+def test_client_decompresses_the_response_body(agent_url):
+    client = AgentClient("test_agent", [], timeout=5)
+    assert client._call(Endpoint("test_agent", agent_url), {"message": "hi"}, timeout=5) == "done"
+
+
+def test_round_trip_with_compression():
+    payload = {"message": "x" * agent_protocol.COMPRESS_MIN_BYTES}
+    body, headers = agent_protocol.encode(payload, agent_protocol.JSON, agent_protocol.GZIP)
+    assert headers["Content-Encoding"] == agent_protocol.GZIP
+    assert agent_protocol.decode(body, headers["Content-Type"], headers["Content-Encoding"]) == payload
@@ -0,0 +1,126 @@
+"""
+Circuit breakers of agent replicas and their use in replica selection.
+"""
+import pytest
+
+from shared import agent_client
+from shared.agent_client import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, EndpointRegistry
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(agent_client.time, "monotonic", clock)
+    monkeypatch.setattr(agent_client, "BREAKER_WINDOW", 10)
+    monkeypatch.setattr(agent_client, "BREAKER_MIN_CALLS", 4)
+    monkeypatch.setattr(agent_client, "BREAKER_FAILURE_RATE", 0.5)
+    monkeypatch.setattr(agent_client, "BREAKER_SLOW_SECONDS", 5.0)
+    monkeypatch.setattr(agent_client, "BREAKER_OPEN_SECONDS", 10.0)
+    return clock
+
+
+def breaker(healthy: bool = True, probes: list = None) -> CircuitBreaker:
+    def probe() -> bool:
+        if probes is not None:
+            probes.append(True)
+        return healthy
+    return CircuitBreaker("agent", "http://replica", probe)
+
+
+def test_stays_closed_below_min_calls(clock):
+    b = breaker()
+    for _ in range(3):
+        b.record(0.1, failed=True)
+    assert b.state == CLOSED
+    assert b.allow()
+
+
+def test_opens_at_failure_rate(clock):
+    b = breaker()
+    b.record(0.1, failed=False)
+    b.record(0.1, failed=False)
+    b.record(0.1, failed=True)
+    assert b.state == CLOSED
+    b.record(0.1, failed=True)
+    assert b.state == OPEN
+    assert not b.allow()
+
+
+def test_slow_calls_count_as_failures(clock):
+    b = breaker()
+    for _ in range(4):
+        b.record(6.0, failed=False)
+    assert b.state == OPEN
+
+
+def test_open_breaker_fails_fast_until_cool_down(clock):
+    probes = []
+    b = breaker(probes=probes)
+    for _ in range(4):
+        b.record(0.1, failed=True)
+    clock.now += 9.9
+    assert not b.allow()
+    assert probes == []
+
+
+def test_healthy_probe_closes_and_resets_window(clock):
+    b = breaker(healthy=True)
+    for _ in range(4):
+        b.record(0.1, failed=True)
+    clock.now += 10.0
+    assert b.allow()
+    assert b.state == CLOSED
+    # Old failures are forgotten: one new failure does not reopen it
+    b.record(0.1, failed=True)
+    assert b.state == CLOSED
+
+
+def test_failed_probe_reopens_for_another_cool_down(clock):
+    probes = []
+    b = breaker(healthy=False, probes=probes)
+    for _ in range(4):
+        b.record(0.1, failed=True)
+    clock.now += 10.0
+    assert not b.allow()
+    assert b.state == OPEN
+    assert len(probes) == 1
+    clock.now += 5.0
+    assert not b.allow()
+    assert len(probes) == 1
+
+
+def test_only_one_caller_probes(clock):
+    b = breaker()
+    for _ in range(4):
+        b.record(0.1, failed=True)
+    clock.now += 10.0
+    # Another caller is probing
+    b._transition(HALF_OPEN)
+    assert not b.allow()
+
+
+def test_selection_skips_open_and_unhealthy_replicas(clock, monkeypatch):
+    registry = EndpointRegistry(check_interval=3600)
+    monkeypatch.setattr(registry, "_ensure_checker", lambda: None)
+    registry.register("agent", ["http://a", "http://b", "http://c"])
+    a, b, c = registry.endpoints("agent")
+    a.outstanding = 0
+    b.outstanding = 1
+    c.outstanding = 2
+    assert registry.select("agent") is a
+
+    for _ in range(4):
+        a.breaker.record(0.1, failed=True)
+    assert registry.select("agent") is b
+
+    b.healthy = False
+    assert registry.select("agent") is c
+    assert registry.select("agent", exclude=[c]) is None
@@ -0,0 +1,57 @@
+"""
+Waiting for uploaded media to become ACTIVE before it is described.
+"""
+import pytest
+
+from shared.deadline import DeadlineExceeded, deadline_scope
+from tools import describe_media
+
+
+class File:
+    def __init__(self, state, name="files/1"):
+        self.name = name
+        self.state = state
+        self.uri = f"https://gemini/{name}"
+        self.error = None
+
+
+class Files:
+    def __init__(self, states):
+        self.states = list(states)
+        self.gets = 0
+
+    def get(self, name):
+        self.gets += 1
+        return File(self.states.pop(0) if self.states else "PROCESSING", name)
+
+
+class Client:
+    def __init__(self, states):
+        self.files = Files(states)
+
+
+@pytest.fixture(autouse=True)
+def fast_polls(monkeypatch):
+    monkeypatch.setattr(describe_media, "POLL_INTERVAL", 0.01)
+
+
+def test_active_upload_is_not_polled():
+    client = Client([])
+    assert describe_media._wait_until_active(client, File("ACTIVE")).state == "ACTIVE"
+    assert client.files.gets == 0
+
+
+def test_polls_until_active():
+    client = Client(["PROCESSING", "ACTIVE"])
+    assert describe_media._wait_until_active(client, File("PROCESSING")).state == "ACTIVE"
+    assert client.files.gets == 2
+
+
+def test_failed_processing_raises():
+    with pytest.raises(RuntimeError):
+        describe_media._wait_until_active(Client(["FAILED"]), File("PROCESSING"))
+
+
+def test_gives_up_at_the_turn_deadline():
+    with deadline_scope(0.05), pytest.raises(DeadlineExceeded):
+        describe_media._wait_until_active(Client([]), File("PROCESSING"))
@@ -0,0 +1,186 @@
+"""
+Contract of the HistoryStore backends: versioned appends, conflicts, archiving and clearing.
+FirestoreHistory runs against the in-memory Firestore stand-in of the load-test harness.
+
+Run from the repository root: python -m pytest tests
+"""
+import pytest
+
+from benchmarks.fakes.memory_firestore import MemoryFirestore
+from shared.orchestrator.firestore_history import FirestoreHistory
+from shared.orchestrator.history_store import HistoryConflictError, HistoryRecord, InMemoryHistory
+from shared.orchestrator.sqlite_history import SQLiteHistory
+
+HOT = 4
+BATCH = 2
+
+
+@pytest.fixture(params=["memory", "sqlite", "firestore"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        return InMemoryHistory(hot_messages=HOT, archive_batch=BATCH)
+    if request.param == "firestore":
+        return FirestoreHistory(db=MemoryFirestore(), hot_messages=HOT, archive_batch=BATCH)
+    return SQLiteHistory(str(tmp_path / "history.db"), hot_messages=HOT, archive_batch=BATCH)
+
+
+def message(n: int) -> HistoryRecord:
+    return HistoryRecord(stored={"role": "user", "parts": [{"text": f"m{n}"}]})
+
+
+def texts(records) -> list:
+    return [record.stored["parts"][0]["text"] for record in records]
+
+
+def live_texts(store, user_id: str) -> list:
+    return texts(store.load_versioned(user_id).records.records)
+
+
+def test_new_user_has_empty_history(store):
+    history = store.load_versioned("alice")
+    assert history.version == 0
+    assert len(history.records) == 0
+    assert store.load_archive("alice") == []
+
+
+def test_appends_keep_order_and_bump_version(store):
+    assert store.append_messages("alice", [message(0), message(1)]) == 1
+    assert store.append_messages("alice", [message(2)]) == 2
+
+    history = store.load_versioned("alice")
+    assert history.version == 2
+    assert texts(history.records.records) == ["m0", "m1", "m2"]
+    assert history.records.payload() == [{"role": "user", "parts": [f"m{n}"]} for n in range(3)]
+
+
+def test_histories_are_per_user(store):
+    store.append_messages("alice", [message(0)])
+    store.append_messages("bob", [message(1)])
+    assert live_texts(store, "alice") == ["m0"]
+    assert live_texts(store, "bob") == ["m1"]
+    assert store.load_versioned("bob").version == 1
+
+
+def test_expected_version_matches(store):
+    store.append_messages("alice", [message(0)])
+    assert store.append_messages("alice", [message(1)], expected_version=1) == 2
+
+
+def test_stale_version_conflicts_and_appends_nothing(store):
+    store.append_messages("alice", [message(0)])
+    stale = store.load_versioned("alice").version
+    store.append_messages("alice", [message(1)])
+
+    with pytest.raises(HistoryConflictError):
+        store.append_messages("alice", [message(2)], expected_version=stale)
+    assert live_texts(store, "alice") == ["m0", "m1"]
+    assert store.load_versioned("alice").version == 2
+
+
+def test_first_append_expects_version_zero(store):
+    assert store.append_messages("alice", [message(0)], expected_version=0) == 1
+    with pytest.raises(HistoryConflictError):
+        store.append_messages("bob", [message(0)], expected_version=1)
+
+
+def test_archives_oldest_messages_past_the_hot_tail(store):
+    # HOT + BATCH - 1 messages stay live
+    store.append_messages("alice", [message(n) for n in range(HOT + BATCH - 1)])
+    assert store.load_archive("alice") == []
+
+    store.append_messages("alice", [message(HOT + BATCH - 1)])
+    assert live_texts(store, "alice") == [f"m{n}" for n in range(BATCH, HOT + BATCH)]
+    assert texts(store.load_archive("alice")) == [f"m{n}" for n in range(BATCH)]
+
+
+def test_archive_ranges_use_sequence_numbers(store):
+    for n in range(12):
+        store.append_messages("alice", [message(n)])
+    archived = texts(store.load_archive("alice"))
+    live = live_texts(store, "alice")
+    assert archived + live == [f"m{n}" for n in range(12)]
+    assert len(live) < HOT + BATCH
+
+    assert texts(store.load_archive("alice", start_seq=1, end_seq=5)) == ["m1", "m2", "m3", "m4"]
+    assert texts(store.load_archive("alice", start_seq=3)) == archived[3:]
+    assert texts(store.load_archive("alice", end_seq=2)) == ["m0", "m1"]
+    assert store.load_archive("alice", start_seq=100) == []
+
+
+def test_clear_archives_live_messages_and_bumps_version(store):
+    store.append_messages("alice", [message(0), message(1)])
+    version = store.load_versioned("alice").version
+
+    store.clear_history("alice")
+    history = store.load_versioned("alice")
+    assert len(history.records) == 0
+    assert history.version == version + 1
+    assert texts(store.load_archive("alice")) == ["m0", "m1"]
+
+
+def test_clear_conflicts_with_running_turn(store):
+    store.append_messages("alice", [message(0)])
+    version = store.load_versioned("alice").version
+    store.clear_history("alice")
+    with pytest.raises(HistoryConflictError):
+        store.append_messages("alice", [message(1)], expected_version=version)
+
+
+def test_sequence_numbers_continue_after_clear(store):
+    store.append_messages("alice", [message(0), message(1)])
+    store.clear_history("alice")
+    store.append_messages("alice", [message(2)])
+    store.clear_history("alice")
+
+    assert texts(store.load_archive("alice")) == ["m0", "m1", "m2"]
+    assert texts(store.load_archive("alice", start_seq=2)) == ["m2"]
+    assert live_texts(store, "alice") == []
+
+
+def test_clear_unknown_user(store):
+    store.clear_history("nobody")
+    assert store.load_archive("nobody") == []
+    assert len(store.load_versioned("nobody").records) == 0
+
+
+def test_firestore_user_document_does_not_grow_with_the_archive():
+    db = MemoryFirestore()
+    store = FirestoreHistory(db=db, hot_messages=HOT, archive_batch=BATCH)
+    for n in range(50):
+        store.append_messages("alice", [message(n)])
+
+    user_doc = db.collection("chat_history").document("alice").get().to_dict()
+    assert set(user_doc) == {"messages", "version", "archived_count", "updated_at"}
+    assert len(user_doc["messages"]) < HOT + BATCH
+    assert texts(store.load_archive("alice")) + live_texts(store, "alice") == [f"m{n}" for n in range(50)]
+
+
+def test_firestore_conflicting_write_leaves_no_archive_chunk():
+    db = MemoryFirestore()
+    store = FirestoreHistory(db=db, hot_messages=HOT, archive_batch=BATCH, max_write_attempts=1)
+    store.append_messages("alice", [message(n) for n in range(HOT + BATCH - 1)])
+
+    # Another writer commits between our read and our write
+    doc_ref = db.collection("chat_history").document("alice")
+    stale = doc_ref.get()
+
+    class StaleDocument:
+        def __getattr__(self, name):
+            return getattr(doc_ref, name)
+
+        def get(self):
+            doc_ref.update({"touched": True})
+            return stale
+
+    store._doc = lambda user_id: StaleDocument()
+    with pytest.raises(HistoryConflictError):
+        store.append_messages("alice", [message(HOT + BATCH - 1)])
+    assert list(db.collection("chat_history_archive").stream()) == []
+
+
+def test_sent_keys_round_trip(store):
+    assert store.sent_keys(["k1", "k2"]) == {}
+    store.record_sent(["k1", "k2"], "wamid.out")
+    store.record_sent(["k3"], None)
+    assert store.sent_keys(["k1", "k3", "k4"]) == {"k1": "wamid.out", "k3": None}
+    assert store.sent_keys([]) == {}
@@ -0,0 +1,101 @@
+"""
+Idempotency keys of outbound messages, and skipping sends another replica already made.
+"""
+import pytest
+
+from shared import idempotency
+from shared.orchestrator.history_store import InMemoryHistory
+from shared.orchestrator.sqlite_history import SQLiteHistory
+from shared.whatsapp_client import WhatsAppClient
+
+
+def turn_keys(inbound_id, sends):
+    with idempotency.inbound_scope(inbound_id):
+        return [idempotency.next_key(to, message) for to, message in sends]
+
+
+def test_no_key_outside_a_turn():
+    assert idempotency.next_key("491", "hello") is None
+
+
+def test_rerun_turn_produces_the_same_keys():
+    sends = [("491", "one"), ("491", "two"), ("492", "one")]
+    assert turn_keys("wamid.in", sends) == turn_keys("wamid.in", sends)
+    assert len(set(turn_keys("wamid.in", sends))) == 3
+
+
+def test_key_depends_on_the_message():
+    rephrased, = turn_keys("wamid.in", [("491", "Job done.")])
+    original, = turn_keys("wamid.in", [("491", "Job done!")])
+    assert rephrased != original
+    assert rephrased.startswith("wamid.in:491:")
+
+
+def test_repeated_message_gets_a_new_key():
+    first, second = turn_keys("wamid.in", [("491", "ok"), ("491", "ok")])
+    assert first != second
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        return InMemoryHistory()
+    return SQLiteHistory(str(tmp_path / "history.db"))
+
+
+def test_keys_are_shared_through_the_store(store):
+    # Two replicas with their own local index and one store
+    first, second = idempotency.SentMessages(store), idempotency.SentMessages(store)
+    first.add(["k1", "k2"], "wamid.out")
+    assert "k1" in second
+    assert second.lookup(["k1", "k2", "k3"]) == {"k1": "wamid.out", "k2": "wamid.out"}
+    assert "k3" not in second
+
+
+def test_keys_expire(tmp_path):
+    store = SQLiteHistory(str(tmp_path / "history.db"), sent_retention=0)
+    store.record_sent(["k1"], "wamid.out")
+    assert store.sent_keys(["k1"]) == {}
+
+
+def test_unreachable_store_does_not_block_sends():
+    class BrokenStore:
+        def sent_keys(self, keys):
+            raise ConnectionError("down")
+
+        def record_sent(self, keys, message_id):
+            raise ConnectionError("down")
+
+    sent = idempotency.SentMessages(BrokenStore())
+    assert "k1" not in sent
+    sent.add(["k1"], "wamid.out")
+    assert "k1" in sent
+
+
+class FakeResponse:
+    def __init__(self, message_id):
+        self.message_id = message_id
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return {"messages": [{"id": self.message_id}]}
+
+
+def test_client_skips_messages_another_replica_sent(monkeypatch):
+    store = InMemoryHistory()
+    posts = []
+    monkeypatch.setattr("shared.whatsapp_client.requests.post",
+                        lambda url, **kwargs: posts.append(kwargs["json"]) or FakeResponse(f"wamid.{len(posts)}"))
+    client = WhatsAppClient({"access_token": "token", "phone_number_id": "1", "api_base_url": "http://whatsapp"})
+
+    key, = turn_keys("wamid.in", [("491", "Invoice created")])
+    monkeypatch.setattr("shared.whatsapp_client.SENT", idempotency.SentMessages(store))
+    client.send("491", "Invoice created", idempotency_keys=[key])
+
+    # The same turn re-run on another replica
+    monkeypatch.setattr("shared.whatsapp_client.SENT", idempotency.SentMessages(store))
+    result = client.send("491", "Invoice created", idempotency_keys=[key])
+    assert len(posts) == 1
+    assert result == {"messages": [{"id": "wamid.1"}]}
@@ -0,0 +1,166 @@
+"""
+Outbound message coalescing and the communicate_with_human tool's send results.
+"""
+import threading
+
+import pytest
+
+from shared import idempotency
+from shared.outbound import SEPARATOR, OutboundBuffer, split_text
+
+
+class RecordingClient:
+    def __init__(self, fail: bool = False):
+        self.sent = []
+        self.fail = fail
+        self.sent_event = threading.Event()
+
+    def send(self, to_number, message, buttons=None, idempotency_keys=()):
+        if self.fail:
+            raise RuntimeError("send failed")
+        self.sent.append((to_number, message, buttons, list(idempotency_keys)))
+        self.sent_event.set()
+        return {"messages": [{"id": f"wamid.{len(self.sent)}"}]}
+
+
+@pytest.fixture(autouse=True)
+def sent_index(monkeypatch):
+    index = idempotency.SentMessages()
+    monkeypatch.setattr("shared.outbound.SENT", index)
+    return index
+
+
+def test_merges_text_to_the_same_recipient():
+    client = RecordingClient()
+    outbox = OutboundBuffer(client, window=60)
+    outbox.send("491", "one")
+    outbox.send("491", "two")
+    outbox.send("492", "other")
+    assert client.sent == []
+
+    outbox.flush("491")
+    assert client.sent == [("491", "one" + SEPARATOR + "two", None, [])]
+    outbox.flush_all()
+    assert client.sent[-1] == ("492", "other", None, [])
+
+
+def test_buttons_flush_pending_text_first():
+    client = RecordingClient()
+    outbox = OutboundBuffer(client, window=60)
+    buttons = [{"id": "yes", "title": "Yes"}]
+    outbox.send("491", "before")
+    outbox.send("491", "question?", buttons=buttons)
+    assert [(message, sent_buttons) for _, message, sent_buttons, _ in client.sent] == [
+        ("before", None), ("question?", buttons)
+    ]
+
+
+def test_overflow_starts_a_new_message():
+    client = RecordingClient()
+    outbox = OutboundBuffer(client, window=60, max_length=10)
+    outbox.send("491", "12345")
+    outbox.send("491", "67890")
+    assert client.sent == [("491", "12345", None, [])]
+    outbox.flush("491")
+    assert client.sent[-1] == ("491", "67890", None, [])
+
+
+def test_over_length_text_is_split_at_boundaries():
+    client = RecordingClient()
+    outbox = OutboundBuffer(client, window=60, max_length=20)
+    outbox.send("491", "First paragraph.\n\nOne sentence. Another one follows here.")
+    outbox.flush("491")
+    assert [message for _, message, _, _ in client.sent] == [
+        "First paragraph.", "One sentence.", "Another one follows", "here."
+    ]
+    assert all(len(message) <= 20 for _, message, _, _ in client.sent)
+
+
+def test_split_text_cuts_words_longer_than_the_limit():
+    assert split_text("x" * 25, 10) == ["x" * 10, "x" * 10, "x" * 5]
+    assert split_text("short", 10) == ["short"]
+
+
+def test_zero_window_sends_immediately():
+    client = RecordingClient()
+    OutboundBuffer(client, window=0).send("491", "now")
+    assert client.sent == [("491", "now", None, [])]
+
+
+def test_window_timer_sends():
+    client = RecordingClient()
+    outbox = OutboundBuffer(client, window=0.05)
+    outbox.send("491", "later")
+    assert client.sent_event.wait(timeout=5)
+    assert client.sent == [("491", "later", None, [])]
+
+
+def test_flush_raises_send_errors():
+    outbox = OutboundBuffer(RecordingClient(fail=True), window=60)
+    outbox.send("491", "lost?")
+    with pytest.raises(RuntimeError):
+        outbox.flush("491")
+
+
+def test_merged_message_carries_the_keys_of_its_parts():
+    client = RecordingClient()
+    outbox = OutboundBuffer(client, window=60)
+    with idempotency.inbound_scope("wamid.in"):
+        outbox.send("491", "one")
+        outbox.send("491", "two")
+    outbox.flush("491")
+    (_, _, _, keys), = client.sent
+    assert len(keys) == 2
+    assert all(key.startswith("wamid.in:491:") for key in keys)
+
+
+@pytest.fixture
+def tool(monkeypatch):
+    from tools import communicate_with_human as module
+
+    numbers = {"technician": ["491", "493"], "office": ["492"], "nobody": []}
+    monkeypatch.setattr(module, "get_whatsapp_numbers_for_role", lambda role: numbers[role])
+    client = RecordingClient()
+    outbox = OutboundBuffer(client, window=60)
+    monkeypatch.setattr(module, "get_outbox", lambda: outbox)
+    recorded = []
+    communicate = module.make_communicate_with_human_tool(lambda role, content: recorded.append(role))
+    return communicate, client, outbox, recorded
+
+
+def test_tool_sends_to_every_number_of_the_role(tool):
+    communicate, client, _, recorded = tool
+    result = communicate("technician", "Job done?")
+    assert result["status"] == "sent"
+    assert [to for to, _, _, _ in client.sent] == ["491", "493"]
+    assert recorded == ["technician"]
+
+
+def test_tool_queues_messages_to_the_turn_sender(tool):
+    from shared.turn_context import turn_context
+
+    communicate, client, outbox, _ = tool
+    with turn_context("office", get_history=list):
+        result = communicate("office", "Invoice created")
+        assert result["status"] == "queued"
+        assert client.sent == []
+        assert communicate("technician", "Please confirm")["status"] == "sent"
+    outbox.flush("492")
+    assert client.sent[-1][:2] == ("492", "Invoice created")
+
+
+def test_tool_sends_buttons_to_the_turn_sender_now(tool):
+    from shared.turn_context import turn_context
+
+    communicate, client, _, _ = tool
+    buttons = [{"id": "yes", "title": "Yes"}]
+    with turn_context("office", get_history=list):
+        assert communicate("office", "Create the invoice?", buttons=buttons)["status"] == "sent"
+    assert client.sent == [("492", "Create the invoice?", buttons, [])]
+
+
+def test_tool_reports_failed_sends(tool):
+    communicate, client, _, _ = tool
+    client.fail = True
+    assert communicate("office", "Hello")["status"] == "failed"
+    assert communicate("nobody", "Hello")["status"] == "failed"
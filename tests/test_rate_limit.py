@@ -0,0 +1,143 @@
+"""
+Gemini rate limiter: buckets, priority reserves and order, deadlines, and 429 retries.
+"""
+import threading
+import time
+
+import pytest
+
+from shared import rate_limit
+from shared.deadline import DeadlineExceeded, deadline_scope
+from shared.rate_limit import BACKGROUND, INTERACTIVE, OFFICE, GeminiRateLimiter, RateLimitedClient
+
+
+def test_unlimited_limiter_does_not_wait():
+    limiter = GeminiRateLimiter(0, 0)
+    assert limiter.acquire(10 ** 9, BACKGROUND) < 0.05
+
+
+def test_empty_bucket_waits_for_refill():
+    # 6000 per minute = one request every 10 ms
+    limiter = GeminiRateLimiter(requests_per_minute=6000, tokens_per_minute=0)
+    limiter._requests.level = 0
+    waited = limiter.acquire(1, INTERACTIVE)
+    assert 0.005 < waited < 1
+
+
+def test_lower_priorities_leave_a_reserve():
+    limiter = GeminiRateLimiter(requests_per_minute=0, tokens_per_minute=1000)
+    limiter._tokens.level = 200
+    # Background work must leave 30% of the bucket (300 tokens) and would wait half a minute
+    with deadline_scope(0.1), pytest.raises(DeadlineExceeded):
+        limiter.acquire(10, BACKGROUND)
+    assert limiter.acquire(10, INTERACTIVE) < 0.05
+
+
+def test_waiting_calls_are_served_by_priority():
+    limiter = GeminiRateLimiter(0, 0)
+    limiter.pause(0.2)
+    served = []
+
+    def call(priority):
+        limiter.acquire(1, priority)
+        served.append(priority)
+
+    threads = [threading.Thread(target=call, args=(priority,)) for priority in (BACKGROUND, OFFICE, INTERACTIVE)]
+    for thread in threads:
+        thread.start()
+        time.sleep(0.02)
+    for thread in threads:
+        thread.join(timeout=5)
+    assert served == [INTERACTIVE, OFFICE, BACKGROUND]
+
+
+def test_settle_charges_the_reported_usage():
+    limiter = GeminiRateLimiter(requests_per_minute=0, tokens_per_minute=1000)
+    limiter.acquire(100, INTERACTIVE)
+    limiter.settle(100, 400)
+    assert limiter._tokens.level == pytest.approx(600, abs=1)
+
+
+def test_priority_scope_overrides_the_client_default():
+    assert rate_limit.current_priority(BACKGROUND) == BACKGROUND
+    with rate_limit.priority_scope(INTERACTIVE):
+        assert rate_limit.current_priority(BACKGROUND) == INTERACTIVE
+    assert rate_limit.current_priority() == OFFICE
+
+
+class QuotaExhausted(Exception):
+    code = 429
+
+
+class Usage:
+    total_token_count = 100
+
+
+class Response:
+    usage_metadata = Usage()
+    text = "ok"
+
+
+class Models:
+    def __init__(self, failures):
+        self.failures = failures
+        self.calls = 0
+
+    def generate_content(self, model, contents, config=None):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise QuotaExhausted("429 RESOURCE_EXHAUSTED")
+        return Response()
+
+
+class Client:
+    def __init__(self, failures):
+        self.models = Models(failures)
+        self.files = "files"
+
+
+@pytest.fixture
+def fast_backoff(monkeypatch):
+    monkeypatch.setattr(rate_limit, "_backoff", lambda attempt: 0.01)
+
+
+def test_client_retries_after_429(fast_backoff):
+    inner = Client(failures=2)
+    client = RateLimitedClient(inner, agent="test", limiter=GeminiRateLimiter(0, 0))
+    assert client.models.generate_content(model="m", contents="hi").text == "ok"
+    assert inner.models.calls == 3
+    # Everything but models goes to the wrapped client
+    assert client.files == "files"
+
+
+def test_client_gives_up_after_max_retries(fast_backoff, monkeypatch):
+    monkeypatch.setattr(rate_limit, "MAX_RETRIES", 1)
+    inner = Client(failures=5)
+    client = RateLimitedClient(inner, agent="test", limiter=GeminiRateLimiter(0, 0))
+    with pytest.raises(QuotaExhausted):
+        client.models.generate_content(model="m", contents="hi")
+    assert inner.models.calls == 2
+
+
+def test_rejected_attempts_give_their_quota_back(fast_backoff):
+    limiter = GeminiRateLimiter(requests_per_minute=60, tokens_per_minute=1000)
+    client = RateLimitedClient(Client(failures=2), agent="test", limiter=limiter)
+    # Estimated at 300 tokens: "x" * 176 / 4 + 256
+    client.models.generate_content(model="m", contents="x" * 176)
+    # Only the successful attempt is charged, with the 100 tokens it used
+    assert limiter._tokens.level == pytest.approx(900, abs=1)
+    assert limiter._requests.level == pytest.approx(59, abs=0.1)
+
+
+def test_failed_calls_give_their_quota_back():
+    class Broken(Models):
+        def generate_content(self, model, contents, config=None):
+            raise ValueError("bad request")
+
+    inner = Client(failures=0)
+    inner.models = Broken(0)
+    limiter = GeminiRateLimiter(requests_per_minute=0, tokens_per_minute=1000)
+    client = RateLimitedClient(inner, agent="test", limiter=limiter)
+    with pytest.raises(ValueError):
+        client.models.generate_content(model="m", contents="hi")
+    assert limiter._tokens.level == pytest.approx(1000, abs=1)
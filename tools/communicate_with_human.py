@@ -2,15 +2,22 @@
 Tool for agents to send WhatsApp messages to technicians or office staff.
 This tool is intended to be used with an orchestrator that has WhatsApp capabilities.
 """
-from typing import List, Dict, Optional, Callable
-
-from google.genai.types import Content, Part
+from typing import TYPE_CHECKING, List, Dict, Optional, Callable
 
+from shared.log import get_logger
+from shared.tracing import traced
+from shared.turn_context import current_turn
 from shared.users import get_whatsapp_numbers_for_role
-from shared.whatsapp_client import WhatsAppClient
+from shared.outbound import get_outbox
+
+if TYPE_CHECKING:
+    from google.genai.types import Content
+
+log = get_logger("tools.communicate_with_human")
 
 
-def make_communicate_with_human_tool(message_callback: Callable[[str, Content], None] | None):
+def make_communicate_with_human_tool(message_callback: Callable[[str, "Content"], None] | None):
+    @traced("tool.communicate_with_human")
     def communicate_with_human(
             recipient_role: str,
             message: str,
@@ -30,35 +37,59 @@ def make_communicate_with_human_tool(message_callback: Callable[[str, Content],
         Returns:
             dict: Status of the message sending
         """
-        print(f"\n{'=' * 60}")
-        print(f"📱 WHATSAPP MESSAGE")
-        print(f"{'=' * 60}")
-        print(f"To: {recipient_role.upper()}")
-        print(f"Message: {message}")
-        if buttons:
-            print(f"Buttons: {[btn['title'] for btn in buttons]}")
-        print(f"{'=' * 60}\n")
-        whatsapp_client = WhatsAppClient()
+        log.info(
+            "📱 WhatsApp message",
+            to=recipient_role.upper(),
+            message=message,
+            buttons=[btn['title'] for btn in buttons] if buttons else None
+        )
+        # Text messages to the same number within a short window are merged into one
+        outbox = get_outbox()
 
         # Keep the chat history consistent
         if message_callback is not None:
-            print("save", recipient_role, message)
+            from google.genai.types import Content, Part
             message_callback(recipient_role, Content(role="model", parts=[Part(text=message)]))
 
-        try:
-            for phone_number in get_whatsapp_numbers_for_role(recipient_role):
-                whatsapp_client.send(phone_number, message, buttons=buttons)
-                return {
-                    "status": "sent",
-                    "recipient": recipient_role,
-                    "message": message,
-                    "note": "Message sent via WhatsApp. Response will arrive through the normal input loop."
-                }
-        except:
+        # Text messages to the sender of the current turn go out with its reply, when the turn ends;
+        # everyone else's, and interactive messages (sent unbuffered), are sent now, so the result
+        # reports whether they were delivered to WhatsApp
+        turn = current_turn()
+        deferred = turn is not None and turn.user_role == recipient_role and not buttons
+
+        phone_numbers = get_whatsapp_numbers_for_role(recipient_role)
+        failed = []
+        for phone_number in phone_numbers:
+            try:
+                outbox.send(phone_number, message, buttons=buttons)
+                if not deferred:
+                    outbox.flush(phone_number)
+            except Exception as e:
+                log.error("Failed to send WhatsApp message", to=phone_number, error=str(e))
+                failed.append(phone_number)
+
+        if not phone_numbers or failed:
             return {
                 "status": "failed",
                 "recipient": recipient_role,
                 "message": message,
-                "note": "Failed to send WhatsApp message. Check logs for details."
+                "note": (
+                    f"No WhatsApp number is registered for {recipient_role}." if not phone_numbers else
+                    f"Failed to send WhatsApp message to {len(failed)} of {len(phone_numbers)} numbers. "
+                    "Check logs for details."
+                )
+            }
+        if deferred:
+            return {
+                "status": "queued",
+                "recipient": recipient_role,
+                "message": message,
+                "note": "Message queued; it is sent via WhatsApp together with the reply to this message."
             }
+        return {
+            "status": "sent",
+            "recipient": recipient_role,
+            "message": message,
+            "note": "Message sent via WhatsApp. Response will arrive through the normal input loop."
+        }
     return communicate_with_human
\ No newline at end of file
@@ -0,0 +1,158 @@
+"""
+Image, document and video understanding using Gemini.
+
+Media is streamed to a temporary file with a size cap and hashed on the way
+(shared.media). Files up to MEDIA_INLINE_MAX_BYTES are sent inline with the
+request, larger ones through the Files API: the upload is polled until
+Gemini has processed it (ACTIVE), within the turn's remaining budget, and
+deleted again however the description ends. Descriptions are cached by
+SHA-256, so a photo forwarded twice is only analyzed once.
+"""
+
+import os
+import tempfile
+import time
+from pathlib import Path
+from typing import Optional
+
+from shared.deadline import DeadlineExceeded, bounded_timeout, http_options, remaining
+from shared.genai_client import create_genai_client
+from shared.idempotency import BoundedIndex
+from shared.log import get_logger
+from shared.media import MediaTooLargeError, download_to_file
+from shared.metrics import REGISTRY
+from shared.tracing import start_span
+
+log = get_logger("tools.describe_media")
+
+# Gemini accepts up to 20 MB of inline data per request; larger files are uploaded
+INLINE_MAX_BYTES = int(os.getenv("MEDIA_INLINE_MAX_BYTES", str(4 * 1024 * 1024)))
+
+MEDIA_DEDUP_HITS = REGISTRY.counter(
+    "media_dedup_hits_total",
+    "Media files recognized by their SHA-256 and answered from the description cache"
+)
+
+# How long an upload may stay PROCESSING without a turn deadline, and the poll interval
+PROCESSING_TIMEOUT = float(os.getenv("MEDIA_PROCESSING_TIMEOUT_SECONDS", "60"))
+POLL_INTERVAL = 0.5
+
+# SHA-256 of a media file -> its description
+_descriptions = BoundedIndex(int(os.getenv("MEDIA_CACHE_SIZE", "1000")))
+
+_PROMPT = (
+    "Describe this {kind} for a plumbing business. Name visible parts, models and damage, "
+    "and transcribe meter readings, serial numbers and any text exactly. Be concise."
+)
+
+
+class MediaRejectedError(Exception):
+    """The media cannot be processed (too large)."""
+
+
+def _wait_until_active(client, uploaded):
+    """
+    Poll an uploaded file until Gemini has processed it.
+
+    Raises:
+        DeadlineExceeded: Still processing when the turn's budget (or PROCESSING_TIMEOUT) ran out
+        RuntimeError: Processing failed
+    """
+    left = remaining()
+    give_up = time.monotonic() + (PROCESSING_TIMEOUT if left is None else min(left, PROCESSING_TIMEOUT))
+    file = uploaded
+    while True:
+        state = getattr(file.state, "name", file.state)
+        if state == "ACTIVE" or state is None:
+            return file
+        if state == "FAILED":
+            raise RuntimeError(f"Gemini could not process {file.name}: {file.error}")
+        wait = give_up - time.monotonic()
+        if wait <= 0:
+            raise DeadlineExceeded("media processing")
+        time.sleep(min(POLL_INTERVAL, wait))
+        file = client.files.get(name=file.name)
+
+
+def describe_media_from_url(media_url: str, access_token: str, kind: str,
+                            mime_type: Optional[str] = None) -> Optional[str]:
+    """
+    Download a media file from URL and describe it.
+
+    Args:
+        media_url: URL to download the media file
+        access_token: Authorization token for downloading
+        kind: WhatsApp message type ("image", "document", "video" or "sticker")
+        mime_type: MIME type from the webhook; the download's Content-Type is used otherwise
+
+    Returns:
+        Description or None if failed
+
+    Raises:
+        MediaRejectedError: The file exceeds MEDIA_MAX_BYTES
+    """
+    with tempfile.TemporaryDirectory() as tmpdir:
+        temp_path = Path(tmpdir) / "media"
+
+        # Download media
+        try:
+            headers = {'Authorization': f'Bearer {access_token}'}
+            media = download_to_file(media_url, str(temp_path), headers=headers, timeout=bounded_timeout(30))
+            log.debug("Downloaded media", kind=kind, size=media.size, sha256=media.sha256[:12])
+        except MediaTooLargeError as e:
+            log.warning("Media too large", kind=kind, error=str(e))
+            raise MediaRejectedError(str(e)) from e
+        except Exception as e:
+            log.error("❌ Download failed", error=str(e))
+            return None
+
+        cached = _descriptions.get(media.sha256)
+        if cached is not None:
+            MEDIA_DEDUP_HITS.inc()
+            log.info("✓ Media already described", kind=kind, sha256=media.sha256[:12])
+            return cached
+
+        mime_type = mime_type or media.mime_type or "application/octet-stream"
+
+        # Describe using Gemini
+        try:
+            from google.genai.types import GenerateContentConfig, Part
+
+            client = create_genai_client("media")
+
+            uploaded = None
+            try:
+                if media.size <= INLINE_MAX_BYTES:
+                    part = Part.from_bytes(data=temp_path.read_bytes(), mime_type=mime_type)
+                else:
+                    uploaded = client.files.upload(file=str(temp_path), config={"mime_type": mime_type})
+                    log.debug("Uploaded to Gemini", size=media.size)
+                    # Videos and large PDFs are PROCESSING for a while and cannot be referenced before
+                    with start_span("describe_media.processing", kind=kind, size=media.size):
+                        active = _wait_until_active(client, uploaded)
+                    part = Part.from_uri(file_uri=active.uri, mime_type=mime_type)
+
+                with start_span("describe_media.llm", kind=kind, size=media.size):
+                    response = client.models.generate_content(
+                        model="gemini-2.5-flash",
+                        contents=[_PROMPT.format(kind=kind), part],
+                        config=GenerateContentConfig(http_options=http_options())
+                    )
+            finally:
+                # Cleanup, also when processing or the description failed
+                if uploaded is not None:
+                    try:
+                        client.files.delete(name=uploaded.name)
+                    except Exception as e:
+                        log.warning("Failed to delete uploaded media", name=uploaded.name, error=str(e))
+
+            description = (response.text or "").strip()
+            log.info("✓ Described media", kind=kind, chars=len(description))
+
+            if description:
+                _descriptions.add(media.sha256, description)
+            return description
+
+        except Exception as e:
+            log.error("❌ Media description failed", error=str(e))
+            return None
@@ -5,6 +5,18 @@ Used by the orchestrator to route technician messages.
 from typing import Callable, List, Dict
 import requests
 
+from shared.agent_client import AgentCallError, AgentClient, AgentUnavailableError
+from shared.deadline import bounded_timeout, expired
+from shared.log import get_logger
+from shared.tracing import traced
+
+log = get_logger("tools.field_service_agent")
+
+# Lookups only: safe to hedge across replicas
+FIELD_SERVICE_AGENT = AgentClient.from_env(
+    "field_service_agent", default_url="http://localhost:8001", timeout=30, hedge=True
+)
+
 
 def make_field_service_agent_tool(get_history: Callable[[], List[Dict]]):
     """
@@ -17,6 +29,7 @@ def make_field_service_agent_tool(get_history: Callable[[], List[Dict]]):
         Function that calls the field service agent with injected history
     """
 
+    @traced("tool.field_service_agent")
     def field_service_agent(message: str) -> str:
         """
         Call the Field Service Agent to handle technician messages.
@@ -38,47 +51,43 @@ def make_field_service_agent_tool(get_history: Callable[[], List[Dict]]):
         Returns:
             str: Plain text response from the agent
         """
-        url = "http://localhost:8001/process"
-
         payload = {
             "message": message,
             "context": get_history()
         }
 
-        print(f"[TOOL] Calling field_service_agent: {message[:50]}...")
+        log.debug("Calling field_service_agent", message=message)
 
+        if expired():
+            error_msg = "Field service agent not called: the turn's time budget is spent"
+            log.warning(error_msg)
+            return error_msg
+
+        timeout = bounded_timeout(FIELD_SERVICE_AGENT.timeout)
         try:
-            response = requests.post(url, json=payload, timeout=30)
-
-            if response.status_code == 200:
-                # The agent server wraps text responses in {"message": "...", "status": "success"}
-                response_data = response.json()
-                # Extract the message field
-                if isinstance(response_data, dict) and "message" in response_data:
-                    response_text = response_data["message"]
-                elif isinstance(response_data, str):
-                    response_text = response_data
-                else:
-                    response_text = str(response_data)
-
-                print(f"[TOOL] Field service agent responded: {response_text[:100]}...")
-                return response_text
-            else:
-                error_msg = f"Field service agent failed to respond (HTTP {response.status_code})"
-                print(f"[TOOL] Warning: {error_msg}")
-                return error_msg
+            response_text = FIELD_SERVICE_AGENT.process(payload)
+            log.debug("Field service agent responded", response=response_text)
+            return response_text
 
+        except AgentUnavailableError:
+            error_msg = "Field service agent is unavailable right now (too many recent failures), try again shortly"
+            log.warning(error_msg)
+            return error_msg
+        except AgentCallError as e:
+            error_msg = f"Field service agent failed to respond (HTTP {e.status_code})"
+            log.warning(error_msg)
+            return error_msg
         except requests.ConnectionError:
             error_msg = "Cannot connect to field service agent (is it running on port 8001?)"
-            print(f"[TOOL] Warning: {error_msg}")
+            log.warning(error_msg)
             return error_msg
         except requests.Timeout:
-            error_msg = "Field service agent timeout (exceeded 30 seconds)"
-            print(f"[TOOL] Warning: {error_msg}")
+            error_msg = f"Field service agent timeout (exceeded {timeout:.1f} seconds)"
+            log.warning(error_msg)
             return error_msg
         except Exception as e:
             error_msg = f"Error calling field service agent: {str(e)}"
-            print(f"[TOOL] Warning: {error_msg}")
+            log.warning(error_msg)
             return error_msg
 
     return field_service_agent
@@ -1,3 +1,7 @@
+from shared.tracing import traced
+
+
+@traced("tool.find_customer")
 def find_customer(customer_name: str, customer_address: str) -> dict:
     """
     Finds customer information based on the provided name and address.
@@ -8,8 +8,19 @@ import requests
 import sys
 import os
 
+from shared.agent_client import AgentCallError, AgentClient, AgentUnavailableError
+from shared.deadline import bounded_timeout, expired
+from shared.log import get_logger
+from shared.tracing import traced
+
+log = get_logger("tools.office_agent")
+
+# Billing has side effects: never hedged
+OFFICE_AGENT = AgentClient.from_env("office_agent", default_url="http://localhost:8002", timeout=60, hedge=False)
+
 
 def make_office_agent_tool(get_history: Callable[[], List[Dict]]):
+    @traced("tool.office_agent")
     def office_agent(message: str = None, job_data: str = None) -> str:
         """
         Call the Office Agent to handle billing, compliance, and administrative tasks.
@@ -34,9 +45,6 @@ def make_office_agent_tool(get_history: Callable[[], List[Dict]]):
             str: Plain text response from the agent
         """
 
-        # Always use the /process endpoint
-        url = "http://localhost:8002/process"
-
         # Build context array, including job_data if present
         payload = {
             "message": message,
@@ -44,36 +52,35 @@ def make_office_agent_tool(get_history: Callable[[], List[Dict]]):
             "context": get_history()
         }
 
-        try:
-            response = requests.post(url, json=payload, timeout=60)
-
-            if response.status_code == 200:
-                response_data = response.json()
-                # Extract the message field
-                if isinstance(response_data, dict) and "message" in response_data:
-                    response_text = response_data["message"]
-                elif isinstance(response_data, str):
-                    response_text = response_data
-                else:
-                    response_text = str(response_data)
+        if expired():
+            error_msg = "Office agent not called: the turn's time budget is spent"
+            log.warning(error_msg)
+            return error_msg
 
-                print(f"[TOOL] Office agent responded: {response_text[:100]}...")
-                return response_text
-            else:
-                error_msg = f"Office agent failed to respond (HTTP {response.status_code})"
-                print(f"[TOOL] Warning: {error_msg}")
-                return error_msg
+        timeout = bounded_timeout(OFFICE_AGENT.timeout)
+        try:
+            response_text = OFFICE_AGENT.process(payload)
+            log.debug("Office agent responded", response=response_text)
+            return response_text
 
+        except AgentUnavailableError:
+            error_msg = "Office agent is unavailable right now (too many recent failures), try again shortly"
+            log.warning(error_msg)
+            return error_msg
+        except AgentCallError as e:
+            error_msg = f"Office agent failed to respond (HTTP {e.status_code})"
+            log.warning(error_msg)
+            return error_msg
         except requests.ConnectionError:
             error_msg = "Cannot connect to office agent (is it running on port 8002?)"
-            print(f"[TOOL] Warning: {error_msg}")
+            log.warning(error_msg)
             return error_msg
         except requests.Timeout:
-            error_msg = "Office agent timeout (exceeded 30 seconds)"
-            print(f"[TOOL] Warning: {error_msg}")
+            error_msg = f"Office agent timeout (exceeded {timeout:.1f} seconds)"
+            log.warning(error_msg)
             return error_msg
         except Exception as e:
             error_msg = f"Error calling office agent: {str(e)}"
-            print(f"[TOOL] Warning: {error_msg}")
+            log.warning(error_msg)
             return error_msg
     return office_agent
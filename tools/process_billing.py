@@ -2,7 +2,10 @@ import json
 import random
 from typing import List, Dict
 
+from shared.tracing import traced
 
+
+@traced("tool.process_billing")
 def process_billing(title: str, customer: str, items: list[str]):
     """Process billing a job. Will also automatically return price information
 
@@ -2,14 +2,17 @@
 Audio transcription using Gemini.
 """
 
-import os
 import tempfile
-import requests
 from pathlib import Path
 from typing import Optional
 
-from google import genai
-from google.genai.types import GenerateContentConfig, Part
+from shared.deadline import bounded_timeout, http_options
+from shared.genai_client import create_genai_client
+from shared.log import get_logger
+from shared.media import download_to_file
+from shared.tracing import start_span
+
+log = get_logger("tools.transcribe_audio")
 
 
 def transcribe_audio_from_url(audio_url: str, access_token: str) -> Optional[str]:
@@ -23,7 +26,7 @@ def transcribe_audio_from_url(audio_url: str, access_token: str) -> Optional[str
     Returns:
         Transcribed text or None if failed
     """
-    print(f"[TRANSCRIBE] Downloading audio from URL")
+    log.debug("Downloading audio from URL")
 
     with tempfile.TemporaryDirectory() as tmpdir:
         temp_path = Path(tmpdir) / "audio.ogg"
@@ -31,39 +34,38 @@ def transcribe_audio_from_url(audio_url: str, access_token: str) -> Optional[str
         # Download audio
         try:
             headers = {'Authorization': f'Bearer {access_token}'}
-            response = requests.get(audio_url, headers=headers, timeout=30)
-            response.raise_for_status()
-
-            with open(temp_path, 'wb') as f:
-                f.write(response.content)
-
-            print(f"[TRANSCRIBE] Downloaded to {temp_path}")
+            audio = download_to_file(audio_url, str(temp_path), headers=headers, timeout=bounded_timeout(30))
+            log.debug("Downloaded audio", path=str(temp_path), size=audio.size)
         except Exception as e:
-            print(f"[TRANSCRIBE] ❌ Download failed: {e}")
+            log.error("❌ Download failed", error=str(e))
             return None
 
         # Transcribe using Gemini
         try:
-            client = genai.Client(api_key=os.environ.get("GEMINI_API_KEY"))
+            from google.genai.types import GenerateContentConfig, Part
+
+            client = create_genai_client("transcription")
 
             # Upload file
             audio_file = client.files.upload(file=str(temp_path))
-            print(f"[TRANSCRIBE] Uploaded to Gemini")
+            log.debug("Uploaded to Gemini")
 
             # Generate transcription
-            response = client.models.generate_content(
-                model="gemini-2.5-flash",
-                contents=[
-                    "Transcribe this audio. Output only the spoken text without any changes.",
-                    Part.from_uri(file_uri=audio_file.uri, mime_type="audio/ogg")
-                ],
-                config=GenerateContentConfig(
-                    system_instruction="You are speech to text. Recognize the spoken language and output it without any changes"
+            with start_span("transcribe.llm"):
+                response = client.models.generate_content(
+                    model="gemini-2.5-flash",
+                    contents=[
+                        "Transcribe this audio. Output only the spoken text without any changes.",
+                        Part.from_uri(file_uri=audio_file.uri, mime_type="audio/ogg")
+                    ],
+                    config=GenerateContentConfig(
+                        system_instruction="You are speech to text. Recognize the spoken language and output it without any changes",
+                        http_options=http_options()
+                    )
                 )
-            )
 
             transcribed_text = (response.text or "").strip()
-            print(f"[TRANSCRIBE] ✓ Done")
+            log.info("✓ Transcribed audio", chars=len(transcribed_text))
 
             # Cleanup
             client.files.delete(name=audio_file.name)
@@ -71,5 +73,5 @@ def transcribe_audio_from_url(audio_url: str, access_token: str) -> Optional[str
             return transcribed_text
 
         except Exception as e:
-            print(f"[TRANSCRIBE] ❌ Transcription failed: {e}")
+            log.error("❌ Transcription failed", error=str(e))
             return None